@@ -0,0 +1,265 @@
+import os
+from contextlib import asynccontextmanager
+
+from a2wsgi import WSGIMiddleware
+from fastapi import FastAPI, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
+
+import main
+import metrics
+from gemini_client import AsyncGeminiClient, BlockedPromptError, GeminiError, create_gemini_client
+from image_ops import downscale_for_upload, stream_sha256
+from responses import ASGICompression
+from sessions import SessionError
+from uploads import ASGIUploadLimit
+from weather_client import AsyncWeatherClient, WeatherError
+
+# --- Async serving mode ---
+# Run with: uvicorn asgi:app --port 5000
+# The endpoints that mostly wait on Gemini and AccuWeather are served natively on the
+# event loop, so an in-flight request costs a coroutine rather than a thread. Every
+# other route (PDF, image and translation work) falls through to the Flask app in
+# main.py, which a2wsgi runs on a thread pool, keeping CPU-bound work off the loop.
+# Sessions, caches and the document index are shared with main.py.
+
+ASGI_WSGI_WORKERS = int(os.getenv('ASGI_WSGI_WORKERS', '32')) # Threads serving the mounted Flask routes
+
+gemini = create_gemini_client(main.GEMINI_API_KEY, client_class=AsyncGeminiClient)
+weather_client = AsyncWeatherClient()
+metrics.register_gemini_client('asgi', gemini)
+metrics.register_cache('weather-async', weather_client.stats)
+
+@asynccontextmanager
+async def lifespan(app):
+    yield
+    await weather_client.aclose()
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(CORSMiddleware, allow_origins=["http://localhost:8080"], allow_methods=["*"], allow_headers=["*"])
+app.add_middleware(ASGIUploadLimit) # Same body size limits as the Flask routes (see uploads.py)
+app.add_middleware(ASGICompression) # Same response compression as the Flask routes (see responses.py)
+metrics.instrument_asgi(app)
+
+def _error(message, status_code):
+    return JSONResponse({'error': message}, status_code=status_code)
+
+class _ClosingStreamingResponse(StreamingResponse):
+    # Calls on_close however the response ends. Starlette never starts the body iterator
+    # if the client is gone first, and then the generator's own finally never runs.
+    def __init__(self, content, on_close, **kwargs):
+        super().__init__(content, **kwargs)
+        self._on_close = on_close
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self._on_close()
+
+async def _json_body(request):
+    try:
+        data = await request.json()
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+def _prepare_chat(data, query):
+    # Session lookups and document retrieval may touch SQLite/disk, so this runs in a thread
+    try:
+        session_id, history, is_new_session = main._resolve_chat_history(data)
+    except SessionError as e:
+        return None, None, False, None, (e.message, e.status_code)
+    prompt, error = main._resolve_prompt(data, query)
+    return session_id, history, is_new_session, prompt, error
+
+@app.post('/search')
+async def search(request: Request):
+    if not gemini.available:
+        return _error("AI Service not configured or configuration failed.", 503)
+    data = await _json_body(request)
+    if data is None:
+        return _error("Request body must be a JSON object", 400)
+    query = data.get('query', '')
+    if not query:
+        return _error("Query cannot be empty", 400)
+
+    try:
+        session_id, history, is_new_session, prompt, error = await run_in_threadpool(_prepare_chat, data, query)
+        if error:
+            return _error(*error)
+
+        use_cache = main._response_cache_enabled('search', data.get('cache', True))
+        cache_key = main.make_cache_key(main.GEMINI_MODEL, {'history': history, 'query': prompt})
+        answer = main.response_cache.get('search', cache_key) if use_cache else None
+        if answer is None:
+            response = await gemini.send_message('search', history, prompt)
+            answer = response.text
+            if use_cache:
+                main.response_cache.set('search', cache_key, answer)
+
+        await run_in_threadpool(main._save_chat_turn, session_id, history, is_new_session, query, answer)
+        result = {"response": answer}
+        if session_id:
+            result["session_id"] = session_id
+        return main._add_partial_documents(result, data)
+    except GeminiError as e:
+        print(f"Gemini unavailable in /search: {e}")
+        return _error(e.message, e.status_code)
+    except Exception as e:
+        print(f"Error during Gemini API call in /search: {e}")
+        return _error(f"An error occurred while contacting the AI service: {str(e)}", 500)
+
+# Same NDJSON frames as the Flask /search/stream
+@app.post('/search/stream')
+async def search_stream(request: Request):
+    if not gemini.available:
+        return _error("AI Service not configured or configuration failed.", 503)
+    data = await _json_body(request) or {}
+    query = data.get('query', '')
+    if not query:
+        return _error("Query cannot be empty", 400)
+
+    session_id, history, is_new_session, prompt, error = await run_in_threadpool(_prepare_chat, data, query)
+    if error:
+        return _error(*error)
+
+    try:
+        response = await gemini.stream_message('search', history, prompt)
+    except GeminiError as e:
+        print(f"Gemini unavailable in /search/stream: {e}")
+        return _error(e.message, e.status_code)
+    except Exception as e:
+        print(f"Error during Gemini API call in /search/stream: {e}")
+        return _error(f"An error occurred while contacting the AI service: {str(e)}", 500)
+
+    async def generate():
+        finish_reason = None
+        usage = None
+        answer_parts = []
+        try:
+            async for chunk in response:
+                try:
+                    text = chunk.text
+                except ValueError:
+                    # Chunks without text parts (e.g. the final safety/usage frame)
+                    text = ''
+                if text:
+                    answer_parts.append(text)
+                    yield main._ndjson_line({"type": "chunk", "text": text})
+                if chunk.candidates:
+                    finish_reason = chunk.candidates[0].finish_reason or finish_reason
+                usage = getattr(chunk, 'usage_metadata', None) or usage
+
+            await run_in_threadpool(main._save_chat_turn, session_id, history, is_new_session, query, "".join(answer_parts))
+            done_frame = {
+                "type": "done",
+                "finishReason": main._finish_reason_name(finish_reason),
+                "usage": main._usage_to_dict(usage),
+            }
+            if session_id:
+                done_frame["session_id"] = session_id
+            yield main._ndjson_line(main._add_partial_documents(done_frame, data))
+        except Exception as e:
+            print(f"Error while streaming Gemini response in /search/stream: {e}")
+            yield main._ndjson_line({"type": "error", "error": f"An error occurred while contacting the AI service: {str(e)}"})
+        finally:
+            response.close()
+
+    # Frees the Gemini concurrency slot even if the client disconnects before the body is sent
+    return _ClosingStreamingResponse(
+        generate(),
+        on_close=response.close,
+        media_type='application/x-ndjson',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.post('/search-image')
+async def search_image(request: Request):
+    if not gemini.available:
+        return _error('AI Service not configured', 503)
+    form = await request.form()
+    image_file = form.get('image')
+    query = form.get('query')
+    if image_file is None or isinstance(image_file, str) or query is None:
+        return _error('Missing image file or query', 400)
+
+    try:
+        # The upload is spooled to disk once it is large; hash and decode it from there
+        use_cache = main._response_cache_enabled('search-image', form.get('cache', True))
+        cache_key = main._image_description_cache_key(await run_in_threadpool(stream_sha256, image_file.file))
+        keywords = main.response_cache.get('search-image', cache_key) if use_cache else None
+        if keywords is None:
+            # Decoding and resizing are CPU-bound
+            upload_bytes, upload_mimetype = await run_in_threadpool(downscale_for_upload, image_file.file, image_file.content_type)
+            image_part = {"mime_type": upload_mimetype, "data": upload_bytes}
+            response = await gemini.generate_content('search-image', [main.SEARCH_IMAGE_PROMPT, image_part], safety_settings=main.SEARCH_IMAGE_SAFETY_SETTINGS)
+            keywords, error = main._image_keywords(response)
+            if error:
+                return _error(*error)
+            if use_cache:
+                main.response_cache.set('search-image', cache_key, keywords)
+        return {'searchUrl': main._image_search_url(query, keywords)}
+    except BlockedPromptError as bpe:
+        print(f"Backend Error: Prompt blocked during image search - {bpe}")
+        return _error(f'Image search blocked by safety filters: {bpe}', 400)
+    except GeminiError as e:
+        print(f"Backend Error: Gemini unavailable for /search-image - {e}")
+        return _error(e.message, e.status_code)
+    except Exception as e:
+        print(f"Backend Error: Unexpected error in /search-image: {e}")
+        return _error('An unexpected error occurred on the server during image search.', 500)
+    finally:
+        await form.close()
+
+@app.post('/generate-email')
+async def generate_email(request: Request):
+    if not gemini.available:
+        return _error("AI Service not configured.", 503)
+    data = await _json_body(request)
+    if data is None:
+        return _error("Request body must be a JSON object", 400)
+
+    try:
+        prompt, error = main._build_email_prompt(data)
+        if error:
+            return _error(*error)
+        use_cache = main._response_cache_enabled('generate-email', data.get('cache', True))
+        cache_key = main._email_cache_key(prompt)
+        cached_email = main.response_cache.get('generate-email', cache_key) if use_cache else None
+        if cached_email is not None:
+            return cached_email
+
+        response = await gemini.generate_content('generate-email', prompt, main.EMAIL_GENERATION_CONFIG)
+        email_content, error = main._parse_email_response(response)
+        if error:
+            return _error(*error)
+        if use_cache:
+            main.response_cache.set('generate-email', cache_key, email_content)
+        return email_content
+    except GeminiError as e:
+        print(f"Gemini unavailable for email generation: {e}")
+        return _error(e.message, e.status_code)
+    except Exception as e:
+        print(f"Error during email generation: {e}")
+        return _error(f"An unexpected error occurred on the server during email generation: {str(e)}", 500)
+
+@app.get('/get-weather')
+async def get_weather(location: str = None):
+    api_key = os.getenv('ACCUWEATHER_API_KEY')
+    if not location:
+        return _error('Location query parameter is required', 400)
+    if not api_key:
+        return _error('AccuWeather API key not configured', 500)
+    try:
+        return await weather_client.get_weather(location, api_key)
+    except WeatherError as e:
+        return _error(e.message, e.status_code)
+
+# Everything else is served by the Flask app
+app.mount('/', WSGIMiddleware(main.app, workers=ASGI_WSGI_WORKERS))
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run(app, port=5000)
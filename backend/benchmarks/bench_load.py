@@ -0,0 +1,357 @@
+"""Offline load test for every route in main.py.
+
+Starts local stand-ins for AccuWeather and Translate (fake_upstreams.py), runs the
+backend against them with the fake Gemini backend, and drives each scenario with a
+fixed number of concurrent clients. For every scenario it reports:
+
+  - reqs / errors  requests measured, and those with an unexpected status or a transport error
+  - req/s          completed requests per second of wall time
+  - p50/p95/p99    latency percentiles in ms (full response, including streamed bodies)
+
+Upstream latency, jitter and error rates are configurable. By default every request
+is unique and the backend's caches are disabled, so the numbers show the real work;
+--warm repeats identical requests with caches on instead. Heavy scenarios (large
+PDFs and images, batches) run a tenth of --requests (at least 10).
+
+Results can be saved and compared, e.g. before and after a change:
+
+Usage (from backend/):
+    python benchmarks/bench_load.py
+    python benchmarks/bench_load.py --server asgi --concurrency 64 --requests 500
+    python benchmarks/bench_load.py --only search,get-weather --gemini-latency-ms 800 --error-rate 0.02
+    python benchmarks/bench_load.py --save before.json
+    python benchmarks/bench_load.py --baseline before.json
+    python benchmarks/bench_load.py --url http://127.0.0.1:5000   # a server you started yourself
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import socket
+import asyncio
+import argparse
+import tempfile
+import subprocess
+
+import httpx
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from fake_upstreams import FakeUpstreams, UpstreamSettings # noqa: E402
+from fixtures import ensure_fixtures # noqa: E402
+
+PARAGRAPH = (
+    "Mitra keeps the conversation gentle and helpful. It answers questions, reads documents, "
+    "writes emails and checks the weather. Every sentence here exists to give the translator "
+    "something to chew on, split at sentence boundaries like real user text. "
+)
+
+class Scenario:
+    def __init__(self, name, method, path, build, expect=200, heavy=False, setup=None):
+        self.name = name
+        self.method = method
+        self.path = path # str, or a callable taking the request number
+        self.build = build # request number -> httpx request kwargs
+        self.expect = expect
+        self.heavy = heavy
+        self.setup = setup # async (client, numbers) -> None, run before the timed requests
+
+    def url(self, n):
+        return self.path(n) if callable(self.path) else self.path
+
+MIMETYPES = {
+    '.pdf': 'application/pdf',
+    '.docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+    '.png': 'image/png',
+    '.jpg': 'image/jpeg',
+}
+
+def _file(fixtures, name, field):
+    return (field, (name, fixtures[name], MIMETYPES[os.path.splitext(name)[1]]))
+
+def build_scenarios(fixtures, run_id, warm):
+    """Returns the scenarios, in the order they run. fixtures maps file names to bytes."""
+    cache = 'true' if warm else 'false'
+
+    def tag(n):
+        # Unique per request unless --warm, so caches and the translation memory can't answer
+        return f"{run_id}" if warm else f"{run_id}-{n}"
+
+    def chat(n):
+        return {'json': {'query': f"How can I measure the throughput of a web server? ({tag(n)})", 'cache': warm}}
+
+    session_ids = {} # Request number -> session id minted by the server
+
+    async def create_sessions(client, numbers):
+        for n in numbers:
+            response = await client.post('/search', json={'query': f"Remember {n}", 'new_session': True})
+            session_ids[n] = response.json().get('session_id', 'missing')
+
+    def image_form(name, **fields):
+        return lambda n: {'files': [_file(fixtures, name, 'image')], 'data': dict(fields, cache=cache)}
+
+    def doc_form(name):
+        return lambda n: {'files': [_file(fixtures, name, 'file')]}
+
+    long_text = lambda n: "\n\n".join(f"Part {p} ({tag(n)}). " + PARAGRAPH * 12 for p in range(6))
+
+    return [
+        Scenario('search', 'POST', '/search', chat),
+        Scenario('search/stream', 'POST', '/search/stream', chat),
+        Scenario('sessions (delete)', 'DELETE', lambda n: f"/sessions/{session_ids.get(n, 'missing')}", lambda n: {}, setup=create_sessions),
+        Scenario('cache/stats', 'GET', '/cache/stats', lambda n: {}),
+        Scenario('metrics', 'GET', '/metrics', lambda n: {}),
+        Scenario('search-image', 'POST', '/search-image', lambda n: {
+            'files': [_file(fixtures, 'photo-medium.jpg', 'image')],
+            'data': {'query': f"where to buy this ({tag(n)})", 'cache': cache},
+        }),
+        Scenario('generate-email', 'POST', '/generate-email', lambda n: {'json': {
+            'purpose': f"Schedule the quarterly performance review ({tag(n)})", 'tone': 'Formal', 'cache': warm,
+        }}),
+        Scenario('generate-email/batch', 'POST', '/generate-email/batch', lambda n: {'json': {
+            'template': {'purpose': f"Invite to the product launch ({tag(n)})", 'sender_name': 'Mitra'},
+            'items': [{'id': k, 'recipient_type': f"customer {k}"} for k in range(10)],
+            'tones': ['Formal', 'Friendly'], 'cache': warm,
+        }}, heavy=True),
+        Scenario('get-weather', 'GET', '/get-weather', lambda n: {'params': {'location': f"Bench City {tag(n)}"}}),
+        Scenario('translate', 'POST', '/translate', lambda n: {'json': {
+            'text': f"Good morning, how are you today? ({tag(n)})", 'target_language': 'hi',
+        }}),
+        Scenario('translate/batch', 'POST', '/translate/batch', lambda n: {'json': {
+            'texts': [f"Menu item {k} ({tag(n)})" for k in range(50)], 'target_language': 'es',
+        }}),
+        Scenario('translate/long', 'POST', '/translate/long', lambda n: {'json': {
+            'text': long_text(n), 'target_language': 'fr',
+        }}, heavy=True),
+        Scenario('upload-doc (2 pages)', 'POST', '/upload-doc', doc_form('doc-2p.pdf')),
+        Scenario('upload-doc (20 pages)', 'POST', '/upload-doc', doc_form('doc-20p.pdf')),
+        Scenario('upload-doc (200 pages)', 'POST', '/upload-doc', doc_form('doc-200p.pdf'), heavy=True),
+        Scenario('upload-doc (20-page docx)', 'POST', '/upload-doc', doc_form('doc-20p.docx')),
+        Scenario('process-image (small)', 'POST', '/process-image', image_form('photo-small.jpg', width='320')),
+        Scenario('process-image (large)', 'POST', '/process-image', image_form('photo-large.jpg', width='1600'), heavy=True),
+        Scenario('process-image (png->webp)', 'POST', '/process-image', image_form('graphic-alpha.png', width='800', output_format='WEBP')),
+        Scenario('process-image/batch', 'POST', '/process-image/batch', lambda n: {
+            'files': [_file(fixtures, name, 'images') for name in ['photo-small.jpg', 'photo-medium.jpg', 'graphic-alpha.png'] * 3],
+            'data': {'width': '640'},
+        }, heavy=True),
+        Scenario('images-to-pdf', 'POST', '/images-to-pdf', lambda n: {
+            'files': [_file(fixtures, name, 'images') for name in ['photo-small.jpg', 'photo-medium.jpg', 'graphic-alpha.png', 'photo-medium.jpg']],
+        }, heavy=True),
+    ]
+
+def percentile(sorted_values, pct):
+    # Nearest-rank percentile
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(pct / 100 * len(sorted_values) + 0.5)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+async def run_scenario(client, scenario, request_count, concurrency, warmup):
+    numbers = range(warmup + request_count)
+    if scenario.setup:
+        await scenario.setup(client, numbers)
+
+    for n in range(warmup):
+        await client.request(scenario.method, scenario.url(n), **scenario.build(n))
+
+    pending = iter(range(warmup, warmup + request_count))
+    latencies = []
+    errors = {}
+
+    async def worker():
+        for n in pending:
+            start = time.perf_counter()
+            try:
+                response = await client.request(scenario.method, scenario.url(n), **scenario.build(n))
+                outcome = None if response.status_code == scenario.expect else f"HTTP {response.status_code}"
+            except httpx.HTTPError as e:
+                outcome = type(e).__name__
+            latencies.append(time.perf_counter() - start)
+            if outcome:
+                errors[outcome] = errors.get(outcome, 0) + 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': sum(errors.values()),
+        'errorKinds': errors,
+        'rps': len(latencies) / elapsed if elapsed else 0.0,
+        'p50': percentile(latencies, 50) * 1000,
+        'p95': percentile(latencies, 95) * 1000,
+        'p99': percentile(latencies, 99) * 1000,
+        'mean': sum(latencies) / len(latencies) * 1000 if latencies else 0.0,
+    }
+
+async def run_all(base_url, scenarios, args):
+    results = {}
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=args.timeout) as client:
+        for scenario in scenarios:
+            request_count = max(10, args.requests // 10) if scenario.heavy else args.requests
+            results[scenario.name] = await run_scenario(client, scenario, request_count, args.concurrency, args.warmup)
+            print_row(scenario.name, results[scenario.name], args.baseline_results.get(scenario.name))
+    return results
+
+def _change(new, old):
+    if not old:
+        return '-'
+    return f"{(new - old) / old * 100:+.0f}%"
+
+def print_header(has_baseline):
+    line = f"{'scenario':<28} {'reqs':>6} {'errors':>6} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}"
+    if has_baseline:
+        line += f" {'req/s chg':>10} {'p95 chg':>9}"
+    print(line)
+
+def print_row(name, result, baseline=None):
+    line = (f"{name:<28} {result['requests']:>6} {result['errors']:>6} {result['rps']:>9.1f} "
+            f"{result['p50']:>9.1f} {result['p95']:>9.1f} {result['p99']:>9.1f}")
+    if baseline is not None:
+        line += f" {_change(result['rps'], baseline['rps']):>10} {_change(result['p95'], baseline['p95']):>9}"
+    print(line, flush=True)
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def server_env(args, upstream_url, state_dir):
+    env = dict(
+        os.environ,
+        GEMINI_BACKEND='fake',
+        GEMINI_FAKE_LATENCY_MS=str(args.gemini_latency_ms),
+        GEMINI_FAKE_JITTER_MS=str(args.jitter_ms),
+        GEMINI_FAKE_ERROR_RATE=str(args.gemini_error_rate if args.gemini_error_rate is not None else args.error_rate),
+        # The real quota limits would dominate the numbers; concurrency limits stay on
+        GEMINI_RATE_PER_MINUTE='0',
+        GEMINI_MAX_CONCURRENCY=str(max(16, args.concurrency)),
+        GEMINI_MAX_QUEUE=str(args.concurrency * 4),
+        ACCUWEATHER_BASE_URL=upstream_url,
+        ACCUWEATHER_API_KEY='bench',
+        TRANSLATE_API_ENDPOINT=upstream_url,
+        # Keep all state out of the working tree
+        DOC_CACHE_DIR=os.path.join(state_dir, 'documents'),
+        IMAGE_CACHE_DIR=os.path.join(state_dir, 'images'),
+        TRANSLATION_MEMORY_PATH=os.path.join(state_dir, 'translation_memory.db'),
+        SESSION_DB_PATH=os.path.join(state_dir, 'sessions.db'),
+        JOB_DB_PATH=os.path.join(state_dir, 'jobs.db'),
+        JOB_DIR=os.path.join(state_dir, 'jobs'),
+        PYTHONUNBUFFERED='1',
+    )
+    if not args.warm:
+        # A zero budget means nothing is ever stored
+        env.update(DOC_CACHE_MAX_BYTES='0', IMAGE_CACHE_MAX_BYTES='0')
+    return env
+
+def start_server(args, env, log_file):
+    port = _free_port()
+    if args.server == 'asgi':
+        command = [sys.executable, '-m', 'uvicorn', 'asgi:app', '--port', str(port), '--log-level', 'warning']
+    else:
+        command = [sys.executable, os.path.abspath(__file__), '--serve-flask', str(port)]
+    process = subprocess.Popen(command, cwd=BACKEND_DIR, env=env, stdout=log_file, stderr=subprocess.STDOUT)
+    base_url = f"http://127.0.0.1:{port}"
+
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            break
+        try:
+            if httpx.get(f"{base_url}/cache/stats", timeout=1).status_code == 200:
+                return process, base_url
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f"{args.server} server did not start; see {log_file.name}")
+
+def serve_flask(port):
+    # Threaded werkzeug server: what `python main.py` runs, without the debugger and reloader
+    sys.path.insert(0, BACKEND_DIR)
+    from werkzeug.serving import make_server
+    import main
+    make_server('127.0.0.1', port, main.app, threaded=True).serve_forever()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--server', choices=['flask', 'asgi'], default='flask', help='How to serve the backend')
+    parser.add_argument('--url', help='Benchmark an already running backend instead of starting one')
+    parser.add_argument('--only', help='Comma-separated scenario names (or prefixes) to run')
+    parser.add_argument('--requests', type=int, default=200, help='Measured requests per scenario')
+    parser.add_argument('--concurrency', type=int, default=16, help='Concurrent clients')
+    parser.add_argument('--warmup', type=int, default=3, help='Unmeasured requests per scenario')
+    parser.add_argument('--timeout', type=float, default=120, help='Per-request timeout in seconds')
+    parser.add_argument('--warm', action='store_true', help='Repeat identical requests with caches enabled')
+    parser.add_argument('--gemini-latency-ms', type=int, default=300, help='Latency of the fake Gemini backend')
+    parser.add_argument('--upstream-latency-ms', type=int, default=50, help='Latency of the fake AccuWeather/Translate APIs')
+    parser.add_argument('--jitter-ms', type=int, default=20, help='Random extra latency for all fakes')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of fake upstream calls that fail')
+    parser.add_argument('--gemini-error-rate', type=float, help='Override --error-rate for Gemini')
+    parser.add_argument('--save', help='Write results to this JSON file')
+    parser.add_argument('--baseline', help='Compare with results saved by --save')
+    parser.add_argument('--serve-flask', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve_flask:
+        serve_flask(args.serve_flask)
+        return
+
+    args.baseline_results = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            args.baseline_results = json.load(f)['results']
+
+    fixtures = {name: open(path, 'rb').read() for name, path in ensure_fixtures().items()}
+    scenarios = build_scenarios(fixtures, uuid.uuid4().hex[:8], args.warm)
+    if args.only:
+        wanted = [name.strip() for name in args.only.split(',') if name.strip()]
+        scenarios = [s for s in scenarios if any(s.name == w or s.name.startswith(w) for w in wanted)]
+        if not scenarios:
+            parser.error(f"No scenario matches --only {args.only}")
+
+    settings = UpstreamSettings(args.upstream_latency_ms, args.jitter_ms, args.error_rate)
+    with FakeUpstreams(settings) as upstreams, tempfile.TemporaryDirectory() as state_dir:
+        process = None
+        log_path = os.path.join(state_dir, 'server.log')
+        with open(log_path, 'w') as log_file:
+            try:
+                if args.url:
+                    base_url = args.url.rstrip('/')
+                    print(f"Benchmarking {base_url} (fake upstreams on {upstreams.url} are up but unused unless it points at them)")
+                else:
+                    process, base_url = start_server(args, server_env(args, upstreams.url, state_dir), log_file)
+                    print(f"Benchmarking the {args.server} server, {args.concurrency} concurrent clients, "
+                          f"{'warm' if args.warm else 'cold'} caches")
+                print_header(bool(args.baseline_results))
+                results = asyncio.run(run_all(base_url, scenarios, args))
+            except RuntimeError as e:
+                with open(log_path) as f:
+                    print(f.read()[-4000:])
+                print(f"FAIL {e}")
+                sys.exit(1)
+            finally:
+                if process is not None:
+                    process.terminate()
+                    process.wait(timeout=10)
+
+    for name, result in results.items():
+        if result['errorKinds']:
+            print(f"{name}: errors {result['errorKinds']}")
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({
+                'settings': {key: value for key, value in vars(args).items() if key not in ('baseline_results', 'serve_flask')},
+                'results': results,
+            }, f, indent=2)
+        print(f"Saved results to {args.save}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+"""Compares the PDF text extraction engines in pdf_extract.py.
+
+Generates a corpus of text PDFs with ReportLab (so the expected text of every page
+is known), then runs each engine over it in a fresh subprocess and reports:
+
+  - pages/sec     single-process extraction throughput
+  - peak RSS      maximum resident set size of the subprocess
+  - parity        mean per-page similarity to the text that was drawn (1.0 = identical)
+
+Usage (from backend/):
+    python benchmarks/bench_pdf_engines.py
+    python benchmarks/bench_pdf_engines.py --pages 10,100,300 --engines pymupdf,pypdf2
+    python benchmarks/bench_pdf_engines.py --corpus-dir ./my_pdfs   # parity vs. the first engine
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import resource
+import subprocess
+from difflib import SequenceMatcher
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from pdf_extract import ENGINES, get_engine # noqa: E402
+
+WORDS = (
+    "assistant document extraction engine benchmark throughput memory parity page "
+    "translate weather gemini python flask report layout paragraph sentence text "
+    "mitra friend language model upload search image quality resize format"
+).split()
+
+def _page_lines(rng, line_count=40):
+    return [" ".join(rng.choice(WORDS) for _ in range(rng.randint(6, 12))) for _ in range(line_count)]
+
+def generate_pdf(path, page_count, seed=0):
+    """Writes a text PDF and returns the list of expected page texts."""
+    from reportlab.pdfgen import canvas
+    from reportlab.lib.pagesizes import A4
+
+    rng = random.Random(seed)
+    expected = []
+    c = canvas.Canvas(path, pagesize=A4)
+    _, height = A4
+    for _ in range(page_count):
+        lines = _page_lines(rng)
+        y = height - 60
+        for line in lines:
+            c.drawString(50, y, line)
+            y -= 18
+        c.showPage()
+        expected.append("\n".join(lines))
+    c.save()
+    return expected
+
+def _normalize(text):
+    return " ".join(text.split())
+
+def similarity(a, b):
+    return SequenceMatcher(None, _normalize(a), _normalize(b), autojunk=False).ratio()
+
+def run_worker(engine_name, pdf_path, result_path):
+    # Executed in a child process so peak RSS only reflects this engine
+    engine = get_engine(engine_name)
+    engine.page_count(pdf_path) # Warm-up, so library import time is not counted as extraction time
+    start = time.perf_counter()
+    page_count = engine.page_count(pdf_path)
+    pages = engine.extract_pages(pdf_path, list(range(page_count)))
+    elapsed = time.perf_counter() - start
+    peak_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss # KB on Linux
+    # Results go to a file: some libraries print deprecation notices on stdout
+    with open(result_path, 'w') as f:
+        json.dump({'seconds': elapsed, 'pages': [text for _, text in pages], 'peak_rss_kb': peak_rss_kb}, f)
+
+def measure(engine_name, pdf_path):
+    result_path = pdf_path + f'.{engine_name}.json'
+    subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--worker', engine_name, pdf_path, result_path],
+        check=True, capture_output=True
+    )
+    with open(result_path) as f:
+        result = json.load(f)
+    os.remove(result_path)
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pages', default='10,100,300', help='Comma-separated page counts for the generated corpus')
+    parser.add_argument('--engines', default=','.join(ENGINES), help='Comma-separated engines to compare')
+    parser.add_argument('--corpus-dir', help='Benchmark existing PDFs instead of a generated corpus')
+    parser.add_argument('--worker', nargs=3, metavar=('ENGINE', 'PDF', 'RESULT'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(*args.worker)
+        return
+
+    engines = [get_engine(name.strip()).name for name in args.engines.split(',') if name.strip()]
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        corpus = [] # (label, path, expected page texts or None)
+        if args.corpus_dir:
+            for name in sorted(os.listdir(args.corpus_dir)):
+                if name.lower().endswith('.pdf'):
+                    corpus.append((name, os.path.join(args.corpus_dir, name), None))
+        else:
+            for page_count in (int(n) for n in args.pages.split(',')):
+                path = os.path.join(tmp_dir, f'corpus_{page_count}.pdf')
+                corpus.append((f'{page_count} pages', path, generate_pdf(path, page_count, seed=page_count)))
+
+        print(f"{'document':<20} {'engine':<12} {'pages/sec':>10} {'peak RSS MB':>12} {'parity':>8}")
+        for label, path, expected in corpus:
+            reference = expected
+            for engine_name in engines:
+                result = measure(engine_name, path)
+                pages = result['pages']
+                if reference is None:
+                    # No ground truth for external PDFs: compare against the first engine
+                    reference = pages
+                parity = sum(similarity(a, b) for a, b in zip(pages, reference)) / max(1, len(reference))
+                pages_per_sec = len(pages) / result['seconds'] if result['seconds'] else float('inf')
+                print(f"{label:<20} {engine_name:<12} {pages_per_sec:>10.1f} {result['peak_rss_kb'] / 1024:>12.1f} {parity:>8.3f}")
+
+if __name__ == '__main__':
+    main()
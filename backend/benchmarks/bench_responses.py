@@ -0,0 +1,105 @@
+"""Compares response encoding: serialization time and bytes on the wire.
+
+For payloads shaped like the backend's biggest responses (/upload-doc bodies for the
+fixture PDFs, a long /search answer, and a streamed /upload-doc as NDJSON), reports:
+
+  - jsonify ms    Flask's default JSON provider (the stdlib encoder); json.dumps for NDJSON
+  - fast ms       responses.FastJSONProvider (orjson, if installed)
+  - identity/gzip/br KB   bytes on the wire for each Content-Encoding
+  - gzip/br ms    compression time at the configured level/quality
+
+Streamed payloads are compressed frame by frame with a flush after each frame, as
+responses.py does, so their ratio is lower than for one big body.
+
+Usage (from backend/):
+    python benchmarks/bench_responses.py
+    python benchmarks/bench_responses.py --runs 20
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+def _median_ms(fn, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings), result
+
+def build_payloads():
+    """Returns [(name, obj or list of NDJSON frames, streamed)]."""
+    from fixtures import ensure_fixtures
+    from pdf_extract import extract_page_batch, get_page_count
+
+    fixtures = ensure_fixtures()
+    payloads = []
+    stream_frames = None
+    for name in ('doc-2p.pdf', 'doc-20p.pdf', 'doc-200p.pdf'):
+        path = fixtures[name]
+        page_count = get_page_count(path, 'pymupdf')
+        pages, _ = extract_page_batch('pymupdf', path, list(range(page_count)))
+        stream_frames = [{"page": index + 1, "text": text, "ocr": False, "type": "page"} for index, text in pages]
+        body = { # Same fields as main._document_body
+            "extracted_text": "".join(text + "\n" for _, text in pages), "pageCount": page_count, "pages": page_count,
+            "ocrPages": 0, "engine": 'pymupdf', "format": 'pdf', "sha256": '0' * 64, "document_id": '0' * 64, "cached": False,
+        }
+        payloads.append((f"upload-doc ({page_count}p)", body, False))
+
+    answer = " ".join(page['text'] for page in stream_frames[:3])
+    payloads.append(("search answer", {'response': answer, 'session_id': 'bench'}, False))
+    payloads.append((f"upload-doc stream ({len(stream_frames)} frames)", stream_frames, True))
+    return payloads
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=10, help='Timed runs per measurement (median is reported)')
+    args = parser.parse_args()
+
+    from flask import Flask
+    from flask.json.provider import DefaultJSONProvider
+    import responses
+
+    app = Flask(__name__)
+    default_provider = DefaultJSONProvider(app)
+    fast_provider = responses.FastJSONProvider(app)
+    encodings = ['gzip'] + (['br'] if responses.brotli is not None else [])
+
+    print(f"orjson: {'yes' if responses.orjson is not None else 'no (stdlib fallback)'}, "
+          f"brotli: {'yes' if responses.brotli is not None else 'no'}, "
+          f"gzip level {responses.COMPRESS_GZIP_LEVEL}, brotli quality {responses.COMPRESS_BROTLI_QUALITY}")
+    header = f"{'payload':<30} {'jsonify ms':>10} {'fast ms':>8} {'identity KB':>11}"
+    for encoding in encodings:
+        header += f" {encoding + ' KB':>8} {encoding + ' ms':>7}"
+    print(header)
+
+    with app.app_context():
+        for name, payload, streamed in build_payloads():
+            if streamed:
+                # NDJSON: one line per frame (main._ndjson_line used json.dumps), each flushed separately
+                default_ms, frames = _median_ms(lambda: [json.dumps(frame) + "\n" for frame in payload], args.runs)
+                fast_ms, _ = _median_ms(lambda: [responses.dumps(frame) + "\n" for frame in payload], args.runs)
+                chunks = [frame.encode('utf-8') for frame in frames]
+                identity = sum(len(chunk) for chunk in chunks)
+                compress = lambda encoding: b"".join(responses._iter_compressed(chunks, encoding))
+            else:
+                default_ms, body = _median_ms(lambda: default_provider.response(payload).get_data(), args.runs)
+                fast_ms, _ = _median_ms(lambda: fast_provider.response(payload).get_data(), args.runs)
+                identity = len(body)
+                compress = lambda encoding: responses.compress(body, encoding)
+
+            row = f"{name:<30} {default_ms:>10.2f} {fast_ms:>8.2f} {identity / 1024:>11.1f}"
+            for encoding in encodings:
+                compress_ms, compressed = _median_ms(lambda: compress(encoding), args.runs)
+                row += f" {len(compressed) / 1024:>8.1f} {compress_ms:>7.2f}"
+            print(row)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""Measures cold-start cost of the backend and fails when it regresses.
+
+Each run imports the app module in a fresh subprocess and reports:
+
+  - import s      wall time to import the module (which builds the app)
+  - first req s   time for the first request after import (GET /cache/stats)
+  - RSS MB        peak resident set size after import and the first request
+  - heavy         heavy libraries that were loaded at import time (should be none)
+
+The exit status is 1 if any budget is exceeded or a heavy library is imported at
+startup, so this can run in CI.
+
+Usage (from backend/):
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --modules main,asgi --runs 5
+    python benchmarks/bench_startup.py --max-import-seconds 1.0 --max-rss-mb 80
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import resource
+import statistics
+import subprocess
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Libraries that must only be loaded by the endpoints that need them
+HEAVY_MODULES = [
+    'google.generativeai', 'google.cloud.translate_v2', 'fitz', 'pymupdf', 'pdfplumber',
+    'PyPDF2', 'pytesseract', 'reportlab', 'docx',
+]
+
+def run_worker(module_name, result_path):
+    # Executed in a child process so every run is a cold start
+    start = time.perf_counter()
+    module = __import__(module_name)
+    import_seconds = time.perf_counter() - start
+    heavy = [name for name in HEAVY_MODULES if name in sys.modules]
+
+    start = time.perf_counter()
+    if module_name == 'asgi':
+        from fastapi.testclient import TestClient
+        status = TestClient(module.app).get('/cache/stats').status_code
+    else:
+        status = module.app.test_client().get('/cache/stats').status_code
+    first_request_seconds = time.perf_counter() - start
+
+    # Results go to a file: some libraries print notices on stdout
+    with open(result_path, 'w') as f:
+        json.dump({
+            'import_seconds': import_seconds,
+            'first_request_seconds': first_request_seconds,
+            'status': status,
+            'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, # KB on Linux
+            'heavy': heavy,
+        }, f)
+
+def measure(module_name, cache_dir):
+    fd, result_path = tempfile.mkstemp(suffix='.json')
+    os.close(fd)
+    # Keep the app's on-disk caches out of the working tree
+    env = dict(os.environ, DOC_CACHE_DIR=os.path.join(cache_dir, 'documents'), IMAGE_CACHE_DIR=os.path.join(cache_dir, 'images'),
+               JOB_DIR=os.path.join(cache_dir, 'jobs'), JOB_DB_PATH=os.path.join(cache_dir, 'jobs.db'))
+    try:
+        subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--worker', module_name, result_path],
+            check=True, capture_output=True, cwd=BACKEND_DIR, env=env
+        )
+        with open(result_path) as f:
+            return json.load(f)
+    finally:
+        os.remove(result_path)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--modules', default='main', help="Comma-separated app modules to measure ('main', 'asgi')")
+    parser.add_argument('--runs', type=int, default=3, help='Cold starts per module; the median is reported')
+    parser.add_argument('--max-import-seconds', type=float, default=2.0, help='Budget for the median import time (0 disables)')
+    parser.add_argument('--max-rss-mb', type=float, default=120, help='Budget for the median peak RSS (0 disables)')
+    parser.add_argument('--worker', nargs=2, metavar=('MODULE', 'RESULT'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        sys.path.insert(0, BACKEND_DIR)
+        run_worker(*args.worker)
+        return
+
+    failures = []
+    print(f"{'module':<8} {'import s':>9} {'first req s':>12} {'RSS MB':>8}  heavy")
+    with tempfile.TemporaryDirectory() as cache_dir:
+        for module_name in (name.strip() for name in args.modules.split(',') if name.strip()):
+            results = [measure(module_name, cache_dir) for _ in range(args.runs)]
+            import_seconds = statistics.median(r['import_seconds'] for r in results)
+            first_request_seconds = statistics.median(r['first_request_seconds'] for r in results)
+            rss_mb = statistics.median(r['peak_rss_kb'] for r in results) / 1024
+            heavy = sorted({name for r in results for name in r['heavy']})
+            print(f"{module_name:<8} {import_seconds:>9.3f} {first_request_seconds:>12.3f} {rss_mb:>8.1f}  {', '.join(heavy) or '-'}")
+
+            if heavy:
+                failures.append(f"{module_name}: heavy libraries imported at startup: {', '.join(heavy)}")
+            if args.max_import_seconds and import_seconds > args.max_import_seconds:
+                failures.append(f"{module_name}: import took {import_seconds:.3f}s (budget {args.max_import_seconds}s)")
+            if args.max_rss_mb and rss_mb > args.max_rss_mb:
+                failures.append(f"{module_name}: peak RSS {rss_mb:.1f} MB (budget {args.max_rss_mb} MB)")
+            if any(r['status'] != 200 for r in results):
+                failures.append(f"{module_name}: first request failed")
+
+    for failure in failures:
+        print(f"FAIL {failure}")
+    sys.exit(1 if failures else 0)
+
+if __name__ == '__main__':
+    main()
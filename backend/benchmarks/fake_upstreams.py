@@ -0,0 +1,176 @@
+"""Local stand-ins for the AccuWeather and Google Translate APIs.
+
+Serves just the endpoints the backend calls, with configurable latency, jitter and
+error injection, so load tests run offline and without spending quota. Gemini has
+no HTTP stand-in: the backend's own fake (GEMINI_BACKEND=fake, see gemini_client.py)
+takes the same latency/error settings through environment variables.
+
+bench_load.py starts these in-process. To point a backend you run yourself at them:
+
+    python benchmarks/fake_upstreams.py --port 8900 --latency-ms 80 --error-rate 0.01
+
+    ACCUWEATHER_BASE_URL=http://127.0.0.1:8900 ACCUWEATHER_API_KEY=bench \\
+    TRANSLATE_API_ENDPOINT=http://127.0.0.1:8900 GEMINI_BACKEND=fake python main.py
+"""
+import json
+import time
+import random
+import zlib
+import argparse
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class UpstreamSettings:
+    def __init__(self, latency_ms=0, jitter_ms=0, error_rate=0.0, error_status=503):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.error_status = error_status
+
+    def delay(self):
+        return (self.latency_ms + random.uniform(0, self.jitter_ms)) / 1000
+
+    def should_fail(self):
+        return self.error_rate > 0 and random.random() < self.error_rate
+
+def _location(query):
+    # Stable key per city, so repeated lookups exercise the backend's caches
+    key = str(zlib.crc32(query.casefold().encode('utf-8')))
+    return [{'Key': key, 'LocalizedName': query.title(), 'Country': {'LocalizedName': 'Benchland'}}]
+
+def _conditions(location_key):
+    temperature = int(location_key) % 40 - 5
+    return [{
+        'WeatherText': 'Partly sunny',
+        'Temperature': {'Metric': {'Value': temperature, 'Unit': 'C'}},
+        'RealFeelTemperature': {'Metric': {'Value': temperature - 1, 'Unit': 'C'}},
+        'RelativeHumidity': 55,
+        'Wind': {'Speed': {'Metric': {'Value': 12.9, 'Unit': 'km/h'}}},
+        'UVIndex': 3,
+        'UVIndexText': 'Moderate',
+    }]
+
+def _translations(body):
+    texts = body.get('q') or []
+    if isinstance(texts, str):
+        texts = [texts]
+    target = body.get('target', 'en')
+    source = body.get('source')
+    translations = []
+    for text in texts:
+        translation = {'translatedText': f"[{target}] {text}"}
+        if not source:
+            translation['detectedSourceLanguage'] = 'en'
+        translations.append(translation)
+    return {'data': {'translations': translations}}
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1' # Keep-alive, like the real APIs, so the backend's connection pools matter
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _simulate(self):
+        # Returns False (after sending the error) when this request should fail
+        settings = self.server.settings
+        delay = settings.delay()
+        if delay:
+            time.sleep(delay)
+        if settings.should_fail():
+            self._send_json(settings.error_status, {'error': {'code': settings.error_status, 'message': 'Injected failure'}})
+            return False
+        return True
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        params = urllib.parse.parse_qs(url.query)
+        if not self._simulate():
+            return
+        if not params.get('apikey'):
+            self._send_json(401, {'Code': 'Unauthorized'})
+        elif url.path == '/locations/v1/cities/search':
+            query = params.get('q', [''])[0]
+            self._send_json(200, _location(query) if query.strip() else [])
+        elif url.path.startswith('/currentconditions/v1/'):
+            location_key = url.path.rsplit('/', 1)[-1]
+            self._send_json(200, _conditions(location_key) if location_key.isdigit() else [])
+        else:
+            self._send_json(404, {'Code': 'NotFound'})
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        raw = self.rfile.read(length) if length else b''
+        if not self._simulate():
+            return
+        if urllib.parse.urlsplit(self.path).path != '/language/translate/v2':
+            self._send_json(404, {'error': {'code': 404, 'message': 'Not found'}})
+            return
+        try:
+            body = json.loads(raw or b'{}')
+        except ValueError:
+            self._send_json(400, {'error': {'code': 400, 'message': 'Invalid JSON'}})
+            return
+        self._send_json(200, _translations(body))
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256 # The default backlog of 5 drops connections under load
+
+class FakeUpstreams:
+    """AccuWeather + Translate stand-in on a background thread. Use as a context manager."""
+
+    def __init__(self, settings=None, host='127.0.0.1', port=0):
+        self.server = _Server((host, port), _Handler)
+        self.server.settings = settings or UpstreamSettings()
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8900)
+    parser.add_argument('--latency-ms', type=int, default=0, help='Added to every response')
+    parser.add_argument('--jitter-ms', type=int, default=0, help='Extra latency, uniformly at random')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests answered with --error-status')
+    parser.add_argument('--error-status', type=int, default=503)
+    args = parser.parse_args()
+
+    settings = UpstreamSettings(args.latency_ms, args.jitter_ms, args.error_rate, args.error_status)
+    upstreams = FakeUpstreams(settings, args.host, args.port)
+    print(f"Fake AccuWeather/Translate listening on {upstreams.url}")
+    try:
+        upstreams.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        upstreams.server.server_close()
+
+if __name__ == '__main__':
+    main()
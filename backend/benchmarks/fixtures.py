@@ -0,0 +1,103 @@
+"""Fixture corpus for the load benchmarks: text PDFs, a Word document and images of varied sizes.
+
+Files are generated deterministically (same seed, same bytes) on first use and kept
+in benchmarks/fixtures/, which is not checked in. Delete the directory to rebuild.
+
+Usage (from backend/):
+    python benchmarks/fixtures.py            # build and list the corpus
+"""
+import os
+import sys
+import random
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+FIXTURES_DIR = os.path.join(BENCH_DIR, 'fixtures')
+
+# name -> page count
+PDFS = {
+    'doc-2p.pdf': 2,
+    'doc-20p.pdf': 20,
+    'doc-200p.pdf': 200,
+}
+
+# name -> page count (pages end with a page break)
+DOCX_FILES = {
+    'doc-20p.docx': 20,
+}
+
+# name -> (width, height, format, mode)
+IMAGES = {
+    'photo-small.jpg': (640, 480, 'JPEG', 'RGB'),
+    'photo-medium.jpg': (1920, 1080, 'JPEG', 'RGB'),
+    'photo-large.jpg': (4000, 3000, 'JPEG', 'RGB'),
+    'graphic-alpha.png': (1200, 900, 'PNG', 'RGBA'),
+}
+
+def _generate_image(path, width, height, image_format, mode, seed):
+    from PIL import Image, ImageDraw
+
+    rng = random.Random(seed)
+    # Gradient + shapes + sensor-like noise, so encoders do realistic work
+    # (flat colours would compress to almost nothing)
+    gradient = Image.linear_gradient('L').resize((width, height))
+    noise = Image.effect_noise((width, height), 40)
+    img = Image.merge('RGB', (gradient, noise, gradient.transpose(Image.Transpose.FLIP_LEFT_RIGHT)))
+    draw = ImageDraw.Draw(img)
+    for _ in range(40):
+        x, y = rng.randrange(width), rng.randrange(height)
+        radius = rng.randint(width // 40, width // 8)
+        colour = tuple(rng.randrange(256) for _ in range(3))
+        draw.ellipse((x - radius, y - radius, x + radius, y + radius), fill=colour)
+    if mode == 'RGBA':
+        img.putalpha(gradient)
+    save_params = {'quality': 90} if image_format == 'JPEG' else {}
+    img.save(path, format=image_format, **save_params)
+
+def _generate_docx(path, page_count, seed):
+    # Same kind of text as the PDFs, so the formats can be compared
+    import docx
+    from docx.enum.text import WD_BREAK
+    from bench_pdf_engines import _page_lines
+
+    rng = random.Random(seed)
+    document = docx.Document()
+    for page in range(page_count):
+        for line in _page_lines(rng):
+            paragraph = document.add_paragraph(line)
+        if page < page_count - 1:
+            paragraph.add_run().add_break(WD_BREAK.PAGE)
+    document.save(path)
+
+def ensure_fixtures(directory=FIXTURES_DIR):
+    """Builds any missing fixture files. Returns {name: path}."""
+    sys.path.insert(0, BENCH_DIR)
+    from bench_pdf_engines import generate_pdf
+
+    os.makedirs(directory, exist_ok=True)
+    paths = {}
+    for seed, (name, page_count) in enumerate(sorted(PDFS.items())):
+        path = os.path.join(directory, name)
+        if not os.path.exists(path):
+            generate_pdf(path + '.tmp', page_count, seed=seed)
+            os.replace(path + '.tmp', path)
+        paths[name] = path
+    for seed, (name, page_count) in enumerate(sorted(DOCX_FILES.items())):
+        path = os.path.join(directory, name)
+        if not os.path.exists(path):
+            _generate_docx(path + '.tmp', page_count, seed=seed)
+            os.replace(path + '.tmp', path)
+        paths[name] = path
+    for seed, (name, (width, height, image_format, mode)) in enumerate(sorted(IMAGES.items())):
+        path = os.path.join(directory, name)
+        if not os.path.exists(path):
+            _generate_image(path + '.tmp', width, height, image_format, mode, seed)
+            os.replace(path + '.tmp', path)
+        paths[name] = path
+    return paths
+
+def main():
+    for name, path in sorted(ensure_fixtures().items()):
+        print(f"{name:<20} {os.path.getsize(path) / 1024:>10.1f} KB  {path}")
+
+if __name__ == '__main__':
+    main()
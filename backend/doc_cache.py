@@ -0,0 +1,126 @@
+import os
+import json
+import hashlib
+import tempfile
+import threading
+
+# --- On-disk content-addressed cache ---
+# Entries live in <directory>/<key[:2]>/<key>. A hit bumps the file's mtime, so
+# eviction (oldest mtime first) is LRU. Writes go through a temp file + rename so
+# concurrent readers, including other worker processes, never see partial entries.
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__)) # Relative paths below are resolved from here, not the working directory
+
+DOC_CACHE_DIR = os.path.join(BACKEND_DIR, os.getenv('DOC_CACHE_DIR', os.path.join('cache', 'documents')))
+DOC_CACHE_MAX_BYTES = int(os.getenv('DOC_CACHE_MAX_BYTES', str(512 * 1024 * 1024)))
+
+class DiskCache:
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._total_bytes = None # Counted on first use, so importing main doesn't walk a full cache
+
+    def _ensure_total(self):
+        # Caller holds self._lock
+        if self._total_bytes is None:
+            self._total_bytes = sum(size for _, size, _ in self._scan())
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def _scan(self):
+        # (path, size, mtime) for every entry
+        entries = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith('.tmp'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((path, stat.st_size, stat.st_mtime))
+        return entries
+
+    def get(self, key):
+        with self._lock:
+            self._ensure_total()
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path) # Mark as recently used
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return data
+
+    def set(self, key, data):
+        if len(data) > self.max_bytes:
+            return
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        with self._lock:
+            self._ensure_total()
+            try:
+                old_size = os.stat(path).st_size # Overwriting an entry replaces its bytes
+            except FileNotFoundError:
+                old_size = 0
+            os.replace(tmp_path, path)
+            self._total_bytes += len(data) - old_size
+            over_budget = self._total_bytes > self.max_bytes
+        if over_budget:
+            self._evict()
+
+    def get_json(self, key):
+        data = self.get(key)
+        return json.loads(data) if data is not None else None
+
+    def set_json(self, key, value):
+        self.set(key, json.dumps(value).encode('utf-8'))
+
+    def _evict(self):
+        with self._lock:
+            # Rescan rather than trust the running total: other processes may share the directory
+            entries = sorted(self._scan(), key=lambda entry: entry[2])
+            total = sum(size for _, size, _ in entries)
+            # Evict down to 90% so we are not scanning again on the very next write
+            target = self.max_bytes * 0.9
+            for path, size, _ in entries:
+                if total <= target:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                except FileNotFoundError:
+                    pass
+            self._total_bytes = total
+
+    def stats(self):
+        with self._lock:
+            self._ensure_total()
+            return {'hits': self.hits, 'misses': self.misses, 'bytes': self._total_bytes, 'maxBytes': self.max_bytes}
+
+def make_key(*parts):
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+def save_upload(file_storage, path, chunk_size=1024 * 1024):
+    """Copies an uploaded file to path in chunks, returning its SHA-256 hex digest."""
+    digest = hashlib.sha256()
+    stream = file_storage.stream
+    with open(path, 'wb') as out:
+        for chunk in iter(lambda: stream.read(chunk_size), b''):
+            digest.update(chunk)
+            out.write(chunk)
+    return digest.hexdigest()
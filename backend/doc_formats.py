@@ -0,0 +1,304 @@
+import os
+import re
+import time
+import zipfile
+from xml.etree.ElementTree import iterparse
+
+from metrics import observe_stage
+
+# --- Format detection and non-PDF extractors for /upload-doc ---
+# Besides PDFs, /upload-doc takes Word documents (.docx), images (OCR'd, see ocr.py) and
+# plain text or markdown. The format is sniffed from the file's first bytes, so a
+# mislabelled upload still works. Every format comes back in the PDF shape, a list of
+# pages. For DOCX and text files a "page" is a section: DOCX files are split at page
+# and section breaks, text at markdown headings, and both at DOC_SECTION_MAX_CHARS.
+# DOCX files are parsed straight from word/document.xml with a streaming XML parser
+# (no DOM, no python-docx), which is much cheaper than parsing a PDF.
+
+DOC_SECTION_MAX_CHARS = int(os.getenv('DOC_SECTION_MAX_CHARS', '4000'))
+DOCX_MAX_XML_BYTES = int(os.getenv('DOCX_MAX_XML_BYTES', str(256 * 1024 * 1024))) # Uncompressed document.xml; guards against zip bombs
+
+PDF, DOCX, IMAGE, TEXT = 'pdf', 'docx', 'image', 'text'
+
+TEXT_EXTENSIONS = ('.txt', '.text', '.md', '.markdown')
+TEXT_MIMETYPES = ('text/plain', 'text/markdown', 'text/x-markdown')
+SUPPORTED_FORMATS_MESSAGE = "Supported formats: PDF, DOCX, images (PNG, JPEG, TIFF, BMP, GIF, WebP) and plain text or markdown."
+
+_IMAGE_SIGNATURES = (b'\x89PNG\r\n\x1a\n', b'\xff\xd8\xff', b'GIF87a', b'GIF89a', b'BM', b'II*\x00', b'MM\x00*')
+
+class DocumentError(Exception):
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+def detect_format(path, filename=None, mimetype=None):
+    """Returns PDF, DOCX, IMAGE or TEXT from the file's contents, or None if unsupported.
+
+    Text has no signature, so it also needs a text extension or mimetype.
+    """
+    with open(path, 'rb') as f:
+        head = f.read(4096)
+    if b'%PDF-' in head[:1024]: # Readers allow junk before the header
+        return PDF
+    if head.startswith(b'PK\x03\x04'):
+        try:
+            with zipfile.ZipFile(path) as archive:
+                return DOCX if 'word/document.xml' in archive.namelist() else None
+        except zipfile.BadZipFile:
+            return None
+    if head.startswith(_IMAGE_SIGNATURES) or (head[:4] == b'RIFF' and head[8:12] == b'WEBP'):
+        return IMAGE
+
+    extension = os.path.splitext(filename or '')[1].lower()
+    if extension in TEXT_EXTENSIONS or (mimetype or '').lower() in TEXT_MIMETYPES:
+        if head.startswith((b'\xff\xfe', b'\xfe\xff')) or b'\x00' not in head: # UTF-16 BOM, or no binary zeros
+            return TEXT
+    return None
+
+class _Sections:
+    # Collects lines into sections of about max_chars. With keep_blank_lines, blank lines
+    # stay in the section they follow (or the next one, before any text), so the sections
+    # joined with "\n" give back the original lines.
+    def __init__(self, max_chars=DOC_SECTION_MAX_CHARS, keep_blank_lines=False):
+        self.max_chars = max_chars
+        self.keep_blank_lines = keep_blank_lines
+        self.sections = []
+        self._lines = []
+        self.size = 0
+
+    def add(self, line):
+        self._lines.append(line)
+        self.size += len(line) + 1
+
+    def flush(self):
+        text = "\n".join(self._lines)
+        if not self.keep_blank_lines:
+            text = text.strip('\n')
+        elif not text.strip():
+            return # Only blank lines so far: they carry over into the next section
+        if text.strip():
+            self.sections.append(text)
+        self._lines = []
+        self.size = 0
+
+    def finish(self):
+        if self.keep_blank_lines and self.sections and self._lines and not "".join(self._lines).strip():
+            self.sections[-1] += "\n" + "\n".join(self._lines) # Trailing blank lines
+            self._lines = []
+        self.flush()
+        return self.sections
+
+# --- DOCX ---
+
+_W = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+_FALLBACK = '{http://schemas.openxmlformats.org/markup-compatibility/2006}Fallback'
+
+def extract_docx_sections(path, max_chars=DOC_SECTION_MAX_CHARS):
+    """Paragraph and table text of a .docx file, split into sections. Returns a list of strings.
+
+    Tables come out one row per line with cells separated by " | ". Headers, footers,
+    footnotes and comments live in other parts of the file and are not included.
+    """
+    try:
+        archive = zipfile.ZipFile(path)
+    except zipfile.BadZipFile as e:
+        raise DocumentError(f"Not a valid DOCX file: {e}")
+    with archive:
+        info = archive.getinfo('word/document.xml')
+        if info.file_size > DOCX_MAX_XML_BYTES:
+            raise DocumentError("DOCX document is too large to extract", 413)
+        with archive.open(info) as document_xml:
+            try:
+                return _parse_document_xml(document_xml, max_chars)
+            except SyntaxError as e: # ElementTree.ParseError
+                raise DocumentError(f"Could not parse the DOCX document: {e}")
+
+def _parse_document_xml(document_xml, max_chars):
+    sections = _Sections(max_chars)
+    paragraphs = [] # Text of the open w:p elements (text boxes nest paragraphs)
+    tables, rows, cells = [], [], [] # Open w:tbl / w:tr / w:tc, innermost last
+    run_depth = fallback_depth = 0
+    break_before = break_after = False
+
+    def emit(text):
+        nonlocal break_before, break_after
+        if break_before:
+            sections.flush()
+        elif sections.size and sections.size + len(text) > max_chars:
+            sections.flush()
+        sections.add(text)
+        if break_after:
+            sections.flush()
+        break_before = break_after = False
+
+    def page_break():
+        # Breaks inside tables are ignored; a break before any text starts the paragraph on a new section
+        nonlocal break_before, break_after
+        if tables:
+            return
+        if any(paragraphs[-1]):
+            break_after = True
+        else:
+            break_before = True
+
+    for event, elem in iterparse(document_xml, events=('start', 'end')):
+        tag = elem.tag
+        if tag == _FALLBACK:
+            fallback_depth += 1 if event == 'start' else -1
+            continue
+        if fallback_depth:
+            continue # Older-Word copy of content that mc:Choice already gave us
+
+        if event == 'start':
+            if tag == _W + 'p':
+                paragraphs.append([])
+            elif tag == _W + 'r':
+                run_depth += 1
+            elif tag == _W + 'tbl':
+                tables.append([])
+            elif tag == _W + 'tr':
+                rows.append([])
+            elif tag == _W + 'tc':
+                cells.append([])
+        elif tag == _W + 'r':
+            run_depth -= 1
+        elif run_depth and paragraphs and tag == _W + 't':
+            paragraphs[-1].append(elem.text or '')
+        elif run_depth and paragraphs and tag == _W + 'tab':
+            paragraphs[-1].append('\t')
+        elif run_depth and paragraphs and tag == _W + 'noBreakHyphen':
+            paragraphs[-1].append('-')
+        elif run_depth and paragraphs and tag in (_W + 'br', _W + 'cr'):
+            if elem.get(_W + 'type') == 'page':
+                page_break()
+            else:
+                paragraphs[-1].append('\n')
+        elif paragraphs and tag == _W + 'lastRenderedPageBreak':
+            page_break() # Where Word last laid out a page boundary, so sections follow the user's pages
+        elif paragraphs and tag == _W + 'pageBreakBefore' and elem.get(_W + 'val', 'true') not in ('false', '0'):
+            break_before = not tables
+        elif paragraphs and tag == _W + 'sectPr':
+            break_after = not tables
+        elif tag == _W + 'p' and paragraphs:
+            text = "".join(paragraphs.pop()).strip()
+            if paragraphs:
+                if text:
+                    paragraphs[-1].append('\n' + text) # Text box inside a paragraph
+            elif cells:
+                if text:
+                    cells[-1].append(text)
+            elif text:
+                emit(text)
+            elif break_after:
+                sections.flush()
+                break_before = break_after = False
+            elem.clear()
+        elif tag == _W + 'tc' and cells:
+            cell = cells.pop()
+            if rows:
+                rows[-1].append(" ".join(cell))
+        elif tag == _W + 'tr' and rows:
+            row = rows.pop()
+            if tables and any(row):
+                tables[-1].append(" | ".join(row))
+        elif tag == _W + 'tbl' and tables:
+            table = "\n".join(tables.pop())
+            if cells:
+                cells[-1].append(table) # Nested table
+            elif table:
+                emit(table)
+            elem.clear()
+
+    return sections.finish()
+
+# --- Plain text and markdown ---
+
+_MARKDOWN_HEADING = re.compile(r' {0,3}#{1,6}(\s|$)')
+
+def extract_text_sections(path, max_chars=DOC_SECTION_MAX_CHARS):
+    """Text file contents split into sections, read line by line. Returns a list of strings.
+
+    A section starts at each markdown heading (outside code fences), or at the first blank
+    line once it has max_chars characters (twice that if there is no blank line).
+    """
+    with open(path, 'rb') as f:
+        bom = f.read(2)
+    encoding = 'utf-16' if bom in (b'\xff\xfe', b'\xfe\xff') else 'utf-8-sig'
+
+    sections = _Sections(max_chars, keep_blank_lines=True)
+    in_fence = False
+    with open(path, encoding=encoding, errors='replace') as f:
+        for line in f:
+            line = line.rstrip('\r\n')
+            if line.lstrip().startswith(('```', '~~~')):
+                in_fence = not in_fence
+            if sections.size and (
+                (not in_fence and _MARKDOWN_HEADING.match(line))
+                or (sections.size >= max_chars and not line.strip())
+                or sections.size >= 2 * max_chars
+            ):
+                sections.flush()
+            sections.add(line)
+    return sections.finish()
+
+# --- Images ---
+
+def image_frame_count(path):
+    """Pages in an image: the frames of a multi-page TIFF, otherwise 1."""
+    from PIL import Image, UnidentifiedImageError
+
+    try:
+        with Image.open(path) as img:
+            return getattr(img, 'n_frames', 1) if img.format == 'TIFF' else 1
+    except UnidentifiedImageError:
+        # Pillow's message names the server-side temp file
+        raise DocumentError("Could not read the image. The file may be corrupt or an unsupported format.")
+    except OSError as e:
+        raise DocumentError(f"Could not read the image: {e}")
+
+def extract_sections(path, doc_format):
+    """Sections of a DOCX or text file (see above), timed per section like PDF pages."""
+    start = time.perf_counter()
+    sections = extract_docx_sections(path) if doc_format == DOCX else extract_text_sections(path)
+    if sections:
+        per_section = (time.perf_counter() - start) / len(sections)
+        for _ in sections:
+            observe_stage('upload-doc', f'extract:{doc_format}', per_section)
+    return sections
+
+FORMAT_LABELS = {PDF: 'PDF', DOCX: 'DOCX', IMAGE: 'image', TEXT: 'text'}
+
+class UploadedDocument:
+    """An upload ready for extraction. sections holds the text of DOCX and text files."""
+
+    def __init__(self, path, doc_format, page_count, engine, sections=None):
+        self.path = path
+        self.format = doc_format
+        self.page_count = page_count
+        self.engine = engine
+        self.sections = sections
+
+def open_document(path, filename=None, mimetype=None, engine=None, ocr=True):
+    """Detects the upload's format and counts its pages. Raises DocumentError.
+
+    DOCX and text files are cheap to extract, so their sections are extracted here;
+    PDFs and images are extracted page by page afterwards.
+    """
+    from pdf_extract import get_engine, get_page_count
+    from ocr import tesseract_available
+
+    doc_format = detect_format(path, filename, mimetype)
+    if doc_format is None:
+        raise DocumentError(f"Unsupported file type. {SUPPORTED_FORMATS_MESSAGE}", 415)
+    if doc_format == PDF:
+        engine = get_engine(engine).name
+        return UploadedDocument(path, PDF, get_page_count(path, engine), engine)
+    if doc_format == IMAGE:
+        if not ocr:
+            raise DocumentError("Images are read with OCR, which 'ocr=off' turns off")
+        if not tesseract_available():
+            raise DocumentError("OCR is not available on this server, so images can't be read", 503)
+        return UploadedDocument(path, IMAGE, image_frame_count(path), 'tesseract')
+    sections = extract_sections(path, doc_format)
+    return UploadedDocument(path, doc_format, len(sections), doc_format, sections)
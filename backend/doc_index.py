@@ -0,0 +1,196 @@
+import os
+import re
+import math
+import threading
+from collections import Counter, OrderedDict
+
+from translation import split_text
+
+# --- Local retrieval index over uploaded documents ---
+# Documents are split into chunks at paragraph/sentence boundaries and scored with
+# BM25, entirely in-process. /search sends only the top-k chunks for the question
+# to Gemini instead of the whole document. A document can be uploaded more than once
+# with different page selections or options; each upload's pages are merged into the
+# index, so a later full upload completes an earlier partial one.
+
+DOC_INDEX_CHUNK_CHARS = int(os.getenv('DOC_INDEX_CHUNK_CHARS', '1200'))
+DOC_INDEX_TOP_K = int(os.getenv('DOC_INDEX_TOP_K', '4'))
+DOC_INDEX_MAX_DOCUMENTS = int(os.getenv('DOC_INDEX_MAX_DOCUMENTS', '200'))
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+_TOKEN_PATTERN = re.compile(r'\w+', re.UNICODE)
+_STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have in is it its of on or that the this to was were will with "
+    "what which who how when where why do does did can could should would i you he she we they me my your".split()
+)
+
+def tokenize(text):
+    return [token for token in _TOKEN_PATTERN.findall(text.lower()) if token not in _STOPWORDS]
+
+class _IndexedDocument:
+    def __init__(self, document_id, pages, chunk_chars, page_count=None):
+        self.document_id = document_id
+        self.page_count = page_count # Pages in the whole document; None if unknown
+        self.pages = {page['page']: page['text'] for page in pages}
+        self.chunks = [] # (page_number, start, end): a slice of that page's text
+        self.term_freqs = [] # Counter per chunk
+        self.lengths = []
+        self.doc_freqs = Counter() # term -> number of chunks containing it
+        for page_number in sorted(self.pages):
+            text = self.pages[page_number]
+            start = 0
+            for chunk, separator in split_text(text, chunk_chars):
+                end = start + len(chunk)
+                chunk_start, chunk_end = start + len(chunk) - len(chunk.lstrip()), start + len(chunk.rstrip())
+                start = end + len(separator)
+                tokens = tokenize(chunk)
+                if not tokens:
+                    continue
+                term_freq = Counter(tokens)
+                self.chunks.append((page_number, chunk_start, chunk_end))
+                self.term_freqs.append(term_freq)
+                self.lengths.append(len(tokens))
+                self.doc_freqs.update(term_freq.keys())
+
+    def chunk_text(self, position):
+        page_number, start, end = self.chunks[position]
+        return self.pages[page_number][start:end]
+
+    @property
+    def partial(self):
+        return self.page_count is not None and len(self.pages) < self.page_count
+
+    def merged_pages(self, pages):
+        """This document's pages updated with pages, or None if that changes nothing.
+
+        A new page replaces the indexed one, unless it came back empty where the indexed one
+        has text (e.g. a later upload with OCR off).
+        """
+        merged = dict(self.pages)
+        for page in pages:
+            old_text = merged.get(page['page'])
+            if old_text is None or (page['text'].strip() or not old_text.strip()):
+                merged[page['page']] = page['text']
+        if merged == self.pages:
+            return None
+        return [{'page': number, 'text': merged[number]} for number in sorted(merged)]
+
+class DocumentIndex:
+    """BM25 index over chunks of uploaded documents, LRU-bounded to max_documents.
+
+    Evicted documents can be re-indexed from a backing store: any object with
+    get_json(key)/set_json(key, value), such as doc_cache.DiskCache.
+    """
+
+    def __init__(self, store=None, key_fn=None, max_documents=DOC_INDEX_MAX_DOCUMENTS, chunk_chars=DOC_INDEX_CHUNK_CHARS):
+        self.store = store
+        self.key_fn = key_fn
+        self.max_documents = max_documents
+        self.chunk_chars = chunk_chars
+        self._documents = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, document_id, pages, page_count=None):
+        """Indexes pages ([{'page': n, 'text': ...}, ...]) of a document with page_count pages in all.
+
+        Pages are merged into what is already indexed for document_id, so uploads of
+        different page ranges add up; re-adding the same pages is cheap.
+        """
+        existing = self._get(document_id)
+        if existing is not None:
+            merged = existing.merged_pages(pages)
+            if merged is None and (page_count is None or page_count == existing.page_count):
+                return
+            pages = merged if merged is not None else [{'page': n, 'text': t} for n, t in sorted(existing.pages.items())]
+            page_count = page_count if page_count is not None else existing.page_count
+        document = _IndexedDocument(document_id, pages, self.chunk_chars, page_count)
+        if self.store is not None:
+            self.store.set_json(self.key_fn(document_id), {
+                'pageCount': page_count,
+                'pages': [{'page': p['page'], 'text': p['text']} for p in pages],
+            })
+        self._remember(document)
+
+    def _remember(self, document):
+        with self._lock:
+            self._documents[document.document_id] = document
+            self._documents.move_to_end(document.document_id)
+            while len(self._documents) > self.max_documents:
+                self._documents.popitem(last=False)
+
+    def _get(self, document_id):
+        with self._lock:
+            document = self._documents.get(document_id)
+            if document is not None:
+                self._documents.move_to_end(document_id)
+                return document
+        if self.store is None:
+            return None
+        stored = self.store.get_json(self.key_fn(document_id))
+        if stored is None:
+            return None
+        if isinstance(stored, list): # Stored before page counts were kept
+            stored = {'pageCount': None, 'pages': stored}
+        document = _IndexedDocument(document_id, stored['pages'], self.chunk_chars, stored['pageCount'])
+        self._remember(document)
+        return document
+
+    def missing(self, document_ids):
+        return [document_id for document_id in document_ids if self._get(document_id) is None]
+
+    def partial(self, document_ids):
+        """[{'document_id', 'indexedPages', 'pageCount'}] for the documents only partly indexed."""
+        documents = [self._get(document_id) for document_id in dict.fromkeys(document_ids)]
+        return [
+            {'document_id': doc.document_id, 'indexedPages': len(doc.pages), 'pageCount': doc.page_count}
+            for doc in documents if doc is not None and doc.partial
+        ]
+
+    def search(self, document_ids, query, top_k=DOC_INDEX_TOP_K):
+        """Returns up to top_k [{'documentId', 'page', 'text', 'score'}] across the given documents."""
+        documents = [doc for doc in (self._get(document_id) for document_id in document_ids) if doc is not None]
+        query_terms = set(tokenize(query))
+        if not documents or not query_terms:
+            return []
+
+        # Corpus statistics over the selected documents only
+        chunk_count = sum(len(doc.chunks) for doc in documents)
+        if chunk_count == 0:
+            return []
+        average_length = sum(sum(doc.lengths) for doc in documents) / chunk_count
+        idf = {}
+        for term in query_terms:
+            doc_freq = sum(doc.doc_freqs.get(term, 0) for doc in documents)
+            if doc_freq:
+                idf[term] = math.log(1 + (chunk_count - doc_freq + 0.5) / (doc_freq + 0.5))
+        if not idf:
+            return []
+
+        scored = []
+        for doc in documents:
+            for position, term_freq in enumerate(doc.term_freqs):
+                length_norm = BM25_K1 * (1 - BM25_B + BM25_B * doc.lengths[position] / average_length)
+                score = 0.0
+                for term, term_idf in idf.items():
+                    freq = term_freq.get(term)
+                    if freq:
+                        score += term_idf * freq * (BM25_K1 + 1) / (freq + length_norm)
+                if score > 0:
+                    scored.append((score, doc, position))
+
+        scored.sort(key=lambda item: item[0], reverse=True)
+        return [
+            {'documentId': doc.document_id, 'page': doc.chunks[position][0], 'text': doc.chunk_text(position), 'score': round(score, 4)}
+            for score, doc, position in scored[:top_k]
+        ]
+
+def build_context_prompt(query, chunks):
+    """Wraps the user's question with the retrieved excerpts."""
+    excerpts = "\n\n".join(f"[Excerpt {i} - page {chunk['page']}]\n{chunk['text']}" for i, chunk in enumerate(chunks, 1))
+    return (
+        "Answer the question using the following excerpts from the user's documents. "
+        "If they do not contain the answer, say so and answer from general knowledge.\n\n"
+        f"{excerpts}\n\nQuestion: {query}"
+    )
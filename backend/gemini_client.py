@@ -0,0 +1,571 @@
+import os
+import asyncio
+import json
+import time
+import random
+import threading
+import types
+
+from metrics import upstream_timer
+
+# --- Shared Gemini access for /search, /search-image and /generate-email ---
+# The SDK is imported on the first call, not at startup. Model instances are
+# created once per generation config and reused. Every call
+# takes a slot from a per-endpoint and a global concurrency limit (with a bounded
+# wait queue), a token from a rate limiter sized to the API quota, and transient
+# failures (429/5xx/timeouts) are retried with jittered backoff within a deadline.
+# GEMINI_BACKEND=fake swaps in a canned local backend for development and load tests.
+# AsyncGeminiClient applies the same policy with asyncio primitives for asgi.py.
+
+GEMINI_MODEL = os.getenv('GEMINI_MODEL', 'gemini-1.5-flash')
+GEMINI_BACKEND = os.getenv('GEMINI_BACKEND', 'google').lower() # 'google' or 'fake'
+GEMINI_MAX_CONCURRENCY = int(os.getenv('GEMINI_MAX_CONCURRENCY', '16'))
+GEMINI_ENDPOINT_CONCURRENCY = os.getenv('GEMINI_ENDPOINT_CONCURRENCY', '') # e.g. "search=8,search-image=4"
+GEMINI_MAX_QUEUE = int(os.getenv('GEMINI_MAX_QUEUE', '64')) # Callers allowed to wait for a slot
+GEMINI_QUEUE_TIMEOUT_SECONDS = float(os.getenv('GEMINI_QUEUE_TIMEOUT_SECONDS', '10'))
+GEMINI_RATE_PER_MINUTE = float(os.getenv('GEMINI_RATE_PER_MINUTE', '60')) # 0 disables rate limiting
+GEMINI_RATE_BURST = int(os.getenv('GEMINI_RATE_BURST', '10'))
+GEMINI_TIMEOUT_SECONDS = float(os.getenv('GEMINI_TIMEOUT_SECONDS', '30')) # Per attempt
+GEMINI_DEADLINE_SECONDS = float(os.getenv('GEMINI_DEADLINE_SECONDS', '60')) # Whole call, including waits and retries
+GEMINI_MAX_RETRIES = int(os.getenv('GEMINI_MAX_RETRIES', '3'))
+GEMINI_BACKOFF_BASE_SECONDS = float(os.getenv('GEMINI_BACKOFF_BASE_SECONDS', '0.5'))
+GEMINI_BACKOFF_MAX_SECONDS = float(os.getenv('GEMINI_BACKOFF_MAX_SECONDS', '8'))
+GEMINI_FAKE_LATENCY_MS = int(os.getenv('GEMINI_FAKE_LATENCY_MS', '0'))
+GEMINI_FAKE_JITTER_MS = int(os.getenv('GEMINI_FAKE_JITTER_MS', '0')) # Added to the latency, uniformly at random
+GEMINI_FAKE_ERROR_RATE = float(os.getenv('GEMINI_FAKE_ERROR_RATE', '0')) # Fraction of fake calls that fail transiently
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+class GeminiError(Exception):
+    def __init__(self, message, status_code):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+class BlockedPromptError(GeminiError):
+    """The SDK's BlockedPromptException, raised without callers having to import the SDK."""
+
+    def __init__(self, cause):
+        super().__init__(str(cause), 400)
+
+def _parse_endpoint_limits(spec):
+    limits = {}
+    for item in spec.split(','):
+        if '=' in item:
+            name, value = item.split('=', 1)
+            limits[name.strip()] = int(value)
+    return limits
+
+def _is_retryable(error):
+    from google.api_core import exceptions as google_exceptions # Already loaded by the SDK when this runs
+    if isinstance(error, google_exceptions.GoogleAPICallError):
+        return error.code in RETRYABLE_STATUS_CODES
+    return isinstance(error, (ConnectionError, TimeoutError))
+
+def _backoff_delay(attempt):
+    # Full jitter, so callers that failed together don't retry together
+    return random.uniform(0, min(GEMINI_BACKOFF_MAX_SECONDS, GEMINI_BACKOFF_BASE_SECONDS * 2 ** attempt))
+
+def _translate_error(error):
+    # Maps SDK exceptions that callers handle specially onto this module's error types
+    if type(error).__name__ == 'BlockedPromptException':
+        return BlockedPromptError(error)
+    if _is_retryable(error):
+        return GeminiError(f"AI service unavailable: {error}", _status_for(error))
+    return None
+
+def _status_for(error):
+    from google.api_core import exceptions as google_exceptions
+    if isinstance(error, google_exceptions.GoogleAPICallError) and error.code == 429:
+        return 429
+    if isinstance(error, (google_exceptions.DeadlineExceeded, TimeoutError)):
+        return 504
+    return 503
+
+class ConcurrencyLimiter:
+    """Semaphore with a bounded number of waiters; callers past the queue are rejected at once."""
+
+    def __init__(self, name, capacity, max_waiting):
+        self.name = name
+        self.capacity = capacity
+        self.max_waiting = max_waiting
+        self.in_flight = 0
+        self.waiting = 0
+        self.rejected = 0
+        self._cond = threading.Condition()
+
+    def acquire(self, timeout):
+        with self._cond:
+            if self.in_flight < self.capacity:
+                self.in_flight += 1
+                return
+            if self.waiting >= self.max_waiting:
+                self.rejected += 1
+                raise GeminiError(f"AI service is busy ({self.name}), please retry shortly.", 503)
+            self.waiting += 1
+            try:
+                if not self._cond.wait_for(lambda: self.in_flight < self.capacity, timeout=max(timeout, 0)):
+                    self.rejected += 1
+                    raise GeminiError(f"Timed out waiting for the AI service ({self.name}).", 503)
+                self.in_flight += 1
+            finally:
+                self.waiting -= 1
+
+    def release(self):
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify()
+
+    def stats(self):
+        with self._cond:
+            return {'inFlight': self.in_flight, 'waiting': self.waiting, 'capacity': self.capacity, 'rejected': self.rejected}
+
+class AsyncConcurrencyLimiter:
+    """asyncio counterpart of ConcurrencyLimiter, for use on a single event loop."""
+
+    def __init__(self, name, capacity, max_waiting):
+        self.name = name
+        self.capacity = capacity
+        self.max_waiting = max_waiting
+        self.in_flight = 0
+        self.waiting = 0
+        self.rejected = 0
+        self._semaphore = asyncio.Semaphore(capacity)
+
+    async def acquire(self, timeout):
+        if self.in_flight >= self.capacity and self.waiting >= self.max_waiting:
+            self.rejected += 1
+            raise GeminiError(f"AI service is busy ({self.name}), please retry shortly.", 503)
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=max(timeout, 0))
+            self.in_flight += 1
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise GeminiError(f"Timed out waiting for the AI service ({self.name}).", 503)
+        finally:
+            self.waiting -= 1
+
+    def release(self):
+        self.in_flight -= 1
+        self._semaphore.release()
+
+    def stats(self):
+        return {'inFlight': self.in_flight, 'waiting': self.waiting, 'capacity': self.capacity, 'rejected': self.rejected}
+
+class TokenBucket:
+    """Refills rate_per_minute tokens per minute, holding at most burst."""
+
+    def __init__(self, rate_per_minute, burst):
+        self.rate = rate_per_minute / 60.0
+        self.burst = max(burst, 1)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _take(self):
+        # Takes a token and returns 0, or returns how long until one is available
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return (1 - self.tokens) / self.rate
+
+    def acquire(self, deadline):
+        """Takes a token, sleeping until one is available. Returns False if that would pass the deadline."""
+        if self.rate <= 0:
+            return True
+        while True:
+            wait = self._take()
+            if not wait:
+                return True
+            if time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+    async def acquire_async(self, deadline):
+        if self.rate <= 0:
+            return True
+        while True:
+            wait = self._take()
+            if not wait:
+                return True
+            if time.monotonic() + wait > deadline:
+                return False
+            await asyncio.sleep(wait)
+
+class _Slot:
+    def __init__(self, limiters):
+        self._limiters = limiters
+        self._released = False
+        self._lock = threading.Lock()
+
+    def release(self):
+        with self._lock:
+            if self._released:
+                return
+            self._released = True
+        for limiter in reversed(self._limiters):
+            limiter.release()
+
+class AsyncStreamingResponse:
+    """Async-iterates a streamed Gemini response while holding its concurrency slot."""
+
+    def __init__(self, response, slot):
+        self.response = response
+        self._slot = slot
+
+    async def __aiter__(self):
+        try:
+            async for chunk in self.response:
+                yield chunk
+        finally:
+            self.close()
+
+    def close(self):
+        self._slot.release()
+
+class StreamingResponse:
+    """Iterates a streamed Gemini response while holding its concurrency slot.
+
+    The slot is released when iteration ends or close() is called, whichever comes first.
+    """
+
+    def __init__(self, response, slot):
+        self.response = response
+        self._slot = slot
+
+    def __iter__(self):
+        try:
+            yield from self.response
+        finally:
+            self.close()
+
+    def close(self):
+        self._slot.release()
+
+class GeminiClient:
+    """load_backend returns the SDK module (or the fake backend); it runs once, on the first call.
+    Pass None when Gemini is not configured.
+    """
+
+    def __init__(self, load_backend, model_name=GEMINI_MODEL, max_concurrency=GEMINI_MAX_CONCURRENCY,
+                 endpoint_limits=None, max_queue=GEMINI_MAX_QUEUE, rate_per_minute=GEMINI_RATE_PER_MINUTE,
+                 rate_burst=GEMINI_RATE_BURST):
+        self._load_backend = load_backend
+        self._backend = None
+        self.model_name = model_name
+        self.max_queue = max_queue
+        self.endpoint_limits = endpoint_limits if endpoint_limits is not None else _parse_endpoint_limits(GEMINI_ENDPOINT_CONCURRENCY)
+        self._global_limiter = ConcurrencyLimiter('global', max_concurrency, max_queue)
+        self._endpoint_limiters = {}
+        self._bucket = TokenBucket(rate_per_minute, rate_burst)
+        self._models = {}
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.retries = 0
+        self.failures = 0
+
+    @property
+    def available(self):
+        return self._load_backend is not None
+
+    def model(self, generation_config=None):
+        """The shared model instance for this generation config."""
+        key = json.dumps(generation_config or {}, sort_keys=True)
+        with self._lock:
+            model = self._models.get(key)
+            if model is None:
+                if self._backend is None:
+                    self._backend = self._load_backend()
+                model = self._backend.GenerativeModel(self.model_name, generation_config=generation_config)
+                self._models[key] = model
+            return model
+
+    def _endpoint_limiter(self, endpoint):
+        with self._lock:
+            limiter = self._endpoint_limiters.get(endpoint)
+            if limiter is None:
+                capacity = self.endpoint_limits.get(endpoint, self._global_limiter.capacity)
+                limiter = ConcurrencyLimiter(endpoint, capacity, self.max_queue)
+                self._endpoint_limiters[endpoint] = limiter
+            return limiter
+
+    def _acquire_slot(self, endpoint, deadline):
+        # Always endpoint first, then global, so waiters can't deadlock each other
+        acquired = []
+        try:
+            for limiter in (self._endpoint_limiter(endpoint), self._global_limiter):
+                limiter.acquire(min(GEMINI_QUEUE_TIMEOUT_SECONDS, deadline - time.monotonic()))
+                acquired.append(limiter)
+        except BaseException: # Including CancelledError/KeyboardInterrupt, or the slot is lost for good
+            for limiter in reversed(acquired):
+                limiter.release()
+            raise
+        return _Slot(acquired)
+
+    def _call(self, endpoint, fn, keep_slot=False):
+        """Runs fn(timeout) under the limits, retrying transient errors until the deadline."""
+        deadline = time.monotonic() + GEMINI_DEADLINE_SECONDS
+        slot = self._acquire_slot(endpoint, deadline)
+        with self._lock:
+            self.calls += 1
+        try:
+            attempt = 0
+            while True:
+                if not self._bucket.acquire(deadline):
+                    raise GeminiError("AI service rate limit reached, please retry shortly.", 429)
+                try:
+                    with upstream_timer('gemini', endpoint):
+                        result = fn(max(min(GEMINI_TIMEOUT_SECONDS, deadline - time.monotonic()), 1))
+                    break
+                except Exception as e:
+                    if not _is_retryable(e) or attempt >= GEMINI_MAX_RETRIES:
+                        raise
+                    delay = _backoff_delay(attempt)
+                    if time.monotonic() + delay >= deadline:
+                        raise
+                    attempt += 1
+                    with self._lock:
+                        self.retries += 1
+                    print(f"Gemini call for {endpoint} failed ({e}), retrying in {delay:.2f}s (attempt {attempt})")
+                    time.sleep(delay)
+        except BaseException as e:
+            slot.release()
+            if not isinstance(e, Exception):
+                raise
+            with self._lock:
+                self.failures += 1
+            error = _translate_error(e)
+            if error is not None:
+                raise error from e
+            raise
+        if keep_slot:
+            return result, slot
+        slot.release()
+        return result
+
+    def generate_content(self, endpoint, contents, generation_config=None, **kwargs):
+        model = self.model(generation_config)
+        return self._call(endpoint, lambda timeout: model.generate_content(contents, request_options={'timeout': timeout}, **kwargs))
+
+    def send_message(self, endpoint, history, message):
+        model = self.model()
+        # A fresh chat per attempt, so a failed attempt can't leave half a turn in the history
+        return self._call(endpoint, lambda timeout: model.start_chat(history=list(history)).send_message(message, request_options={'timeout': timeout}))
+
+    def stream_message(self, endpoint, history, message):
+        """Like send_message(stream=True); retries only cover getting the first chunk.
+
+        Returns a StreamingResponse, which must be iterated to the end or closed.
+        """
+        model = self.model()
+        response, slot = self._call(
+            endpoint,
+            lambda timeout: model.start_chat(history=list(history)).send_message(message, stream=True, request_options={'timeout': timeout}),
+            keep_slot=True,
+        )
+        return StreamingResponse(response, slot)
+
+    def stats(self):
+        with self._lock:
+            stats = {'model': self.model_name, 'calls': self.calls, 'retries': self.retries, 'failures': self.failures}
+            endpoint_limiters = dict(self._endpoint_limiters)
+        stats['global'] = self._global_limiter.stats()
+        stats['endpoints'] = {name: limiter.stats() for name, limiter in endpoint_limiters.items()}
+        return stats
+
+class AsyncGeminiClient(GeminiClient):
+    """Same limits, rate limiting and retries as GeminiClient, without blocking an event loop."""
+
+    def __init__(self, load_backend, model_name=GEMINI_MODEL, max_concurrency=GEMINI_MAX_CONCURRENCY,
+                 endpoint_limits=None, max_queue=GEMINI_MAX_QUEUE, rate_per_minute=GEMINI_RATE_PER_MINUTE,
+                 rate_burst=GEMINI_RATE_BURST):
+        super().__init__(load_backend, model_name, max_concurrency, endpoint_limits, max_queue, rate_per_minute, rate_burst)
+        self._global_limiter = AsyncConcurrencyLimiter('global', max_concurrency, max_queue)
+
+    def _endpoint_limiter(self, endpoint):
+        limiter = self._endpoint_limiters.get(endpoint)
+        if limiter is None:
+            capacity = self.endpoint_limits.get(endpoint, self._global_limiter.capacity)
+            limiter = AsyncConcurrencyLimiter(endpoint, capacity, self.max_queue)
+            self._endpoint_limiters[endpoint] = limiter
+        return limiter
+
+    async def _acquire_slot(self, endpoint, deadline):
+        acquired = []
+        try:
+            for limiter in (self._endpoint_limiter(endpoint), self._global_limiter):
+                await limiter.acquire(min(GEMINI_QUEUE_TIMEOUT_SECONDS, deadline - time.monotonic()))
+                acquired.append(limiter)
+        except BaseException: # Including CancelledError/KeyboardInterrupt, or the slot is lost for good
+            for limiter in reversed(acquired):
+                limiter.release()
+            raise
+        return _Slot(acquired)
+
+    async def _call(self, endpoint, fn, keep_slot=False):
+        deadline = time.monotonic() + GEMINI_DEADLINE_SECONDS
+        slot = await self._acquire_slot(endpoint, deadline)
+        self.calls += 1
+        try:
+            attempt = 0
+            while True:
+                if not await self._bucket.acquire_async(deadline):
+                    raise GeminiError("AI service rate limit reached, please retry shortly.", 429)
+                try:
+                    with upstream_timer('gemini', endpoint):
+                        result = await fn(max(min(GEMINI_TIMEOUT_SECONDS, deadline - time.monotonic()), 1))
+                    break
+                except Exception as e:
+                    if not _is_retryable(e) or attempt >= GEMINI_MAX_RETRIES:
+                        raise
+                    delay = _backoff_delay(attempt)
+                    if time.monotonic() + delay >= deadline:
+                        raise
+                    attempt += 1
+                    self.retries += 1
+                    print(f"Gemini call for {endpoint} failed ({e}), retrying in {delay:.2f}s (attempt {attempt})")
+                    await asyncio.sleep(delay)
+        except BaseException as e:
+            # The client going away cancels this task (CancelledError is a BaseException)
+            slot.release()
+            if not isinstance(e, Exception):
+                raise
+            self.failures += 1
+            error = _translate_error(e)
+            if error is not None:
+                raise error from e
+            raise
+        if keep_slot:
+            return result, slot
+        slot.release()
+        return result
+
+    async def generate_content(self, endpoint, contents, generation_config=None, **kwargs):
+        model = self.model(generation_config)
+        return await self._call(endpoint, lambda timeout: model.generate_content_async(contents, request_options={'timeout': timeout}, **kwargs))
+
+    async def send_message(self, endpoint, history, message):
+        model = self.model()
+        return await self._call(endpoint, lambda timeout: model.start_chat(history=list(history)).send_message_async(message, request_options={'timeout': timeout}))
+
+    async def stream_message(self, endpoint, history, message):
+        model = self.model()
+        response, slot = await self._call(
+            endpoint,
+            lambda timeout: model.start_chat(history=list(history)).send_message_async(message, stream=True, request_options={'timeout': timeout}),
+            keep_slot=True,
+        )
+        return AsyncStreamingResponse(response, slot)
+
+# --- Fake backend (GEMINI_BACKEND=fake) ---
+# Mimics the parts of google.generativeai the app uses, with canned answers and
+# optional latency and transient failures, so the server can run (and be load
+# tested, see benchmarks/bench_load.py) without an API key or quota.
+
+class _FakeResponse:
+    def __init__(self, text, finish=True):
+        self.text = text
+        part = types.SimpleNamespace(text=text)
+        self.candidates = [types.SimpleNamespace(
+            content=types.SimpleNamespace(parts=[part]),
+            finish_reason=types.SimpleNamespace(name='STOP') if finish else None,
+        )]
+        self.prompt_feedback = None
+        self.usage_metadata = types.SimpleNamespace(
+            prompt_token_count=1, candidates_token_count=len(text.split()), total_token_count=1 + len(text.split())
+        ) if finish else None
+
+def _fake_latency():
+    return (GEMINI_FAKE_LATENCY_MS + random.uniform(0, GEMINI_FAKE_JITTER_MS)) / 1000
+
+def _maybe_fail():
+    # ConnectionError counts as transient, so injected failures go through the retry path
+    if GEMINI_FAKE_ERROR_RATE and random.random() < GEMINI_FAKE_ERROR_RATE:
+        raise ConnectionError("Injected fake Gemini failure (GEMINI_FAKE_ERROR_RATE)")
+
+def _fake_delay():
+    delay = _fake_latency()
+    if delay:
+        time.sleep(delay)
+    _maybe_fail()
+
+async def _fake_delay_async():
+    delay = _fake_latency()
+    if delay:
+        await asyncio.sleep(delay)
+    _maybe_fail()
+
+def _fake_chunks(text):
+    words = text.split(' ')
+    return [_FakeResponse(word + ' ', finish=False) for word in words[:-1]] + [_FakeResponse(words[-1])]
+
+class _FakeAsyncStream:
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+    async def __aiter__(self):
+        for chunk in self.chunks:
+            yield chunk
+
+class _FakeChat:
+    def __init__(self, history):
+        self.history = history
+
+    def send_message(self, content, stream=False, **kwargs):
+        _fake_delay()
+        text = f"Fake answer to: {str(content)[:200]}"
+        if not stream:
+            return _FakeResponse(text)
+        return iter(_fake_chunks(text))
+
+    async def send_message_async(self, content, stream=False, **kwargs):
+        await _fake_delay_async()
+        text = f"Fake answer to: {str(content)[:200]}"
+        if not stream:
+            return _FakeResponse(text)
+        return _FakeAsyncStream(_fake_chunks(text))
+
+class _FakeModel:
+    def __init__(self, model_name, generation_config=None):
+        self.model_name = model_name
+        self.generation_config = generation_config or {}
+
+    def start_chat(self, history=None):
+        return _FakeChat(history or [])
+
+    def _answer(self):
+        if self.generation_config.get('response_mime_type') == 'application/json':
+            return _FakeResponse(json.dumps({'subject': 'Fake subject', 'body': 'Fake email body.'}))
+        return _FakeResponse("fake image description")
+
+    def generate_content(self, contents, **kwargs):
+        _fake_delay()
+        return self._answer()
+
+    async def generate_content_async(self, contents, **kwargs):
+        await _fake_delay_async()
+        return self._answer()
+
+fake_backend = types.SimpleNamespace(GenerativeModel=_FakeModel)
+
+def create_gemini_client(api_key, client_class=GeminiClient):
+    """Client for GEMINI_BACKEND; .available is False when the real backend has no API key."""
+    if GEMINI_BACKEND == 'fake':
+        print("Using fake Gemini backend (GEMINI_BACKEND=fake)")
+        return client_class(lambda: fake_backend)
+    if not api_key:
+        print("Error: GEMINI_API_KEY not found in .env file. AI features will be disabled.")
+        return client_class(None)
+
+    def load_backend():
+        # google.generativeai takes most of a second to import, so only pay for it once Gemini is needed
+        import google.generativeai as genai
+        genai.configure(api_key=api_key)
+        return genai
+
+    return client_class(load_backend)
@@ -0,0 +1,255 @@
+import io
+import os
+import re
+import json
+import hashlib
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from doc_cache import BACKEND_DIR, make_key
+from metrics import stage_timer
+
+# --- Resize / re-encode helpers for /process-image and /process-image/batch ---
+
+ALLOWED_OUTPUT_FORMATS = {'JPEG', 'PNG', 'WEBP'} # Add more if needed
+IMAGE_BATCH_MAX_FILES = int(os.getenv('IMAGE_BATCH_MAX_FILES', '500'))
+IMAGE_BATCH_WORKERS = int(os.getenv('IMAGE_BATCH_WORKERS', str(os.cpu_count() or 2)))
+IMAGE_CACHE_DIR = os.path.join(BACKEND_DIR, os.getenv('IMAGE_CACHE_DIR', os.path.join('cache', 'images')))
+IMAGE_CACHE_MAX_BYTES = int(os.getenv('IMAGE_CACHE_MAX_BYTES', str(256 * 1024 * 1024)))
+# Images sent to Gemini are shrunk to fit this many pixels on the longest side
+SEARCH_IMAGE_MAX_SIDE = int(os.getenv('SEARCH_IMAGE_MAX_SIDE', '1024'))
+SEARCH_IMAGE_QUALITY = int(os.getenv('SEARCH_IMAGE_QUALITY', '85'))
+
+# Pillow releases the GIL while decoding, resampling and encoding, so a thread
+# pool spreads batch work across cores without copying uploads into processes
+_executor = ThreadPoolExecutor(max_workers=IMAGE_BATCH_WORKERS)
+
+class UnsupportedOutputFormat(ValueError):
+    pass
+
+def parse_image_options(form):
+    """Reads the resize/format parameters from form data. Raises ValueError on bad types."""
+    # Handle boolean conversion for keep_aspect_ratio
+    keep_aspect_ratio_str = form.get('keep_aspect_ratio', 'true').lower()
+    return {
+        'width': form.get('width', type=int),
+        'height': form.get('height', type=int),
+        'quality': form.get('quality', default=90, type=int), # Default quality 90
+        'keep_aspect_ratio': keep_aspect_ratio_str == 'true',
+        'output_format': form.get('output_format', '').upper(), # Default to original or JPEG
+    }
+
+def _target_size(img_width, img_height, target_width, target_height, keep_aspect_ratio):
+    new_width, new_height = img_width, img_height
+    if keep_aspect_ratio:
+        if target_width and target_height:
+            ratio = min(target_width / img_width, target_height / img_height)
+            new_width = int(img_width * ratio)
+            new_height = int(img_height * ratio)
+        elif target_width:
+            new_width = target_width
+            new_height = int(img_height * (target_width / img_width))
+        elif target_height:
+            new_height = target_height
+            new_width = int(img_width * (target_height / img_height))
+    else: # Not keeping aspect ratio
+        if target_width:
+            new_width = target_width
+        if target_height:
+            new_height = target_height
+    return new_width, new_height
+
+def _output_format(img, options):
+    output_format = options['output_format']
+    if not output_format:
+        return img.format if img.format else 'JPEG' # Keep original format or default to JPEG
+    if output_format not in ALLOWED_OUTPUT_FORMATS:
+        raise UnsupportedOutputFormat(f'Unsupported output format: {output_format}. Supported formats: {ALLOWED_OUTPUT_FORMATS}')
+    return output_format
+
+def resolve_output_format(stream, options):
+    """Output format for an upload without decoding it (Pillow only parses the header)."""
+    output_format = _output_format(Image.open(stream), options)
+    stream.seek(0)
+    return output_format
+
+def stream_sha256(stream, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: stream.read(chunk_size), b''):
+        digest.update(chunk)
+    stream.seek(0)
+    return digest.hexdigest()
+
+def derived_image_key(sha256, options, output_format):
+    """Cache key (and ETag) for a processed image: same source + same settings -> same output."""
+    # Quality only affects JPEG output, so other formats share one entry across quality values
+    quality = max(1, min(options['quality'], 95)) if output_format == 'JPEG' else None
+    return make_key('process-image', sha256, options['width'], options['height'],
+                    options['keep_aspect_ratio'], output_format, quality)
+
+def process_image_data(source, options):
+    """Resizes and re-encodes one image. source is a path or binary file object.
+
+    Returns (image_bytes, output_format).
+    """
+    img = Image.open(source)
+    output_format = _output_format(img, options)
+
+    with stage_timer('process-image', 'decode'):
+        img.load()
+        # Handle RGBA to RGB conversion for JPEG and other formats that don't support alpha
+        if output_format in ['JPEG', 'JPG'] and img.mode in ('RGBA', 'LA', 'P'):
+            # If mode is P (palette) and has transparency, convert to RGBA first
+            if img.mode == 'P' and 'transparency' in img.info:
+                 img = img.convert('RGBA')
+            # Now convert RGBA/LA to RGB
+            if img.mode in ('RGBA', 'LA'):
+                 img = img.convert('RGB')
+
+    # --- Resizing ---
+    target_width, target_height = options['width'], options['height']
+    if target_width or target_height:
+        new_width, new_height = _target_size(img.width, img.height, target_width, target_height, options['keep_aspect_ratio'])
+        if new_width > 0 and new_height > 0: # Ensure dimensions are positive
+             with stage_timer('process-image', 'resize'):
+                 img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
+        else:
+             print(f"Warning: Calculated new dimensions are not positive ({new_width}x{new_height}). Skipping resize.")
+
+    # --- Save to buffer ---
+    img_buffer = io.BytesIO()
+    save_params = {}
+    if output_format == 'JPEG':
+        save_params['quality'] = max(1, min(options['quality'], 95)) # Pillow JPEG quality is 1-95
+        save_params['optimize'] = True
+    elif output_format == 'PNG':
+        # PNG is lossless; 'quality' has no direct equivalent, so default compression is used
+        save_params['optimize'] = True
+
+    with stage_timer('process-image', 'encode'):
+        img.save(img_buffer, format=output_format, **save_params)
+    return img_buffer.getvalue(), output_format
+
+def _original_bytes(source):
+    if isinstance(source, bytes):
+        return source
+    source.seek(0)
+    return source.read()
+
+def downscale_for_upload(source, mimetype, max_side=SEARCH_IMAGE_MAX_SIDE, quality=SEARCH_IMAGE_QUALITY):
+    """Shrinks an image before it is sent to a model API. Returns (data, mimetype).
+
+    source is bytes or a seekable binary file object. Images that already fit are passed
+    through untouched, as are files Pillow can't read (the API may still accept them).
+    """
+    try:
+        img = Image.open(io.BytesIO(source) if isinstance(source, bytes) else source)
+        if max(img.size) <= max_side and img.format in ('JPEG', 'PNG', 'WEBP'):
+            return _original_bytes(source), mimetype
+        with stage_timer('search-image', 'decode'):
+            if img.format == 'JPEG':
+                img.draft('RGB', (max_side, max_side)) # Decode at reduced scale when possible
+            img = ImageOps.exif_transpose(img) # Keep phone photos upright once EXIF is dropped
+        with stage_timer('search-image', 'resize'):
+            img.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+            if img.mode != 'RGB':
+                img = img.convert('RGB')
+        buffer = io.BytesIO()
+        with stage_timer('search-image', 'encode'):
+            img.save(buffer, format='JPEG', quality=quality)
+    except Exception as e:
+        print(f"Warning: Could not downscale image, sending original: {e}")
+        return _original_bytes(source), mimetype
+    return buffer.getvalue(), 'image/jpeg'
+
+def output_mimetype(output_format):
+    if output_format == 'JPG': # Common alternative for JPEG
+        return 'image/jpeg'
+    return f'image/{output_format.lower()}'
+
+def output_filename(original_filename, output_format):
+    if original_filename:
+        base, _ = os.path.splitext(os.path.basename(original_filename))
+        return f"{base}_processed.{output_format.lower()}"
+    return f"processed_image.{output_format.lower()}"
+
+UNIDENTIFIED_IMAGE_MESSAGE = 'Cannot identify image file. The file may be corrupt or an unsupported format.'
+
+_OBJECT_REPR = re.compile(r'<[^<>]*(?: at 0x[0-9a-fA-F]+| name=[^<>]*)>') # e.g. <... object at 0x7f...>, <_io.BufferedReader name='/tmp/...'>
+
+def _client_error_message(error):
+    # Pillow puts the repr of the stream it was given (a spooled temp file) into some
+    # messages; clients only get the error itself
+    if isinstance(error, UnidentifiedImageError):
+        return UNIDENTIFIED_IMAGE_MESSAGE
+    return _OBJECT_REPR.sub('the upload', str(error))
+
+class _ZipStreamBuffer:
+    # Write-only, non-seekable sink for ZipFile; the generator drains it after every entry
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+def iter_zip_batch(files, options, window=None):
+    """Processes uploaded files in parallel and yields a ZIP archive in chunks.
+
+    Entries are added in completion order, so only about `window` outputs are ever
+    held in memory. Images that fail are listed in errors.json inside the archive.
+    """
+    window = window or IMAGE_BATCH_WORKERS * 2
+    sink = _ZipStreamBuffer()
+    used_names = set()
+    errors = []
+
+    def unique_name(name):
+        base, ext = os.path.splitext(name)
+        candidate, counter = name, 1
+        while candidate in used_names:
+            counter += 1
+            candidate = f"{base}_{counter}{ext}"
+        used_names.add(candidate)
+        return candidate
+
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_STORED) as archive:
+        # Images are already compressed, so entries are stored rather than deflated
+        remaining = iter(files)
+        in_flight = {}
+        try:
+            while True:
+                for file in remaining:
+                    in_flight[_executor.submit(process_image_data, file.stream, options)] = file
+                    if len(in_flight) >= window:
+                        break
+                if not in_flight:
+                    break
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    file = in_flight.pop(future)
+                    try:
+                        data, output_format = future.result()
+                    except Exception as e:
+                        print(f"Error processing image {file.filename} in batch: {e}")
+                        errors.append({'filename': file.filename, 'error': _client_error_message(e)})
+                        continue
+                    archive.writestr(unique_name(output_filename(file.filename, output_format)), data)
+                    yield sink.drain()
+        finally:
+            for future in in_flight:
+                future.cancel()
+
+        if errors:
+            archive.writestr('errors.json', json.dumps(errors, indent=2))
+    yield sink.drain()
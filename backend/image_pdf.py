@@ -0,0 +1,154 @@
+import io
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+from metrics import stage_timer
+
+# --- Image -> PDF pipeline for /images-to-pdf ---
+# Images are decoded and resized on a thread pool (Pillow releases the GIL while
+# decoding, resampling and encoding), with only a small window of pages in flight,
+# and the PDF is written to a spooled temp file rather than one big BytesIO.
+
+IMAGES_TO_PDF_MAX_FILES = int(os.getenv('IMAGES_TO_PDF_MAX_FILES', '200'))
+IMAGES_TO_PDF_WORKERS = int(os.getenv('IMAGES_TO_PDF_WORKERS', str(os.cpu_count() or 2)))
+IMAGES_TO_PDF_SPOOL_BYTES = int(os.getenv('IMAGES_TO_PDF_SPOOL_BYTES', str(16 * 1024 * 1024)))
+
+ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'bmp', 'tiff'}
+
+_executor = ThreadPoolExecutor(max_workers=IMAGES_TO_PDF_WORKERS)
+_reportlab_configured = False
+
+def _configure_reportlab():
+    # ReportLab is imported on first use so startup doesn't pay for it (~55 ms), and
+    # configured once here. rl_config is process-wide: every ReportLab user in the
+    # process embeds image data as binary from then on. ReportLab's default ASCII85
+    # text encoding makes every page image 25% bigger, which made the PDFs ~20% larger
+    # than they need to be. There is no per-canvas option for it.
+    global _reportlab_configured
+    if not _reportlab_configured:
+        from reportlab import rl_config
+        rl_config.useA85 = 0
+        _reportlab_configured = True
+
+class ImagePageError(Exception):
+    def __init__(self, filename, cause):
+        super().__init__(f"Failed to process image {filename}: {cause}")
+        self.filename = filename
+        self.cause = cause
+
+def has_allowed_extension(filename):
+    filename = (filename or '').lower()
+    return '.' in filename and filename.rsplit('.', 1)[1] in ALLOWED_EXTENSIONS
+
+def prepare_page(stream, page_width, page_height):
+    """Decodes and fits one image to the page.
+
+    Returns (image_bytes, width, height), or None if the image scales to nothing.
+    """
+    img = Image.open(stream)
+    img_width, img_height = img.size
+
+    # Scale to fit within the page, maintaining aspect ratio
+    scale = min(page_width / img_width, page_height / img_height)
+    new_width = int(img_width * scale)
+    new_height = int(img_height * scale)
+    if new_width <= 0 or new_height <= 0:
+        return None
+
+    if img.format == 'JPEG':
+        if img.mode in ('RGB', 'L') and img_width <= new_width and img_height <= new_height:
+            # Already small enough: embed the original JPEG data as-is (ReportLab passes JPEG through)
+            stream.seek(0)
+            return stream.read(), new_width, new_height
+        # Let libjpeg decode at 1/2, 1/4 or 1/8 scale when that is still >= the target size
+        img.draft(img.mode, (new_width, new_height))
+
+    keep_png = img.format == 'PNG'
+    with stage_timer('images-to-pdf', 'decode'):
+        img.load()
+        # Drop transparency (and modes JPEG can't store) to avoid issues with some PDF viewers
+        if img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info):
+            img = img.convert('RGB')
+            keep_png = False
+        elif img.mode not in ('RGB', 'L') and not keep_png:
+            img = img.convert('RGB')
+
+    # Use LANCZOS for best quality resizing
+    with stage_timer('images-to-pdf', 'resize'):
+        resized_img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
+
+    buffer = io.BytesIO()
+    with stage_timer('images-to-pdf', 'encode'):
+        if keep_png:
+            resized_img.save(buffer, format='PNG')
+        else:
+            # Use JPEG with high quality for other formats
+            resized_img.save(buffer, format='JPEG', quality=95)
+    return buffer.getvalue(), new_width, new_height
+
+def write_pdf(files, output, pagesize=None, window=None, on_page=None):
+    """Renders one page per uploaded file into output (a writable file object).
+
+    files is a list of objects with .stream and .filename (e.g. werkzeug FileStorage).
+    At most `window` pages are decoded or waiting to be drawn at any time.
+    Defaults to A4 pages. on_page(pages_done) is called after each page is drawn.
+    """
+    from reportlab.pdfgen import canvas # Imported here so startup doesn't pay for ReportLab
+    from reportlab.lib.pagesizes import A4
+
+    _configure_reportlab()
+    pagesize = pagesize or A4
+    width, height = pagesize
+    window = window or IMAGES_TO_PDF_WORKERS * 2
+    c = canvas.Canvas(output, pagesize=pagesize)
+
+    def prepare(file):
+        try:
+            return prepare_page(file.stream, width, height)
+        except Exception as e:
+            raise ImagePageError(file.filename, e)
+
+    pending = deque()
+    pages_done = 0
+
+    def draw_next():
+        nonlocal pages_done
+        _draw_next(c, pending, width, height)
+        pages_done += 1
+        if on_page:
+            on_page(pages_done)
+
+    try:
+        for file in files:
+            pending.append((file, _executor.submit(prepare, file)))
+            if len(pending) < window:
+                continue
+            draw_next()
+        while pending:
+            draw_next()
+    finally:
+        for _, future in pending:
+            future.cancel()
+
+    with stage_timer('images-to-pdf', 'write'):
+        c.save()
+
+def _draw_next(c, pending, width, height):
+    from reportlab.lib.utils import ImageReader
+
+    file, future = pending.popleft()
+    page = future.result()
+    if page is None:
+        # Handle case of zero dimension if necessary, though unlikely with scaling
+        print(f"Skipping image {file.filename} due to zero calculated dimension.")
+    else:
+        image_bytes, new_width, new_height = page
+        # Center the image on the page
+        x_offset = (width - new_width) / 2
+        y_offset = (height - new_height) / 2
+        with stage_timer('images-to-pdf', 'draw'):
+            c.drawImage(ImageReader(io.BytesIO(image_bytes)), x_offset, y_offset, width=new_width, height=new_height, preserveAspectRatio=True)
+    c.showPage() # Move to the next page
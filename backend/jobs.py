@@ -0,0 +1,262 @@
+import os
+import json
+import time
+import uuid
+import shutil
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# --- Background jobs for slow document and image work ---
+# /upload-doc, /images-to-pdf and /process-image can hand their work to a small,
+# bounded worker pool and answer with a job id straight away, so a 200-page PDF
+# doesn't hold a request thread that chat traffic needs. Job status, progress and
+# results live in SQLite (readable from every worker process); inputs and file
+# results live in a per-job directory. Finished jobs expire after JOB_TTL_SECONDS.
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__)) # Relative paths below are resolved from here, not the working directory
+
+JOB_DB_PATH = os.path.join(BACKEND_DIR, os.getenv('JOB_DB_PATH', 'jobs.db'))
+JOB_DIR = os.path.join(BACKEND_DIR, os.getenv('JOB_DIR', os.path.join('cache', 'jobs')))
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', '2'))
+JOB_MAX_PENDING = int(os.getenv('JOB_MAX_PENDING', '100')) # Queued jobs accepted before submissions get a 503
+JOB_TTL_SECONDS = int(os.getenv('JOB_TTL_SECONDS', str(24 * 60 * 60)))
+
+QUEUED, RUNNING, SUCCEEDED, FAILED = 'queued', 'running', 'succeeded', 'failed'
+FINISHED_STATES = (SUCCEEDED, FAILED)
+
+class JobQueueFull(Exception):
+    pass
+
+class JobError(Exception):
+    """Raised by job functions for failures the client caused (bad input), with an HTTP status."""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+class FileResult:
+    """A job result stored as a file, served by /jobs/<id>/result as a download."""
+
+    def __init__(self, path, mimetype, download_name):
+        self.path = path
+        self.mimetype = mimetype
+        self.download_name = download_name
+
+class Job:
+    # Handed to the job function: where to read inputs and write outputs, and a progress callback
+    def __init__(self, job_id, directory, inputs, queue):
+        self.id = job_id
+        self.dir = directory
+        self.inputs = inputs
+        self._queue = queue
+
+    def progress(self, done, total=None):
+        self._queue._update(self.id, progress_done=done, **({'progress_total': total} if total is not None else {}))
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+class JobQueue:
+    def __init__(self, db_path=JOB_DB_PATH, job_dir=JOB_DIR, workers=JOB_WORKERS, max_pending=JOB_MAX_PENDING, ttl_seconds=JOB_TTL_SECONDS):
+        self.job_dir = os.path.abspath(job_dir) # FileResult paths are absolute, so send_file finds them from any working directory
+        self.workers = workers
+        self.max_pending = max_pending
+        self.ttl_seconds = ttl_seconds
+        self._executor = None
+        self._futures = {}
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._changed = threading.Condition()
+        self._version = 0
+        os.makedirs(job_dir, exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " id TEXT PRIMARY KEY,"
+                " kind TEXT NOT NULL,"
+                " status TEXT NOT NULL,"
+                " progress_done INTEGER NOT NULL DEFAULT 0,"
+                " progress_total INTEGER,"
+                " error TEXT,"
+                " error_status INTEGER,"
+                " result_json TEXT,"
+                " result_file TEXT,"
+                " owner_pid INTEGER NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " started_at REAL,"
+                " finished_at REAL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_finished_at ON jobs(finished_at)")
+        self._fail_orphans()
+
+    def _get_executor(self):
+        # Created on the first job, so processes that never run one don't start threads
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='job')
+        return self._executor
+
+    def submit(self, kind, fn, inputs=(), total=None):
+        """Queues fn(job) and returns the job id. Raises JobQueueFull when too many jobs are waiting.
+
+        inputs are file paths that are moved into the job's directory (see Job.inputs; spooling
+        them under job_dir makes that a rename) and deleted once the job has run.
+        fn returns a JSON-serializable dict or a FileResult.
+        """
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise JobQueueFull(f"Too many background jobs queued ({self.max_pending}), try again later")
+            self._pending += 1
+
+        try:
+            self._expire()
+            job_id = uuid.uuid4().hex
+            directory = os.path.join(self.job_dir, job_id)
+            input_dir = os.path.join(directory, 'input')
+            os.makedirs(input_dir)
+            job_inputs = []
+            for index, path in enumerate(inputs):
+                target = os.path.join(input_dir, f"{index}{os.path.splitext(path)[1]}")
+                shutil.move(path, target)
+                job_inputs.append(target)
+
+            with self._lock, self._conn:
+                self._conn.execute(
+                    "INSERT INTO jobs (id, kind, status, progress_total, owner_pid, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                    (job_id, kind, QUEUED, total, os.getpid(), time.time())
+                )
+            job = Job(job_id, directory, job_inputs, self)
+            future = self._get_executor().submit(self._run, job, fn)
+            with self._lock:
+                self._futures[job_id] = future
+            future.add_done_callback(lambda _: self._forget(job_id))
+            return job_id
+        except Exception:
+            with self._lock:
+                self._pending -= 1
+            raise
+
+    def _run(self, job, fn):
+        with self._lock:
+            self._pending -= 1
+        self._update(job.id, status=RUNNING, started_at=time.time())
+        try:
+            result = fn(job)
+            if isinstance(result, FileResult):
+                fields = {'result_file': json.dumps({'path': result.path, 'mimetype': result.mimetype, 'downloadName': result.download_name})}
+            else:
+                fields = {'result_json': json.dumps(result)}
+            self._update(job.id, status=SUCCEEDED, finished_at=time.time(), **fields)
+        except JobError as e:
+            self._update(job.id, status=FAILED, finished_at=time.time(), error=e.message, error_status=e.status_code)
+        except Exception as e:
+            print(f"Background job {job.id} failed: {e}")
+            self._update(job.id, status=FAILED, finished_at=time.time(), error=str(e), error_status=500)
+        finally:
+            shutil.rmtree(os.path.join(job.dir, 'input'), ignore_errors=True)
+
+    def _forget(self, job_id):
+        with self._lock:
+            self._futures.pop(job_id, None)
+
+    def _update(self, job_id, **fields):
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock, self._conn:
+            self._conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", list(fields.values()) + [job_id])
+        with self._changed:
+            self._version += 1
+            self._changed.notify_all()
+
+    def get(self, job_id):
+        """Returns the job as a dict, or None if it doesn't exist (or has expired)."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, kind, status, progress_done, progress_total, error, error_status, result_json, result_file,"
+                " created_at, started_at, finished_at FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        keys = ('id', 'kind', 'status', 'progress_done', 'progress_total', 'error', 'error_status', 'result_json', 'result_file',
+                'created_at', 'started_at', 'finished_at')
+        return dict(zip(keys, row))
+
+    @property
+    def version(self):
+        return self._version
+
+    def wait_for_update(self, version, timeout):
+        # Wakes up as soon as a job in this process changes. Jobs run by other worker
+        # processes are only seen when the timeout expires, so callers poll with a short one.
+        with self._changed:
+            self._changed.wait_for(lambda: self._version != version, timeout)
+
+    def delete(self, job_id):
+        """Cancels a queued job or removes a finished one. Returns False if the job is running.
+
+        Only jobs queued in this process can be cancelled; anything else is removed only once its
+        row says it has finished, so a job running in another worker process keeps its row and
+        directory until it is done writing to them.
+        """
+        with self._lock:
+            future = self._futures.get(job_id)
+        if future is not None and future.cancel():
+            with self._lock:
+                self._pending -= 1
+            with self._lock, self._conn:
+                self._conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+        else:
+            with self._lock, self._conn:
+                deleted = self._conn.execute(
+                    "DELETE FROM jobs WHERE id = ? AND status IN (?, ?)", (job_id,) + FINISHED_STATES
+                ).rowcount
+            if not deleted:
+                return False
+        shutil.rmtree(os.path.join(self.job_dir, job_id), ignore_errors=True)
+        return True
+
+    def _expire(self):
+        cutoff = time.time() - self.ttl_seconds
+        with self._lock, self._conn:
+            expired = [row[0] for row in self._conn.execute("SELECT id FROM jobs WHERE finished_at < ?", (cutoff,))]
+            self._conn.execute("DELETE FROM jobs WHERE finished_at < ?", (cutoff,))
+        for job_id in expired:
+            shutil.rmtree(os.path.join(self.job_dir, job_id), ignore_errors=True)
+
+    def _fail_orphans(self):
+        # Jobs whose process exited (restart, crash) will never finish
+        with self._lock, self._conn:
+            rows = self._conn.execute(
+                "SELECT id, owner_pid FROM jobs WHERE status IN (?, ?)", (QUEUED, RUNNING)
+            ).fetchall()
+            for job_id, owner_pid in rows:
+                if owner_pid == os.getpid() or not _pid_alive(owner_pid):
+                    self._conn.execute(
+                        "UPDATE jobs SET status = ?, error = ?, error_status = ?, finished_at = ? WHERE id = ?",
+                        (FAILED, 'The server restarted before the job finished', 503, time.time(), job_id)
+                    )
+
+def job_status(job):
+    """Public JSON view of a job (see /jobs/<id>)."""
+    status = {
+        'jobId': job['id'],
+        'kind': job['kind'],
+        'status': job['status'],
+        'progress': {'done': job['progress_done'], 'total': job['progress_total']},
+        'createdAt': job['created_at'],
+        'startedAt': job['started_at'],
+        'finishedAt': job['finished_at'],
+    }
+    if job['status'] == FAILED:
+        status['error'] = job['error']
+    if job['status'] == SUCCEEDED:
+        status['resultUrl'] = f"/jobs/{job['id']}/result"
+    return status
@@ -1,106 +1,512 @@
 import os
-import requests
-import google.generativeai as genai # Import Gemini library
-from flask import Flask, request, jsonify, send_file # Added send_file
-from flask_cors import CORS
-import os
-from dotenv import load_dotenv
-import google.generativeai as genai
-import google.ai.generativelanguage as glm
-import requests
-import pdfplumber
-from docx import Document
-import fitz # PyMuPDF
-from PIL import Image
-import pytesseract
-import io # Add this import
-from google.cloud import translate_v2 as translate # Add this import
-import urllib.parse # Added for search URL encoding
-import mimetypes # Added for guessing image type
-from PyPDF2 import PdfReader # Corrected import for PdfReader
-import traceback # <--- IMPORT TRACEBACK HERE
+import io
+import re
 import json # Added for JSON handling
+import tempfile
+import threading
+import traceback # <--- IMPORT TRACEBACK HERE
+import urllib.parse # Added for search URL encoding
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dotenv import load_dotenv
+from flask import Blueprint, Flask, request, jsonify, send_file, Response, stream_with_context # Added send_file
+from flask_cors import CORS
+from werkzeug.datastructures import FileStorage
+from PIL import UnidentifiedImageError
 
-# --- ReportLab Imports --- 
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import A4
-from reportlab.lib.utils import ImageReader
-# --- End ReportLab Imports --- 
-
-# Load environment variables from .env file
+# Load environment variables from .env file (before the modules below read their settings)
 load_dotenv()
 
-# Configure Gemini API
+# Heavy libraries (google.generativeai, Google Cloud Translate, PyMuPDF, pdfplumber, PyPDF2,
+# pytesseract, ReportLab) are imported by the modules below on first use, not at startup.
+import metrics
+from sessions import SessionError, create_session_store, new_session_id, trim_history
+from response_cache import ResponseCache, make_cache_key
+from gemini_client import GEMINI_MODEL, BlockedPromptError, GeminiError, create_gemini_client
+from weather_client import WeatherClient, WeatherError
+from pdf_extract import get_engine, iter_extract_pages, parse_page_range
+from ocr import OCR_DPI, clamp_dpi, iter_ocr_image, iter_with_ocr, ocr_cache
+from doc_formats import FORMAT_LABELS, IMAGE, PDF, DocumentError, open_document
+from doc_cache import DOC_CACHE_DIR, DOC_CACHE_MAX_BYTES, DiskCache, save_upload
+from doc_cache import make_key as make_doc_cache_key
+from image_pdf import ALLOWED_EXTENSIONS as ALLOWED_IMAGE_EXTENSIONS
+from image_pdf import IMAGES_TO_PDF_MAX_FILES, IMAGES_TO_PDF_SPOOL_BYTES, ImagePageError, has_allowed_extension, write_pdf
+from image_ops import ALLOWED_OUTPUT_FORMATS, IMAGE_BATCH_MAX_FILES, IMAGE_CACHE_DIR, IMAGE_CACHE_MAX_BYTES, SEARCH_IMAGE_MAX_SIDE, UNIDENTIFIED_IMAGE_MESSAGE, UnsupportedOutputFormat
+from image_ops import derived_image_key, downscale_for_upload, resolve_output_format, stream_sha256
+from image_ops import iter_zip_batch, output_filename, output_mimetype, parse_image_options, process_image_data
+from doc_index import DOC_INDEX_TOP_K, DocumentIndex, build_context_prompt
+from jobs import FINISHED_STATES, FAILED, SUCCEEDED, FileResult, JobError, JobQueue, JobQueueFull, job_status
+from responses import FastJSONProvider, compress_response, dumps as json_dumps
+from uploads import MAX_CONTENT_LENGTH, UploadRequest, enforce_upload_limit, too_large_response
+from translation import TranslationMemory, translate_texts, translate_long, iter_translate_long
+
+# Shared model instances, concurrency/rate limits and retries for all Gemini calls (see gemini_client.py).
+# The Gemini SDK is imported and configured on the first AI request.
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
-if not GEMINI_API_KEY:
-    print("Error: GEMINI_API_KEY not found in .env file. AI features will be disabled.")
-else:
+gemini = create_gemini_client(GEMINI_API_KEY)
+
+def _once(factory):
+    # Returns a getter that calls factory on first use (once, even with concurrent callers)
+    lock = threading.Lock()
+    created = []
+    def get():
+        if not created:
+            with lock:
+                if not created:
+                    created.append(factory())
+        return created[0]
+    return get
+
+# Points the Translate client at another server, e.g. the local stand-in in benchmarks/fake_upstreams.py
+TRANSLATE_API_ENDPOINT = os.getenv('TRANSLATE_API_ENDPOINT')
+
+def _create_translate_client():
+    # Ensure GOOGLE_APPLICATION_CREDENTIALS environment variable is set
+    # pointing to your service account key file.
+    from google.cloud import translate_v2 as translate
     try:
-        genai.configure(api_key=GEMINI_API_KEY)
+        if TRANSLATE_API_ENDPOINT:
+            # The local stand-in doesn't check credentials
+            from google.auth.credentials import AnonymousCredentials
+            client = translate.Client(credentials=AnonymousCredentials(), client_options={'api_endpoint': TRANSLATE_API_ENDPOINT})
+        else:
+            client = translate.Client()
+        print("Google Translate client initialized successfully.")
+        return client
     except Exception as e:
-        print(f"Error configuring Gemini API: {e}")
-        GEMINI_API_KEY = None
-
-# --- Initialize Google Translate Client ---
-# Ensure GOOGLE_APPLICATION_CREDENTIALS environment variable is set
-# pointing to your service account key file.
-translate_client = None
-try:
-    translate_client = translate.Client()
-    print("Google Translate client initialized successfully.")
-except Exception as e:
-    print(f"Error initializing Google Translate client: {e}. Translation endpoint will be disabled.")
-    # You might want to handle this more gracefully depending on your app's needs
-
-app = Flask(__name__)
-
-# Add CORS configuration - This should be fine now
-CORS(app, resources={r"/*": {"origins": "http://localhost:8080"}})
+        print(f"Error initializing Google Translate client: {e}. Translation endpoint will be disabled.")
+        return None
+
+# --- Google Translate Client ---
+# Created on the first translation request (credential discovery can take seconds), then reused
+get_translate_client = _once(_create_translate_client)
+
+api = Blueprint('api', __name__)
+
+# Per-route request size limits; uploads spool to disk past UPLOAD_SPOOL_BYTES (see uploads.py)
+api.before_request(enforce_upload_limit)
+
+# Server-side conversation history for /search (see sessions.py)
+session_store = create_session_store()
+
+def _resolve_chat_history(data):
+    # Returns (session_id, history, is_new_session); raises SessionError for bad input.
+    # "new_session": true starts a server-side session (seeded from any 'history' sent) under a
+    # new server-minted id. With a session_id the server-side history is used and the client only
+    # sends the new turn; ids the server didn't issue (or that expired) are rejected. Without
+    # either we fall back to the history list carried in the request body.
+    client_history = data.get('history') or []
+    if not isinstance(client_history, list) or not all(isinstance(item, dict) for item in client_history):
+        raise SessionError("'history' must be a list of {'role': ..., 'parts': ...} objects")
+    client_history = [item for item in client_history if item.get('role') and item.get('parts')]
+    session_id = data.get('session_id')
+    if session_id is not None and not isinstance(session_id, str):
+        raise SessionError("'session_id' must be a string")
+
+    if session_id:
+        history = session_store.get(session_id)
+        if history is None:
+            raise SessionError("Unknown or expired session_id. Start a new session with \"new_session\": true.", 404)
+        return session_id, history, False
+    if str(data.get('new_session', False)).lower() == 'true':
+        return new_session_id(), trim_history(client_history, session_store.token_budget), True
+    return None, client_history, False
+
+# Cache of Gemini answers keyed on prompt/model/config/image hash (see response_cache.py)
+response_cache = ResponseCache()
+
+def _create_weather_client():
+    client = WeatherClient()
+    metrics.register_cache('weather', client.stats)
+    return client
+
+# Pooled, cached AccuWeather client shared by all /get-weather requests, created on first use
+get_weather_client = _once(_create_weather_client)
+
+# Content-addressed extraction results for /upload-doc (see doc_cache.py)
+doc_cache = DiskCache(DOC_CACHE_DIR, DOC_CACHE_MAX_BYTES)
+
+# Processed /process-image outputs, keyed by source hash + resize/format settings
+image_cache = DiskCache(IMAGE_CACHE_DIR, IMAGE_CACHE_MAX_BYTES)
+
+# BM25 index over uploaded documents, so /search can send only the relevant chunks.
+# Indexed pages are also kept in the document cache so evicted documents can be reloaded.
+doc_index = DocumentIndex(store=doc_cache, key_fn=lambda document_id: make_doc_cache_key('doc-index', document_id))
+
+def _resolve_prompt(data, query):
+    # Returns (prompt, error) where error is (message, status_code). With 'document_ids' the query is
+    # wrapped with the top-k matching chunks from those documents instead of the client pasting whole documents.
+    document_ids = data.get('document_ids') or []
+    if not document_ids:
+        return query, None
+    if not isinstance(document_ids, list) or not all(isinstance(d, str) for d in document_ids):
+        return None, ("'document_ids' must be a list of document ids", 400)
+    missing = doc_index.missing(document_ids)
+    if missing:
+        return None, (f"Unknown document_ids: {', '.join(missing)}. Upload the documents again.", 404)
+    try:
+        top_k = max(1, min(int(data.get('top_k', DOC_INDEX_TOP_K)), 20))
+    except (TypeError, ValueError):
+        return None, ("'top_k' must be an integer", 400)
+    chunks = doc_index.search(document_ids, query, top_k=top_k)
+    if not chunks:
+        return query, None
+    return build_context_prompt(query, chunks), None
+
+def _add_partial_documents(result, data):
+    # Flags documents whose index only holds some of their pages (e.g. uploaded with 'pages'),
+    # so the client knows the answer could not draw on the rest of them
+    document_ids = data.get('document_ids') or []
+    partial = doc_index.partial(document_ids) if isinstance(document_ids, list) else []
+    if partial:
+        result["partial_documents"] = partial
+    return result
+
+# Persistent (source text, source language, target language) -> translation store
+translation_memory = TranslationMemory()
+TRANSLATE_BATCH_MAX_ITEMS = int(os.getenv('TRANSLATE_BATCH_MAX_ITEMS', '1000'))
+
+def _response_cache_enabled(endpoint, request_flag=True):
+    # Disabled globally via RESPONSE_CACHE_DISABLED, or per request with "cache": false
+    return response_cache.enabled(endpoint) and str(request_flag).lower() != 'false'
+
+def _save_chat_turn(session_id, history, is_new_session, query, answer):
+    if not session_id:
+        return
+    turns = [{'role': 'user', 'parts': query}, {'role': 'model', 'parts': answer}]
+    if is_new_session:
+        turns = history + turns
+    session_store.append(session_id, turns)
 
 # --- Updated /search endpoint with Gemini --- 
-@app.route('/search', methods=['POST'])
+@api.route('/search', methods=['POST'])
 def search():
-    if not GEMINI_API_KEY:
+    if not gemini.available:
         return jsonify({"error": "AI Service not configured or configuration failed."}), 503 # Service Unavailable
         
     try:
-        data = request.json
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return jsonify({"error": "Request body must be a JSON object"}), 400
         query = data.get('query', '')
         language = data.get('language', 'en') # Keep language for potential future use
         gender = data.get('gender', 'Neutral') # Keep gender for potential future use
-        history = data.get('history', []) # Expecting [{'role': 'user'/'model', 'parts': 'text'}, ...]
+        # History comes from the server-side session when 'session_id' or 'new_session' is sent,
+        # otherwise from 'history': [{'role': 'user'/'model', 'parts': 'text'}, ...]
+        session_id, valid_history, is_new_session = _resolve_chat_history(data)
 
         if not query:
             return jsonify({"error": "Query cannot be empty"}), 400
 
-        # Initialize the Gemini model
-        # Use 'gemini-1.5-flash' for a balance of speed and capability
-        model = genai.GenerativeModel('gemini-1.5-flash')
+        # Only the raw query goes into the session history; the prompt may carry document excerpts
+        prompt, error = _resolve_prompt(data, query)
+        if error:
+            return jsonify({"error": error[0]}), error[1]
 
-        # Start a chat session with the provided history
-        # Ensure history format matches Gemini's expected format
-        # Filter out any potentially empty/invalid history items just in case
-        valid_history = [item for item in history if item.get('role') and item.get('parts')]
-        chat = model.start_chat(history=valid_history)
+        # Same history + prompt against the same model gives a cached answer back
+        use_cache = _response_cache_enabled('search', data.get('cache', True))
+        cache_key = make_cache_key(GEMINI_MODEL, {'history': valid_history, 'query': prompt})
+        answer = response_cache.get('search', cache_key) if use_cache else None
 
-        # Send the new user query
-        response = chat.send_message(query)
+        if answer is None:
+            # Chat with the resolved history and send the new user query
+            response = gemini.send_message('search', valid_history, prompt)
+            answer = response.text
+            if use_cache:
+                response_cache.set('search', cache_key, answer)
 
-        # Return the model's response text
-        return jsonify({"response": response.text})
+        _save_chat_turn(session_id, valid_history, is_new_session, query, answer)
 
+        # Return the model's response text
+        result = {"response": answer}
+        if session_id:
+            result["session_id"] = session_id
+        return jsonify(_add_partial_documents(result, data))
+
+    except SessionError as e:
+        return jsonify({"error": e.message}), e.status_code
+    except GeminiError as e:
+        print(f"Gemini unavailable in /search: {e}")
+        return jsonify({"error": e.message}), e.status_code
     except Exception as e:
         print(f"Error during Gemini API call in /search: {e}")
         # Check for specific Gemini API errors if needed
         # Example: handle authentication errors, rate limits, etc.
         return jsonify({"error": f"An error occurred while contacting the AI service: {str(e)}"}), 500
 
+# --- Streaming helpers ---
+def _ndjson_line(payload):
+    # One JSON object per line, so the client can parse frames as they arrive
+    return json_dumps(payload) + "\n"
+
+def _finish_reason_name(finish_reason):
+    # Gemini returns an enum here; send its name (e.g. 'STOP') rather than the raw int
+    if finish_reason is None:
+        return None
+    return getattr(finish_reason, 'name', str(finish_reason))
+
+def _usage_to_dict(usage_metadata):
+    if not usage_metadata:
+        return None
+    return {
+        'promptTokenCount': getattr(usage_metadata, 'prompt_token_count', None),
+        'candidatesTokenCount': getattr(usage_metadata, 'candidates_token_count', None),
+        'totalTokenCount': getattr(usage_metadata, 'total_token_count', None),
+    }
+
+# --- Streaming variant of /search (NDJSON) ---
+# Frames: {"type": "chunk", "text": ...} as text arrives, then a single
+# {"type": "done", "finishReason": ..., "usage": {...}} or {"type": "error", "error": ...}
+@api.route('/search/stream', methods=['POST'])
+def search_stream():
+    if not gemini.available:
+        return jsonify({"error": "AI Service not configured or configuration failed."}), 503
+
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "Request body must be a JSON object"}), 400
+    query = data.get('query', '')
+    if not query:
+        return jsonify({"error": "Query cannot be empty"}), 400
+    try:
+        session_id, valid_history, is_new_session = _resolve_chat_history(data)
+    except SessionError as e:
+        return jsonify({"error": e.message}), e.status_code
+
+    prompt, error = _resolve_prompt(data, query)
+    if error:
+        return jsonify({"error": error[0]}), error[1]
+
+    try:
+        # With stream=True the SDK returns as soon as the first chunk is in,
+        # so upstream failures still surface here as a normal error response
+        response = gemini.stream_message('search', valid_history, prompt)
+    except GeminiError as e:
+        print(f"Gemini unavailable in /search/stream: {e}")
+        return jsonify({"error": e.message}), e.status_code
+    except Exception as e:
+        print(f"Error during Gemini API call in /search/stream: {e}")
+        return jsonify({"error": f"An error occurred while contacting the AI service: {str(e)}"}), 500
+
+    def generate():
+        finish_reason = None
+        usage = None
+        answer_parts = []
+        try:
+            for chunk in response:
+                try:
+                    text = chunk.text
+                except ValueError:
+                    # Chunks without text parts (e.g. the final safety/usage frame)
+                    text = ''
+                if text:
+                    answer_parts.append(text)
+                    yield _ndjson_line({"type": "chunk", "text": text})
+                if chunk.candidates:
+                    finish_reason = chunk.candidates[0].finish_reason or finish_reason
+                usage = getattr(chunk, 'usage_metadata', None) or usage
+
+            _save_chat_turn(session_id, valid_history, is_new_session, query, "".join(answer_parts))
+            done_frame = {
+                "type": "done",
+                "finishReason": _finish_reason_name(finish_reason),
+                "usage": _usage_to_dict(usage),
+            }
+            if session_id:
+                done_frame["session_id"] = session_id
+            yield _ndjson_line(_add_partial_documents(done_frame, data))
+        except Exception as e:
+            print(f"Error while streaming Gemini response in /search/stream: {e}")
+            yield _ndjson_line({"type": "error", "error": f"An error occurred while contacting the AI service: {str(e)}"})
+
+    streamed = Response(
+        stream_with_context(generate()),
+        mimetype='application/x-ndjson',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'} # Disable proxy buffering so chunks reach the client immediately
+    )
+    # Frees the Gemini concurrency slot even if the client disconnects before the body is sent
+    streamed.call_on_close(response.close)
+    return streamed
+
+# --- Response cache statistics ---
+@api.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    stats = response_cache.stats()
+    stats['documents'] = doc_cache.stats()
+    stats['images'] = image_cache.stats()
+    return jsonify(stats)
+
+# --- Prometheus metrics (see metrics.py) ---
+# Cache and Gemini limiter numbers are read from the components when /metrics is scraped
+metrics.register_cache('response', response_cache.stats)
+metrics.register_cache('documents', doc_cache.stats)
+metrics.register_cache('images', image_cache.stats)
+metrics.register_cache('translation-memory', translation_memory.stats)
+metrics.register_cache('ocr', ocr_cache.stats)
+metrics.register_gemini_client('flask', gemini)
+
+@api.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    body, content_type = metrics.render()
+    return Response(body, content_type=content_type)
+
+# --- Conversation session management ---
+@api.route('/sessions/<session_id>', methods=['DELETE'])
+def delete_session(session_id):
+    if not session_store.delete(session_id):
+        return jsonify({"error": "Session not found"}), 404
+    return jsonify({"deleted": session_id})
+
+# --- Background jobs (see jobs.py) ---
+# /upload-doc, /images-to-pdf and /process-image accept "async=true" (or a "Prefer: respond-async"
+# header) and answer 202 with a job id. Poll GET /jobs/<id>, or follow GET /jobs/<id>/events
+# (NDJSON status frames until the job finishes), then fetch GET /jobs/<id>/result.
+job_queue = JobQueue()
+JOB_EVENTS_POLL_SECONDS = float(os.getenv('JOB_EVENTS_POLL_SECONDS', '1'))
+
+def _wants_async():
+    return request.form.get('async', 'false').lower() == 'true' or 'respond-async' in request.headers.get('Prefer', '')
+
+def _spool_uploads(files):
+    # Jobs outlive the request, so uploads are saved to disk (in the job directory, so
+    # handing them to the job is a rename)
+    paths = []
+    for file in files:
+        fd, path = tempfile.mkstemp(suffix=os.path.splitext(file.filename or '')[1].lower(), dir=job_queue.job_dir)
+        os.close(fd)
+        file.save(path)
+        paths.append(path)
+    return paths
+
+def _submit_job(kind, fn, inputs=(), total=None):
+    # Returns the 202 reply, or a 503 (and removes the spooled inputs) when the queue is full
+    try:
+        job_id = job_queue.submit(kind, fn, inputs, total)
+    except JobQueueFull as e:
+        for path in inputs:
+            if os.path.exists(path):
+                os.remove(path)
+        return jsonify({"error": str(e)}), 503, {'Retry-After': '5'}
+
+    status_url = f"/jobs/{job_id}"
+    response = jsonify({
+        "jobId": job_id,
+        "status": "queued",
+        "statusUrl": status_url,
+        "eventsUrl": f"{status_url}/events",
+        "resultUrl": f"{status_url}/result"
+    })
+    response.status_code = 202
+    response.headers['Location'] = status_url
+    return response
+
+@api.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    response = jsonify(job_status(job))
+    if job['status'] not in FINISHED_STATES:
+        response.headers['Retry-After'] = '1'
+    return response
+
+@api.route('/jobs/<job_id>', methods=['DELETE'])
+def delete_job(job_id):
+    # Cancels a queued job, or discards a finished one and its result
+    if job_queue.get(job_id) is None:
+        return jsonify({"error": "Job not found"}), 404
+    if not job_queue.delete(job_id):
+        return jsonify({"error": "Job is running and can't be cancelled; delete it once it has finished"}), 409
+    return jsonify({"deleted": job_id})
+
+@api.route('/jobs/<job_id>/result', methods=['GET'])
+def get_job_result(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    if job['status'] == FAILED:
+        return jsonify({"error": job['error']}), job['error_status']
+    if job['status'] != SUCCEEDED:
+        return jsonify(dict(job_status(job), error="Job has not finished yet")), 409, {'Retry-After': '1'}
+    if job['result_file']:
+        result_file = json.loads(job['result_file'])
+        return send_file(result_file['path'], mimetype=result_file['mimetype'], as_attachment=True, download_name=result_file['downloadName'])
+    return Response(job['result_json'], mimetype='application/json')
+
+@api.route('/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    if job_queue.get(job_id) is None:
+        return jsonify({"error": "Job not found"}), 404
+
+    def generate():
+        last_status = None
+        while True:
+            version = job_queue.version
+            job = job_queue.get(job_id)
+            if job is None:
+                yield _ndjson_line({"type": "error", "error": "Job not found"})
+                return
+            status = job_status(job)
+            if status != last_status:
+                yield _ndjson_line(dict(status, type="status"))
+                last_status = status
+            if job['status'] in FINISHED_STATES:
+                return
+            job_queue.wait_for_update(version, JOB_EVENTS_POLL_SECONDS)
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='application/x-ndjson',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+# --- /search-image helpers (shared with asgi.py) ---
+# The description doesn't depend on the query, so editing the query reuses it
+SEARCH_IMAGE_PROMPT = "Describe this image briefly for a search query, focusing on the main subject."
+# Make sure safety settings allow content generation
+SEARCH_IMAGE_SAFETY_SETTINGS = {'HARASSMENT':'block_none', 'HATE_SPEECH':'block_none', 'SEXUAL':'block_none', 'DANGEROUS':'block_none'}
+
+def _image_description_cache_key(image_sha256):
+    # Keyed on the original upload, so a hit skips downscaling too
+    return make_cache_key(GEMINI_MODEL, [SEARCH_IMAGE_PROMPT, SEARCH_IMAGE_MAX_SIDE], image_sha256=image_sha256)
+
+def _image_keywords(response):
+    # Returns (keywords, error) where error is (message, status_code)
+    # Add robust error checking for the response
+    if not response or not response.candidates:
+         print("Backend Error: No response or candidates from Gemini.")
+         # Check response.prompt_feedback for blocking reasons
+         if response and response.prompt_feedback:
+             print(f"Backend: Prompt Feedback: {response.prompt_feedback}")
+             block_reason = getattr(response.prompt_feedback, 'block_reason', None)
+             if block_reason:
+                 return None, (f'Image analysis blocked: {block_reason}', 400)
+         return None, ('Failed to analyze image with AI', 500)
+
+    # Check if the first candidate has content and parts
+    candidate = response.candidates[0]
+    if not candidate.content or not candidate.content.parts:
+         print("Backend Error: No content parts in Gemini response.")
+         # Check finish_reason
+         finish_reason = getattr(candidate, 'finish_reason', None)
+         if finish_reason and finish_reason != 1: # 1 is typically 'STOP'
+             print(f"Backend: Generation finished unexpectedly: {finish_reason}")
+             return None, (f'Image analysis failed: {finish_reason}', 500)
+         return None, ('AI could not generate description from image', 500)
+
+    return candidate.content.parts[0].text, None
+
+def _image_search_url(query, keywords):
+    # Combine original query with extracted keywords for better results
+    search_query = f"{query} {keywords}"
+    encoded_query = urllib.parse.quote_plus(search_query)
+    return f"https://www.google.com/search?tbm=isch&q={encoded_query}"
+
 # --- New /search-image endpoint --- 
-@app.route('/search-image', methods=['POST'])
+@api.route('/search-image', methods=['POST'])
 def handle_search_image():
     print("Backend: /search-image endpoint hit") # Log entry
     # --- ADD CHECK FOR GEMINI API KEY --- 
-    if not GEMINI_API_KEY:
+    if not gemini.available:
         print("Backend Error: Gemini API key not configured for /search-image")
         return jsonify({'error': 'AI Service not configured'}), 503
         
@@ -117,105 +523,261 @@ def handle_search_image():
     try:
         # --- 1. Image Processing (Example: Extract keywords with Gemini) ---
         print("Backend: Processing image with AI...") # Log step
-        image_bytes = image_file.read()
+        # Hashed and decoded from the spooled upload; only images sent as-is are read into memory
+        image_stream = image_file.stream
+
+        # Identical image: reuse the previous description
+        use_cache = _response_cache_enabled('search-image', request.form.get('cache', True))
+        cache_key = _image_description_cache_key(stream_sha256(image_stream))
+        cached_keywords = response_cache.get('search-image', cache_key) if use_cache else None
+        if cached_keywords is not None:
+            print("Backend: Using cached image description")
+            return jsonify({'searchUrl': _image_search_url(query, cached_keywords)})
         
-        # --- INITIALIZE THE MODEL HERE --- 
-        model = genai.GenerativeModel('gemini-1.5-flash') 
-        
-        # Ensure the model is initialized (assuming 'model' is your Gemini model variable)
-        # This check is now less critical as we initialize above, but keep for safety
-        if not model:
-             print("Backend Error: Gemini model could not be initialized") # Updated message
-             return jsonify({'error': 'AI Model not available'}), 503
-
         # Example Gemini call (adapt to your actual implementation)
-        image_part = {"mime_type": image_file.mimetype, "data": image_bytes}
-        prompt = f"Describe this image briefly for a search query, focusing on the main subject. Query context: {query}"
+        upload_bytes, upload_mimetype = downscale_for_upload(image_stream, image_file.mimetype)
+        print(f"Backend: Sending {len(upload_bytes)} bytes to Gemini")
+        image_part = {"mime_type": upload_mimetype, "data": upload_bytes}
         
-        # Make sure safety settings allow content generation
-        response = model.generate_content([prompt, image_part], stream=False, safety_settings={'HARASSMENT':'block_none', 'HATE_SPEECH':'block_none', 'SEXUAL':'block_none', 'DANGEROUS':'block_none'})
-        
-        # Add robust error checking for the response
-        if not response or not response.candidates:
-             print("Backend Error: No response or candidates from Gemini.")
-             # Check response.prompt_feedback for blocking reasons
-             if response and response.prompt_feedback:
-                 print(f"Backend: Prompt Feedback: {response.prompt_feedback}")
-                 block_reason = getattr(response.prompt_feedback, 'block_reason', None)
-                 if block_reason:
-                     return jsonify({'error': f'Image analysis blocked: {block_reason}'}), 400
-             return jsonify({'error': 'Failed to analyze image with AI'}), 500
-
-        # Check if the first candidate has content and parts
-        candidate = response.candidates[0]
-        if not candidate.content or not candidate.content.parts:
-             print("Backend Error: No content parts in Gemini response.")
-             # Check finish_reason
-             finish_reason = getattr(candidate, 'finish_reason', None)
-             if finish_reason and finish_reason != 1: # 1 is typically 'STOP'
-                 print(f"Backend: Generation finished unexpectedly: {finish_reason}")
-                 return jsonify({'error': f'Image analysis failed: {finish_reason}'}), 500
-             return jsonify({'error': 'AI could not generate description from image'}), 500
-
-        extracted_keywords = candidate.content.parts[0].text
+        response = gemini.generate_content('search-image', [SEARCH_IMAGE_PROMPT, image_part], stream=False, safety_settings=SEARCH_IMAGE_SAFETY_SETTINGS)
+        extracted_keywords, error = _image_keywords(response)
+        if error:
+            return jsonify({'error': error[0]}), error[1]
+
         print(f"Backend: Extracted keywords: {extracted_keywords}") # Log keywords
+        if use_cache:
+            response_cache.set('search-image', cache_key, extracted_keywords)
 
         # --- 2. Construct Google Images Search URL ---
         print("Backend: Constructing search URL...") # Log step
-        # Combine original query with extracted keywords for better results
-        search_query = f"{query} {extracted_keywords}" 
-        encoded_query = urllib.parse.quote_plus(search_query)
-        search_url = f"https://www.google.com/search?tbm=isch&q={encoded_query}"
+        search_url = _image_search_url(query, extracted_keywords)
         print(f"Backend: Generated search URL: {search_url}") # Log URL
 
         # --- 3. Return the URL ---
         return jsonify({'searchUrl': search_url})
 
-    except genai.types.BlockedPromptException as bpe:
+    except BlockedPromptError as bpe:
          print(f"Backend Error: Prompt blocked during image search - {bpe}")
          return jsonify({'error': f'Image search blocked by safety filters: {bpe}'}), 400
+    except GeminiError as e:
+        print(f"Backend Error: Gemini unavailable for /search-image - {e}")
+        return jsonify({'error': e.message}), e.status_code
     except Exception as e:
         print(f"Backend Error: Unexpected error in /search-image: {e}") # Log the exception
         traceback.print_exc() # Print detailed traceback to backend console
         return jsonify({'error': 'An unexpected error occurred on the server during image search.'}), 500
 
 # --- New /upload-doc endpoint --- 
-@app.route('/upload-doc', methods=['POST'])
+# Accepts PDF, DOCX, image (OCR'd) and plain text/markdown files, detected from the file's
+# contents (see doc_formats.py). DOCX and text files come back split into sections, which
+# take the place of pages everywhere below.
+# Optional form fields:
+#   pages  - 1-based page selection, e.g. "1-5,8,10-"
+#   engine - PDF text extraction engine: 'pymupdf', 'pdfplumber' or 'pypdf2' (default: PDF_ENGINE)
+#   ocr    - 'auto' (default) OCRs pages that have no text layer, 'off' disables it (and images)
+#   ocr_dpi - render resolution for OCR'd pages (default: OCR_DPI)
+#   stream - "true" to get NDJSON back: a {"type": "meta"} frame, one {"type": "page", "page", "text"}
+#            frame per page in order, then {"type": "done"} (or {"type": "error"})
+#   sha256 - hex SHA-256 of the file. Sent *without* a file it asks for a cached result only:
+#            404 means "not cached, upload the file".
+#   async  - "true" to run the extraction as a background job: 202 with a job id (see /jobs).
+#            Cached documents are still answered straight away.
+@api.route('/upload-doc', methods=['POST'])
 def upload_doc():
     try:
+        try:
+            options = _document_options(request.form)
+        except ValueError as option_error:
+            return jsonify({"error": str(option_error)}), 400
+        stream = request.form.get('stream', 'false').lower() == 'true'
+
         if 'file' not in request.files:
-            return jsonify({"error": "No file provided"}), 400
+            sha256 = request.form.get('sha256', '').lower()
+            if not sha256:
+                return jsonify({"error": "No file provided"}), 400
+            if not SHA256_PATTERN.fullmatch(sha256):
+                return jsonify({"error": "Invalid 'sha256' value"}), 400
+            cached = doc_cache.get_json(_document_cache_key(sha256, options))
+            if cached is None:
+                return jsonify({"error": "Document not in cache, upload the file", "cached": False}), 404
+            return _document_response(cached, sha256, stream, cached=True)
 
         file = request.files['file']
 
-        # Check if the file is a PDF
-        if file.mimetype == 'application/pdf':
-            try:
-                # Read the PDF file from the stream
-                pdf_stream = io.BytesIO(file.read())
-                reader = PdfReader(pdf_stream)
-                extracted_text = ""
-                for page in reader.pages:
-                    extracted_text += page.extract_text() + "\n" # Add newline between pages
-                
-                if not extracted_text:
-                     return jsonify({"response": "Could not extract text from the PDF (it might be image-based or empty)."})
-                
-                # Return the extracted text
-                return jsonify({"extracted_text": extracted_text})
-            except Exception as pdf_error:
-                print(f"Error processing PDF: {pdf_error}")
-                return jsonify({"error": f"Failed to process PDF file: {str(pdf_error)}"}), 500
-        else:
-            # Handle other file types later if needed
-            return jsonify({"error": "Unsupported file type. Currently only PDF is supported."}), 415
+        # Parsers open the file by path, so spool the upload to a temp file instead of a BytesIO
+        suffix = os.path.splitext(file.filename or '')[1].lower()
+        fd, upload_path = tempfile.mkstemp(suffix=suffix, dir=job_queue.job_dir if _wants_async() else None)
+        os.close(fd)
+        document = None
+        try:
+            sha256 = save_upload(file, upload_path)
+            cache_key = _document_cache_key(sha256, options)
+            cached = doc_cache.get_json(cache_key)
+            if cached is not None:
+                os.remove(upload_path)
+                return _document_response(cached, sha256, stream, cached=True)
+
+            document = open_document(upload_path, file.filename, file.mimetype, options['engine'], ocr=options['ocr'] != 'off')
+            page_indexes = parse_page_range(options['pages'], document.page_count)
+        except DocumentError as document_error:
+            os.remove(upload_path)
+            return jsonify({"error": document_error.message}), document_error.status_code
+        except ValueError as range_error:
+            os.remove(upload_path)
+            return jsonify({"error": str(range_error)}), 400
+        except Exception as document_error:
+            os.remove(upload_path)
+            label = FORMAT_LABELS[document.format] if document else 'uploaded'
+            print(f"Error processing {label} file: {document_error}")
+            return jsonify({"error": f"Failed to process {label} file: {str(document_error)}"}), 500
+
+        if _wants_async():
+            return _submit_job(
+                'upload-doc',
+                lambda job: _extract_document_job(job, document, sha256, cache_key, page_indexes, options),
+                inputs=[upload_path], total=len(page_indexes)
+            )
+        if stream:
+            return _stream_document_pages(document, sha256, cache_key, page_indexes, options)
+
+        try:
+            result = _new_document_result(document)
+            for index, text, used_ocr in _iter_document_pages(document, sha256, page_indexes, options):
+                result["pages"].append({"page": index + 1, "text": text, "ocr": used_ocr})
+            doc_cache.set_json(cache_key, result)
+            return _document_response(result, sha256, stream=False, cached=False)
+        except Exception as document_error:
+            print(f"Error processing {FORMAT_LABELS[document.format]} file: {document_error}")
+            return jsonify({"error": f"Failed to process {FORMAT_LABELS[document.format]} file: {str(document_error)}"}), 500
+        finally:
+            os.remove(upload_path)
 
     except Exception as e:
         print(f"Error during file upload in /upload-doc: {e}")
         return jsonify({"error": f"An error occurred during file upload: {str(e)}"}), 500
 
+SHA256_PATTERN = re.compile(r'[0-9a-f]{64}')
+
+def _document_options(form):
+    # Everything that changes extraction output; part of the cache key
+    ocr_mode = form.get('ocr', 'auto').lower()
+    if ocr_mode not in ('auto', 'off'):
+        raise ValueError("Invalid 'ocr' option. Use 'auto' or 'off'.")
+    try:
+        ocr_dpi = clamp_dpi(form.get('ocr_dpi', OCR_DPI))
+    except ValueError:
+        raise ValueError("'ocr_dpi' must be an integer")
+    return {
+        'engine': get_engine(form.get('engine')).name,
+        'pages': "".join(form.get('pages', '').split()),
+        'ocr': ocr_mode,
+        'ocr_dpi': ocr_dpi,
+    }
+
+def _document_cache_key(sha256, options):
+    return make_doc_cache_key('upload-doc', sha256, options)
+
+def _index_document(sha256, result):
+    # The content hash doubles as the document id for /search's 'document_ids'; uploads of
+    # different page ranges or options are merged into the same indexed document
+    if any(page['text'].strip() for page in result['pages']):
+        doc_index.add(sha256, result['pages'], page_count=result['pageCount'])
+
+def _new_document_result(document):
+    # What gets cached for an upload; results cached before other formats were accepted have no 'format'
+    return {"pageCount": document.page_count, "engine": document.engine, "format": document.format, "pages": []}
+
+def _document_body(result, sha256, cached):
+    extracted_text = "".join(page['text'] + "\n" for page in result['pages']) # Add newline between pages
+    doc_format = result.get('format', PDF)
+    if not extracted_text.strip():
+        if doc_format == PDF:
+            return {"response": "Could not extract text from the PDF (it might be image-based or empty).", "sha256": sha256}
+        return {"response": f"Could not extract text from the {FORMAT_LABELS[doc_format]} file (it might be empty).", "sha256": sha256}
+
+    return {
+        "extracted_text": extracted_text,
+        "pageCount": result['pageCount'],
+        "pages": len(result['pages']),
+        "ocrPages": sum(1 for page in result['pages'] if page['ocr']),
+        "engine": result['engine'],
+        "format": doc_format,
+        "sha256": sha256,
+        "document_id": sha256,
+        "cached": cached
+    }
+
+def _document_response(result, sha256, stream, cached):
+    # Builds the /upload-doc reply from a stored extraction result
+    _index_document(sha256, result)
+    if stream:
+        def replay():
+            yield _ndjson_line({"type": "meta", "pageCount": result['pageCount'], "pages": len(result['pages']),
+                                "engine": result['engine'], "format": result.get('format', PDF),
+                                "sha256": sha256, "document_id": sha256, "cached": cached})
+            for page in result['pages']:
+                yield _ndjson_line(dict(page, type="page"))
+            yield _ndjson_line({"type": "done", "pages": len(result['pages'])})
+        return Response(replay(), mimetype='application/x-ndjson')
+
+    # Return the extracted text
+    return jsonify(_document_body(result, sha256, cached))
+
+def _extract_document_job(job, document, sha256, cache_key, page_indexes, options):
+    # Background version of the /upload-doc extraction; the body matches the non-streamed reply
+    document.path = job.inputs[0] # Moved into the job's directory
+    result = _new_document_result(document)
+    for index, text, used_ocr in _iter_document_pages(document, sha256, page_indexes, options):
+        result["pages"].append({"page": index + 1, "text": text, "ocr": used_ocr})
+        job.progress(len(result["pages"]))
+    doc_cache.set_json(cache_key, result)
+    _index_document(sha256, result)
+    return _document_body(result, sha256, cached=False)
+
+def _iter_document_pages(document, sha256, page_indexes, options):
+    # Yields (page_index, text, used_ocr) in page order
+    if document.format == PDF:
+        return _iter_pdf_pages(document.path, sha256, page_indexes, options)
+    if document.format == IMAGE:
+        return iter_ocr_image(document.path, page_indexes, lambda: sha256)
+    return ((index, document.sections[index], False) for index in page_indexes)
+
+def _iter_pdf_pages(pdf_path, sha256, page_indexes, options):
+    # Yields (page_index, text, used_ocr) in page order
+    pages = iter_extract_pages(pdf_path, page_indexes, options['engine'])
+    if options['ocr'] == 'off':
+        return ((index, text, False) for index, text in pages)
+    return iter_with_ocr(pdf_path, pages, lambda: sha256, dpi=options['ocr_dpi'])
+
+def _stream_document_pages(document, sha256, cache_key, page_indexes, options):
+    def generate():
+        result = _new_document_result(document)
+        try:
+            yield _ndjson_line({"type": "meta", "pageCount": document.page_count, "pages": len(page_indexes),
+                                "engine": document.engine, "format": document.format,
+                                "sha256": sha256, "document_id": sha256, "cached": False})
+            for index, text, used_ocr in _iter_document_pages(document, sha256, page_indexes, options):
+                page = {"page": index + 1, "text": text, "ocr": used_ocr}
+                result["pages"].append(page)
+                yield _ndjson_line(dict(page, type="page"))
+            # Only complete extractions are cached and indexed
+            doc_cache.set_json(cache_key, result)
+            _index_document(sha256, result)
+            yield _ndjson_line({"type": "done", "pages": len(page_indexes)})
+        except Exception as document_error:
+            print(f"Error streaming {FORMAT_LABELS[document.format]} pages: {document_error}")
+            yield _ndjson_line({"type": "error", "error": f"Failed to process {FORMAT_LABELS[document.format]} file: {str(document_error)}"})
+        finally:
+            os.remove(document.path)
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='application/x-ndjson',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 # --- Weather Endpoint --- 
-@app.route('/get-weather', methods=['GET'])
+@api.route('/get-weather', methods=['GET'])
 def get_weather():
     location_query = request.args.get('location')
     api_key = os.getenv('ACCUWEATHER_API_KEY')
@@ -226,61 +788,17 @@ def get_weather():
     if not api_key:
         return jsonify({'error': 'AccuWeather API key not configured'}), 500
 
-    # 1. Get Location Key
-    location_url = f"http://dataservice.accuweather.com/locations/v1/cities/search"
-    location_params = {'apikey': api_key, 'q': location_query}
-    location_response = None
+    # Location keys and current conditions are cached inside the client,
+    # so most requests never leave the process (see weather_client.py)
     try:
-        location_response = requests.get(location_url, params=location_params)
-        location_response.raise_for_status()
-        location_data = location_response.json()
-        if not location_data:
-            return jsonify({'error': f'Location not found: {location_query}'}), 404
-        location_key = location_data[0]['Key']
-        location_name = f"{location_data[0]['LocalizedName']}, {location_data[0]['Country']['LocalizedName']}"
-    except requests.exceptions.RequestException as e:
-        print(f"Error fetching location key: {e}")
-        status_code = location_response.status_code if location_response is not None else 503
-        error_msg = 'Invalid AccuWeather API key or unauthorized access' if status_code == 401 else 'Failed to connect to AccuWeather Locations API'
-        return jsonify({'error': error_msg}), status_code
-    except (IndexError, KeyError) as e:
-        print(f"Error parsing location data: {e}")
-        return jsonify({'error': 'Unexpected response format from AccuWeather Locations API'}), 500
-
-    # 2. Get Current Conditions
-    conditions_url = f"http://dataservice.accuweather.com/currentconditions/v1/{location_key}"
-    conditions_params = {'apikey': api_key, 'details': 'true'}
-    conditions_response = None
-    try:
-        conditions_response = requests.get(conditions_url, params=conditions_params)
-        conditions_response.raise_for_status()
-        conditions_data = conditions_response.json()
-        if not conditions_data:
-             return jsonify({'error': 'No current conditions data available'}), 404
-        weather_info = {
-            'locationName': location_name,
-            'weatherText': conditions_data[0].get('WeatherText'),
-            'temperature': conditions_data[0].get('Temperature', {}).get('Metric', {}),
-            'realFeelTemperature': conditions_data[0].get('RealFeelTemperature', {}).get('Metric', {}),
-            'relativeHumidity': conditions_data[0].get('RelativeHumidity'),
-            'wind': conditions_data[0].get('Wind', {}).get('Speed', {}).get('Metric', {}),
-            'uvIndex': conditions_data[0].get('UVIndex'),
-            'uvIndexText': conditions_data[0].get('UVIndexText'),
-            # Add other fields as needed
-        }
-        return jsonify(weather_info)
-    except requests.exceptions.RequestException as e:
-        print(f"Error fetching current conditions: {e}")
-        status_code = conditions_response.status_code if conditions_response is not None else 503
-        error_msg = 'Invalid AccuWeather API key or unauthorized access' if status_code == 401 else 'Failed to connect to AccuWeather Current Conditions API'
-        return jsonify({'error': error_msg}), status_code
-    except (IndexError, KeyError) as e:
-        print(f"Error parsing conditions data: {e}")
-        return jsonify({'error': 'Unexpected response format from AccuWeather Current Conditions API'}), 500
+        return jsonify(get_weather_client().get_weather(location_query, api_key))
+    except WeatherError as e:
+        return jsonify({'error': e.message}), e.status_code
 
 # --- Translation Endpoint (Correct Placement) --- 
-@app.route('/translate', methods=['POST'])
+@api.route('/translate', methods=['POST'])
 def handle_translate():
+    translate_client = get_translate_client()
     if not translate_client:
         return jsonify({"error": "Translation service not available."}), 503
         
@@ -291,36 +809,119 @@ def handle_translate():
     text_to_translate = data['text']
     target_language = data['target_language']
     source_language = data.get('source_language', None)
+    if not isinstance(text_to_translate, str):
+        return jsonify({"error": "'text' must be a string"}), 400
     
     try:
-        result = translate_client.translate(
-            text_to_translate,
-            target_language=target_language,
-            source_language=source_language
-        )
-        
-        translated_text = result['translatedText']
-        detected_source_language = result.get('detectedSourceLanguage', source_language)
+        # Goes through the translation memory, so repeated strings skip the API; text too big
+        # for one API call is split at sentence/paragraph boundaries and translated concurrently
+        result = translate_texts(
+            translate_client,
+            [text_to_translate],
+            target_language,
+            source_language=source_language,
+            memory=translation_memory
+        )[0]
         
         return jsonify({
-            "translatedText": translated_text,
-            "detectedSourceLanguage": detected_source_language
+            "translatedText": result['translatedText'],
+            "detectedSourceLanguage": result['detectedSourceLanguage']
         })
         
     except Exception as e:
         print(f"Error during translation: {e}")
         return jsonify({"error": f"An error occurred during translation: {str(e)}"}), 500
 
-# --- Main execution --- 
-# Initialize Google Translate client (if not already done)
-try:
-    translate_client = translate.Client()
-except Exception as e:
-    print(f"Warning: Could not initialize Google Translate client: {e}")
-    translate_client = None
+# --- Long-text Translation Endpoint ---
+# Body: {"text": "...", "target_language": "hi", "source_language": optional, "stream": optional}
+# Without "stream" the reassembled translation is returned in one response. With "stream": true
+# the response is NDJSON: one {"type": "chunk", "index", "total", "completed", "translatedText", "separator"}
+# frame per chunk as it finishes (joining translatedText + separator in index order gives the
+# full text), then {"type": "done", ...} or {"type": "error", ...}.
+@api.route('/translate/long', methods=['POST'])
+def handle_translate_long():
+    translate_client = get_translate_client()
+    if not translate_client:
+        return jsonify({"error": "Translation service not available."}), 503
+
+    data = request.get_json()
+    if not data or 'text' not in data or 'target_language' not in data:
+        return jsonify({"error": "Missing 'text' or 'target_language' in request"}), 400
+
+    text_to_translate = data['text']
+    target_language = data['target_language']
+    source_language = data.get('source_language', None)
+    if not isinstance(text_to_translate, str):
+        return jsonify({"error": "'text' must be a string"}), 400
+
+    if not data.get('stream'):
+        try:
+            return jsonify(translate_long(translate_client, text_to_translate, target_language, source_language=source_language, memory=translation_memory))
+        except Exception as e:
+            print(f"Error during long-text translation: {e}")
+            return jsonify({"error": f"An error occurred during translation: {str(e)}"}), 500
+
+    def generate():
+        detected_source_language = source_language
+        completed = 0
+        total = 0
+        try:
+            for index, total, result in iter_translate_long(translate_client, text_to_translate, target_language, source_language=source_language, memory=translation_memory):
+                completed += 1
+                detected_source_language = detected_source_language or result['detectedSourceLanguage']
+                yield _ndjson_line({
+                    "type": "chunk",
+                    "index": index,
+                    "total": total,
+                    "completed": completed,
+                    "translatedText": result['translatedText'],
+                    "separator": result['separator'],
+                })
+            yield _ndjson_line({"type": "done", "total": total, "detectedSourceLanguage": detected_source_language})
+        except Exception as e:
+            print(f"Error during streamed long-text translation: {e}")
+            yield _ndjson_line({"type": "error", "error": f"An error occurred during translation: {str(e)}"})
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='application/x-ndjson',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+# --- Batch Translation Endpoint ---
+# Body: {"texts": ["...", ...], "target_language": "hi", "source_language": optional}
+# Returns {"translations": [{"translatedText": ..., "detectedSourceLanguage": ...}, ...]} in input order
+@api.route('/translate/batch', methods=['POST'])
+def handle_translate_batch():
+    translate_client = get_translate_client()
+    if not translate_client:
+        return jsonify({"error": "Translation service not available."}), 503
+
+    data = request.get_json()
+    if not data or 'texts' not in data or 'target_language' not in data:
+        return jsonify({"error": "Missing 'texts' or 'target_language' in request"}), 400
+
+    texts = data['texts']
+    if not isinstance(texts, list) or not all(isinstance(text, str) for text in texts):
+        return jsonify({"error": "'texts' must be a list of strings"}), 400
+    if len(texts) > TRANSLATE_BATCH_MAX_ITEMS:
+        return jsonify({"error": f"Maximum {TRANSLATE_BATCH_MAX_ITEMS} texts allowed per batch"}), 400
+
+    try:
+        translations = translate_texts(
+            translate_client,
+            texts,
+            data['target_language'],
+            source_language=data.get('source_language', None),
+            memory=translation_memory
+        )
+        return jsonify({"translations": translations})
+    except Exception as e:
+        print(f"Error during batch translation: {e}")
+        return jsonify({"error": f"An error occurred during translation: {str(e)}"}), 500
 
 # --- Add the new endpoint --- 
-@app.route('/images-to-pdf', methods=['POST'])
+@api.route('/images-to-pdf', methods=['POST'])
 def handle_images_to_pdf():
     if 'images' not in request.files:
         return jsonify({'error': 'No image files provided'}), 400
@@ -330,94 +931,57 @@ def handle_images_to_pdf():
     if not files:
         return jsonify({'error': 'No image files provided'}), 400
 
-    if len(files) > 10:
-        return jsonify({'error': 'Maximum 10 images allowed'}), 400
+    if len(files) > IMAGES_TO_PDF_MAX_FILES:
+        return jsonify({'error': f'Maximum {IMAGES_TO_PDF_MAX_FILES} images allowed'}), 400
 
-    allowed_extensions = {'png', 'jpg', 'jpeg', 'gif', 'bmp', 'tiff'}
-    
-    pdf_buffer = io.BytesIO()
-    c = canvas.Canvas(pdf_buffer, pagesize=A4)
-    width, height = A4 # Get A4 dimensions (page size)
+    for file in files:
+        if not has_allowed_extension(file.filename):
+            return jsonify({'error': f'Invalid file type: {file.filename}. Allowed types: {ALLOWED_IMAGE_EXTENSIONS}'}), 400
 
+    if _wants_async():
+        filenames = [file.filename for file in files]
+        return _submit_job('images-to-pdf', lambda job: _images_to_pdf_job(job, filenames), inputs=_spool_uploads(files), total=len(files))
+
+    # Pages are decoded/resized in parallel (see image_pdf.py); the PDF itself goes
+    # to a temp file once it outgrows IMAGES_TO_PDF_SPOOL_BYTES
+    pdf_file = tempfile.SpooledTemporaryFile(max_size=IMAGES_TO_PDF_SPOOL_BYTES)
     try:
-        for file in files:
-            filename = file.filename.lower() if file.filename else '' # Handle case where filename might be None
-            if '.' not in filename or filename.rsplit('.', 1)[1] not in allowed_extensions:
-                return jsonify({'error': f'Invalid file type: {file.filename}. Allowed types: {allowed_extensions}'}), 400
-
-            try:
-                img_data = file.read()
-                img = Image.open(io.BytesIO(img_data))
-                # Convert image to RGB if it has transparency (like PNG) to avoid potential issues with some PDF viewers
-                if img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info):
-                    img = img.convert('RGB')
-                    
-                img_width, img_height = img.size
-
-                # Calculate scaling factor to fit image within A4 page, maintaining aspect ratio
-                scale_w = width / img_width
-                scale_h = height / img_height
-                scale = min(scale_w, scale_h) # Use the smaller scale factor
-
-                # Calculate new dimensions based on scale factor
-                new_width = int(img_width * scale)
-                new_height = int(img_height * scale)
-
-                # --- High-Quality Resizing using Pillow --- 
-                if new_width > 0 and new_height > 0:
-                    # Use LANCZOS for best quality resizing
-                    resized_img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-                    
-                    # Save the resized image to a temporary buffer
-                    resized_img_buffer = io.BytesIO()
-                    # Determine format based on original, default to JPEG for broad compatibility if unknown
-                    original_format = img.format if img.format else 'JPEG'
-                    if original_format.upper() == 'PNG':
-                         resized_img.save(resized_img_buffer, format='PNG')
-                    else:
-                         # Use JPEG with high quality for other formats
-                         resized_img.save(resized_img_buffer, format='JPEG', quality=95) 
-                    resized_img_buffer.seek(0)
-                    
-                    # Center the image on the page
-                    x_offset = (width - new_width) / 2
-                    y_offset = (height - new_height) / 2
-
-                    # Draw the *resized* image data onto the PDF
-                    c.drawImage(ImageReader(resized_img_buffer), x_offset, y_offset, width=new_width, height=new_height, preserveAspectRatio=True)
-                # --- End of Resizing --- 
-                else:
-                    # Handle case of zero dimension if necessary, though unlikely with scaling
-                    print(f"Skipping image {file.filename} due to zero calculated dimension.")
-
-                c.showPage() # Move to the next page
-
-            except Exception as img_proc_error:
-                print(f"Error processing image {file.filename}: {img_proc_error}")
-                # Consider logging the full traceback here for debugging
-                # import traceback
-                # traceback.print_exc()
-                return jsonify({'error': f'Failed to process image: {file.filename}'}), 500
-
-        c.save()
-        pdf_buffer.seek(0)
-        
+        write_pdf(files, pdf_file)
+        pdf_file.seek(0)
+
         return send_file(
-            pdf_buffer,
+            pdf_file,
             mimetype='application/pdf',
             as_attachment=True,
             download_name='converted_document.pdf'
         )
 
+    except ImagePageError as img_proc_error:
+        pdf_file.close()
+        print(f"Error processing image {img_proc_error.filename}: {img_proc_error.cause}")
+        return jsonify({'error': f'Failed to process image: {img_proc_error.filename}'}), 500
     except Exception as e:
+        pdf_file.close()
         print(f"Error creating PDF: {e}")
-        # Consider logging the full traceback here
-        # import traceback
-        # traceback.print_exc()
+        traceback.print_exc()
         return jsonify({'error': 'Failed to create PDF document'}), 500
 
+def _images_to_pdf_job(job, filenames):
+    output_path = os.path.join(job.dir, 'converted_document.pdf')
+    uploads = [FileStorage(stream=open(path, 'rb'), filename=filename) for path, filename in zip(job.inputs, filenames)]
+    try:
+        with open(output_path, 'wb') as pdf_file:
+            write_pdf(uploads, pdf_file, on_page=job.progress)
+    except ImagePageError as img_proc_error:
+        print(f"Error processing image {img_proc_error.filename}: {img_proc_error.cause}")
+        raise JobError(f'Failed to process image: {img_proc_error.filename}', 500)
+    finally:
+        for upload in uploads:
+            upload.close()
+    return FileResult(output_path, 'application/pdf', 'converted_document.pdf')
+
 # --- New Image Processing Endpoint ---
-@app.route('/process-image', methods=['POST'])
+@api.route('/process-image', methods=['POST'])
 def process_image():
     if 'image' not in request.files:
         return jsonify({'error': 'No image file provided'}), 400
@@ -426,205 +990,360 @@ def process_image():
 
     # Get parameters from form data
     try:
-        target_width = request.form.get('width', type=int)
-        target_height = request.form.get('height', type=int)
-        quality = request.form.get('quality', default=90, type=int) # Default quality 90
-        # Handle boolean conversion for keep_aspect_ratio
-        keep_aspect_ratio_str = request.form.get('keep_aspect_ratio', 'true').lower()
-        keep_aspect_ratio = keep_aspect_ratio_str == 'true'
-        output_format = request.form.get('output_format', '').upper() # Default to original or JPEG
+        options = parse_image_options(request.form)
     except ValueError:
         return jsonify({'error': 'Invalid parameter type for width, height, or quality.'}), 400
 
-    allowed_formats = {'JPEG', 'PNG', 'WEBP'} # Add more if needed
-
     try:
-        img = Image.open(image_file.stream)
-        original_format = img.format if img.format else 'JPEG' # Keep original format or default to JPEG
-
-        if not output_format:
-            output_format = original_format
-        elif output_format not in allowed_formats:
-            return jsonify({'error': f'Unsupported output format: {output_format}. Supported formats: {allowed_formats}'}), 400
-        
-        # Handle RGBA to RGB conversion for JPEG and other formats that don't support alpha
-        if output_format in ['JPEG', 'JPG'] and img.mode in ('RGBA', 'LA', 'P'):
-            # If mode is P (palette) and has transparency, convert to RGBA first
-            if img.mode == 'P' and 'transparency' in img.info:
-                 img = img.convert('RGBA')
-            # Now convert RGBA/LA to RGB
-            if img.mode in ('RGBA', 'LA'):
-                 img = img.convert('RGB')
-
-
-        # --- Resizing ---
-        if target_width or target_height:
-            img_width, img_height = img.size
-            new_width, new_height = img_width, img_height
-
-            if keep_aspect_ratio:
-                if target_width and target_height:
-                    ratio = min(target_width / img_width, target_height / img_height)
-                    new_width = int(img_width * ratio)
-                    new_height = int(img_height * ratio)
-                elif target_width:
-                    new_width = target_width
-                    new_height = int(img_height * (target_width / img_width))
-                elif target_height:
-                    new_height = target_height
-                    new_width = int(img_width * (target_height / img_height))
-            else: # Not keeping aspect ratio
-                if target_width:
-                    new_width = target_width
-                if target_height:
-                    new_height = target_height
-            
-            if new_width > 0 and new_height > 0: # Ensure dimensions are positive
-                 img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-            else:
-                 print(f"Warning: Calculated new dimensions are not positive ({new_width}x{new_height}). Skipping resize.")
-
-
-        # --- Save to buffer ---
-        img_buffer = io.BytesIO()
-        save_params = {}
-        if output_format == 'JPEG':
-            save_params['quality'] = max(1, min(quality, 95)) # Pillow JPEG quality is 1-95
-            save_params['optimize'] = True
-        elif output_format == 'PNG':
-            save_params['optimize'] = True
-            # For PNG, 'quality' is not a direct Pillow save option in the same way as JPEG.
-            # PNG compression is lossless. We can use 'compress_level' (0-9, default 6)
-            # For simplicity, we won't expose compress_level unless requested.
-            # If 'quality' param was intended for PNG, it's a bit of a misnomer.
-            # We could map it to compress_level, e.g. quality < 10 -> compress_level=1, etc.
-            # Or just use default PNG compression. For now, using default.
-            pass
-
-
-        img.save(img_buffer, format=output_format, **save_params)
-        img_buffer.seek(0)
-
-        # Determine mimetype and download name
-        mimetype = f'image/{output_format.lower()}'
-        if output_format == 'JPG': # Common alternative for JPEG
-            mimetype = 'image/jpeg'
-            
-        download_filename = f"processed_image.{output_format.lower()}"
-        if image_file.filename:
-            base, _ = os.path.splitext(image_file.filename)
-            download_filename = f"{base}_processed.{output_format.lower()}"
-
-        return send_file(
-            img_buffer,
-            mimetype=mimetype,
+        output_format = resolve_output_format(image_file.stream, options)
+        etag = derived_image_key(stream_sha256(image_file.stream), options, output_format)
+        # The same source with the same settings always produces the same output
+        if request.if_none_match.contains(etag):
+            return Response(status=304, headers={'ETag': f'"{etag}"'})
+
+        image_bytes = image_cache.get(etag)
+        cache_status = 'HIT'
+        if image_bytes is None and _wants_async():
+            return _submit_job(
+                'process-image',
+                lambda job: _process_image_job(job, options, etag, image_file.filename),
+                inputs=_spool_uploads([image_file]), total=1
+            )
+        if image_bytes is None:
+            image_bytes, output_format = process_image_data(image_file.stream, options)
+            image_cache.set(etag, image_bytes)
+            cache_status = 'MISS'
+
+        response = send_file(
+            io.BytesIO(image_bytes),
+            mimetype=output_mimetype(output_format),
             as_attachment=True,
-            download_name=download_filename
+            download_name=output_filename(image_file.filename, output_format),
+            etag=etag
         )
+        response.headers['X-Cache'] = cache_status
+        return response
 
+    except UnsupportedOutputFormat as format_error:
+        return jsonify({'error': str(format_error)}), 400
     except FileNotFoundError:
         return jsonify({'error': 'Image file not found after upload (internal error)'}), 500
     except UnidentifiedImageError: # From Pillow if file is not a valid image
-        return jsonify({'error': 'Cannot identify image file. The file may be corrupt or an unsupported format.'}), 400
+        return jsonify({'error': UNIDENTIFIED_IMAGE_MESSAGE}), 400
     except Exception as e:
         print(f"Error processing image: {e}")
         traceback.print_exc()
         return jsonify({'error': f'Failed to process image: {str(e)}'}), 500
 
+def _process_image_job(job, options, etag, filename):
+    try:
+        image_bytes, output_format = process_image_data(job.inputs[0], options)
+    except UnidentifiedImageError:
+        raise JobError(UNIDENTIFIED_IMAGE_MESSAGE, 400)
+    image_cache.set(etag, image_bytes)
+    download_name = output_filename(filename, output_format)
+    output_path = os.path.join(job.dir, download_name)
+    with open(output_path, 'wb') as output:
+        output.write(image_bytes)
+    job.progress(1)
+    return FileResult(output_path, output_mimetype(output_format), download_name)
+
+def _detach_uploads(files):
+    # Flask closes request.files as soon as the view returns, before a streamed body is
+    # generated. Move the underlying streams into new FileStorage objects owned by the
+    # generator (which must close them) and leave empty buffers behind for Flask to close.
+    detached = []
+    for file in files:
+        detached.append(FileStorage(stream=file.stream, filename=file.filename, content_type=file.content_type))
+        file.stream = io.BytesIO()
+    return detached
+
+# --- Batch Image Processing Endpoint ---
+# Same form parameters as /process-image, applied to every file in 'images'.
+# Streams back a ZIP archive, adding each image as soon as it has been processed;
+# images that fail are listed in errors.json inside the archive.
+@api.route('/process-image/batch', methods=['POST'])
+def process_image_batch():
+    files = request.files.getlist('images')
+    if not files:
+        return jsonify({'error': 'No image files provided'}), 400
+    if len(files) > IMAGE_BATCH_MAX_FILES:
+        return jsonify({'error': f'Maximum {IMAGE_BATCH_MAX_FILES} images allowed'}), 400
+
+    try:
+        options = parse_image_options(request.form)
+    except ValueError:
+        return jsonify({'error': 'Invalid parameter type for width, height, or quality.'}), 400
+    if options['output_format'] and options['output_format'] not in ALLOWED_OUTPUT_FORMATS:
+        return jsonify({'error': f"Unsupported output format: {options['output_format']}. Supported formats: {ALLOWED_OUTPUT_FORMATS}"}), 400
+
+    uploads = _detach_uploads(files)
+
+    def generate():
+        try:
+            yield from iter_zip_batch(uploads, options)
+        finally:
+            for upload in uploads:
+                upload.close()
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='application/zip',
+        headers={
+            'Content-Disposition': 'attachment; filename=processed_images.zip',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
+# --- /generate-email helpers (shared with asgi.py) ---
+EMAIL_GENERATION_CONFIG = {'response_mime_type': 'application/json'}
+# Define available tones to validate against and use in prompt
+EMAIL_TONES = ['Formal', 'Informal', 'Persuasive', 'Appreciative', 'Apologetic', 'Inquiring', 'Friendly', 'Assertive']
+EMAIL_FIELDS = ('purpose', 'tone', 'recipient_type', 'key_info', 'call_to_action', 'sender_name')
+
+# The fixed parts of every email prompt, built once
+EMAIL_PROMPT_PREAMBLE = "\n".join([
+    "You are an expert email writing assistant.",
+    "Your task is to generate a professional and effective email based on the user's requirements.",
+    "Please generate a subject line and an email body."
+])
+EMAIL_PROMPT_OUTPUT_FORMAT = "\n".join([
+    "Output the result as a JSON object with two keys: 'subject' and 'body'.",
+    "Example JSON output: {\"subject\": \"Generated Subject\", \"body\": \"Dear recipient,\\n\\nEmail content here.\\n\\nRegards,\\nSender\"}"
+])
+
+def _build_email_prompt(data):
+    # Returns (prompt, error) where error is (message, status_code)
+    purpose = data.get('purpose')
+    tone = data.get('tone')
+    recipient_type = data.get('recipient_type', '') # Optional
+    key_info = data.get('key_info', '') # Optional
+    call_to_action = data.get('call_to_action', '') # Optional
+    sender_name = data.get('sender_name', '') # Optional
+
+    if not purpose or not tone:
+        return None, ("'purpose' and 'tone' are required fields.", 400)
+
+    if tone not in EMAIL_TONES:
+        return None, (f"Invalid tone. Available tones are: {', '.join(EMAIL_TONES)}", 400)
+
+    prompt_parts = [
+        EMAIL_PROMPT_PREAMBLE,
+        "The email should be written in a " + tone + " tone.",
+        "The main purpose of the email is: " + purpose + "."
+    ]
+
+    if recipient_type:
+        prompt_parts.append(f"The email is intended for a {recipient_type}.")
+    if key_info:
+        prompt_parts.append(f"Ensure the following key information is included: {key_info}.")
+    if call_to_action:
+        prompt_parts.append(f"The desired call to action for the recipient is: {call_to_action}.")
+    if sender_name:
+        prompt_parts.append(f"The email should be signed off as from {sender_name} if a closing is generated.")
+    else:
+        prompt_parts.append("If a closing is generated, use a generic placeholder like '[Your Name]' for the sender.")
+
+    prompt_parts.append(EMAIL_PROMPT_OUTPUT_FORMAT)
+
+    return "\n".join(prompt_parts), None
+
+def _email_cache_key(prompt):
+    return make_cache_key(GEMINI_MODEL, prompt, EMAIL_GENERATION_CONFIG)
+
+def _parse_email_response(response):
+    # Returns (email_content, error) where error is (message, status_code)
+    # print(f"DEBUG: Gemini Response text:\n{response.text}") # For debugging
+
+    # Assuming Gemini returns a valid JSON string as response.text due to response_mime_type config
+    # No need to manually parse if the API handles it directly into response.parts[0].json
+    # However, the SDK structure might still put the JSON string into response.text initially.
+    # Let's be safe and parse if it's a string.
+    if response.text:
+        try:
+            email_content = json.loads(response.text)
+            if not isinstance(email_content, dict) or 'subject' not in email_content or 'body' not in email_content:
+                raise ValueError("JSON output from AI is not in the expected format (missing subject or body).")
+            return email_content, None
+        except json.JSONDecodeError as json_err:
+            print(f"Error decoding JSON from Gemini: {json_err}")
+            print(f"Raw response from Gemini: {response.text}")
+            return None, ("Failed to parse AI response as JSON. The AI may not have returned the expected structure.", 500)
+        except ValueError as val_err:
+            print(f"Validation Error: {val_err}")
+            print(f"Raw response from Gemini: {response.text}")
+            return None, (str(val_err), 500)
+    # Check prompt feedback for blocking reasons if response is empty
+    if response.prompt_feedback:
+         print(f"Backend: Prompt Feedback: {response.prompt_feedback}")
+         block_reason = getattr(response.prompt_feedback, 'block_reason', None)
+         if block_reason:
+             return None, (f'Email generation blocked by content filters: {block_reason}', 400)
+    return None, ("AI service returned an empty response.", 500)
+
+def _generate_email(prompt, use_cache):
+    # Returns (email_content, cached, error) where error is (message, status_code). Raises GeminiError.
+    cache_key = _email_cache_key(prompt)
+    cached_email = response_cache.get('generate-email', cache_key) if use_cache else None
+    if cached_email is not None:
+        return cached_email, True, None
+
+    response = gemini.generate_content('generate-email', prompt, EMAIL_GENERATION_CONFIG)
+    email_content, error = _parse_email_response(response)
+    if error:
+        return None, False, error
+    if use_cache:
+        response_cache.set('generate-email', cache_key, email_content)
+    return email_content, False, None
+
 # --- New AI Email Generator Endpoint ---
-@app.route('/generate-email', methods=['POST'])
+@api.route('/generate-email', methods=['POST'])
 def generate_email():
-    if not GEMINI_API_KEY:
+    if not gemini.available:
         return jsonify({"error": "AI Service not configured."}), 503
 
     try:
         data = request.json
-        purpose = data.get('purpose')
-        tone = data.get('tone')
-        recipient_type = data.get('recipient_type', '') # Optional
-        key_info = data.get('key_info', '') # Optional
-        call_to_action = data.get('call_to_action', '') # Optional
-        sender_name = data.get('sender_name', '') # Optional
-
-        if not purpose or not tone:
-            return jsonify({"error": "'purpose' and 'tone' are required fields."}), 400
-
-        # Define available tones to validate against and use in prompt
-        available_tones = ['Formal', 'Informal', 'Persuasive', 'Appreciative', 'Apologetic', 'Inquiring', 'Friendly', 'Assertive']
-        if tone not in available_tones:
-            return jsonify({"error": f"Invalid tone. Available tones are: {', '.join(available_tones)}"}), 400
-
-        model = genai.GenerativeModel(
-            'gemini-1.5-flash',
-            generation_config=genai.types.GenerationConfig(
-                response_mime_type="application/json"
-            )
-        )
-
-        prompt_parts = [
-            "You are an expert email writing assistant.",
-            "Your task is to generate a professional and effective email based on the user's requirements.",
-            "Please generate a subject line and an email body.",
-            "The email should be written in a " + tone + " tone.",
-            "The main purpose of the email is: " + purpose + "."
-        ]
-
-        if recipient_type:
-            prompt_parts.append(f"The email is intended for a {recipient_type}.")
-        if key_info:
-            prompt_parts.append(f"Ensure the following key information is included: {key_info}.")
-        if call_to_action:
-            prompt_parts.append(f"The desired call to action for the recipient is: {call_to_action}.")
-        if sender_name:
-            prompt_parts.append(f"The email should be signed off as from {sender_name} if a closing is generated.")
-        else:
-            prompt_parts.append("If a closing is generated, use a generic placeholder like '[Your Name]' for the sender.")
-
-        prompt_parts.extend([
-            "Output the result as a JSON object with two keys: 'subject' and 'body'.",
-            "Example JSON output: {\"subject\": \"Generated Subject\", \"body\": \"Dear recipient,\\n\\nEmail content here.\\n\\nRegards,\\nSender\"}"
-        ])
-        
-        prompt = "\n".join(prompt_parts)
+        prompt, error = _build_email_prompt(data)
+        if error:
+            return jsonify({"error": error[0]}), error[1]
 
         # print(f"DEBUG: Gemini Prompt for email generation:\n{prompt}") # For debugging
 
-        response = model.generate_content(prompt)
-        
-        # print(f"DEBUG: Gemini Response text:\n{response.text}") # For debugging
-
-        # Assuming Gemini returns a valid JSON string as response.text due to response_mime_type config
-        # No need to manually parse if the API handles it directly into response.parts[0].json
-        # However, the SDK structure might still put the JSON string into response.text initially.
-        # Let's be safe and parse if it's a string.
-        if response.text:
-            try:
-                email_content = json.loads(response.text)
-                if not isinstance(email_content, dict) or 'subject' not in email_content or 'body' not in email_content:
-                    raise ValueError("JSON output from AI is not in the expected format (missing subject or body).")
-                return jsonify(email_content)
-            except json.JSONDecodeError as json_err:
-                print(f"Error decoding JSON from Gemini: {json_err}")
-                print(f"Raw response from Gemini: {response.text}")
-                return jsonify({"error": "Failed to parse AI response as JSON. The AI may not have returned the expected structure."}), 500
-            except ValueError as val_err:
-                print(f"Validation Error: {val_err}")
-                print(f"Raw response from Gemini: {response.text}")
-                return jsonify({"error": str(val_err)}), 500
-        else:
-            # Check prompt feedback for blocking reasons if response is empty
-            if response.prompt_feedback:
-                 print(f"Backend: Prompt Feedback: {response.prompt_feedback}")
-                 block_reason = getattr(response.prompt_feedback, 'block_reason', None)
-                 if block_reason:
-                     return jsonify({'error': f'Email generation blocked by content filters: {block_reason}'}), 400
-            return jsonify({"error": "AI service returned an empty response."}), 500
+        # Repeated templates come straight from the cache
+        use_cache = _response_cache_enabled('generate-email', data.get('cache', True))
+        email_content, _, error = _generate_email(prompt, use_cache)
+        if error:
+            return jsonify({"error": error[0]}), error[1]
+        return jsonify(email_content)
 
+    except GeminiError as e:
+        print(f"Gemini unavailable for email generation: {e}")
+        return jsonify({"error": e.message}), e.status_code
     except Exception as e:
         print(f"Error during email generation: {e}")
         traceback.print_exc()
         return jsonify({"error": f"An unexpected error occurred on the server during email generation: {str(e)}"}), 500
 
+# --- Batch Email Generation Endpoint ---
+# Body: {"template": {purpose, tone, recipient_type, key_info, call_to_action, sender_name},
+#        "items": [{"id": optional, ...fields that override the template}, ...],   (optional)
+#        "tones": ["Formal", "Friendly", ...],   (optional: one variant per tone for every item)
+#        "concurrency": optional cap on parallel generations, "cache": optional}
+# Streams NDJSON: a {"type": "meta", "total"} frame, then one frame per email as it completes,
+# either {"type": "email", "index", "id", "tone", "subject", "body", "cached"} or
+# {"type": "error", "index", "id", "tone", "error", "status"}, then {"type": "done", "succeeded", "failed"}.
+EMAIL_BATCH_MAX_EMAILS = int(os.getenv('EMAIL_BATCH_MAX_EMAILS', '500')) # items x tones per request
+EMAIL_BATCH_CONCURRENCY = int(os.getenv('EMAIL_BATCH_CONCURRENCY', '8'))
+
+def _email_batch_requests(data):
+    # Returns (email_requests, error) where error is (message, status_code)
+    template = data.get('template') or {}
+    items = data.get('items')
+    tones = data.get('tones')
+    if not isinstance(template, dict):
+        return None, ("'template' must be an object", 400)
+    if items is None and tones is None:
+        return None, ("Provide 'items' (per-recipient fields) and/or 'tones' (variants)", 400)
+    if items is not None and (not isinstance(items, list) or not items or not all(isinstance(item, dict) for item in items)):
+        return None, ("'items' must be a non-empty list of objects", 400)
+    if tones is not None and (not isinstance(tones, list) or not tones):
+        return None, ("'tones' must be a non-empty list", 400)
+
+    has_items = items is not None
+    items = items or [{}]
+    if len(items) * len(tones or [None]) > EMAIL_BATCH_MAX_EMAILS:
+        return None, (f"Maximum {EMAIL_BATCH_MAX_EMAILS} emails (items x tones) allowed per batch", 400)
+
+    shared_fields = {name: value for name, value in template.items() if name in EMAIL_FIELDS}
+    email_requests = []
+    for item_index, item in enumerate(items):
+        fields = dict(shared_fields, **{name: value for name, value in item.items() if name in EMAIL_FIELDS})
+        for tone in tones or [fields.get('tone')]:
+            prompt, error = _build_email_prompt(dict(fields, tone=tone))
+            if error:
+                return None, (f"items[{item_index}]: {error[0]}" if has_items else error[0], error[1])
+            email_requests.append({'index': len(email_requests), 'id': item.get('id', item_index), 'tone': tone, 'prompt': prompt})
+    return email_requests, None
+
+@api.route('/generate-email/batch', methods=['POST'])
+def generate_email_batch():
+    if not gemini.available:
+        return jsonify({"error": "AI Service not configured."}), 503
+
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "Request body must be a JSON object"}), 400
+    email_requests, error = _email_batch_requests(data)
+    if error:
+        return jsonify({"error": error[0]}), error[1]
+    try:
+        concurrency = max(1, min(int(data.get('concurrency', EMAIL_BATCH_CONCURRENCY)), EMAIL_BATCH_CONCURRENCY))
+    except (TypeError, ValueError):
+        return jsonify({"error": "'concurrency' must be an integer"}), 400
+    use_cache = _response_cache_enabled('generate-email', data.get('cache', True))
+
+    # Identical prompts (e.g. a recipient listed twice) are generated once
+    requests_by_prompt = {}
+    for email_request in email_requests:
+        requests_by_prompt.setdefault(email_request['prompt'], []).append(email_request)
+
+    def generate_one(prompt):
+        try:
+            return _generate_email(prompt, use_cache)
+        except GeminiError as e:
+            return None, False, (e.message, e.status_code)
+        except Exception as e:
+            print(f"Error during batch email generation: {e}")
+            return None, False, (f"An unexpected error occurred during email generation: {str(e)}", 500)
+
+    def generate():
+        succeeded = failed = 0
+        # Gemini calls still go through the shared client's limits; this only caps one batch's share
+        executor = ThreadPoolExecutor(max_workers=min(concurrency, len(requests_by_prompt)))
+        try:
+            yield _ndjson_line({"type": "meta", "total": len(email_requests)})
+            futures = {executor.submit(generate_one, prompt): prompt for prompt in requests_by_prompt}
+            for future in as_completed(futures):
+                email_content, cached, error = future.result()
+                for email_request in requests_by_prompt[futures[future]]:
+                    frame = {"index": email_request['index'], "id": email_request['id'], "tone": email_request['tone']}
+                    if error:
+                        failed += 1
+                        yield _ndjson_line(dict(frame, type="error", error=error[0], status=error[1]))
+                    else:
+                        succeeded += 1
+                        yield _ndjson_line(dict(frame, type="email", subject=email_content['subject'], body=email_content['body'], cached=cached))
+            yield _ndjson_line({"type": "done", "total": len(email_requests), "succeeded": succeeded, "failed": failed})
+        finally:
+            # Stop queued generations if the client goes away
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='application/x-ndjson',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+def create_app():
+    """Builds the Flask app. Nothing heavy happens here: SDKs and upstream clients load on first use."""
+    app = Flask(__name__)
+    app.request_class = UploadRequest
+    app.config['MAX_CONTENT_LENGTH'] = MAX_CONTENT_LENGTH
+    app.register_error_handler(413, lambda e: too_large_response())
+    # orjson for jsonify, and gzip/brotli for JSON, NDJSON and text responses (see responses.py)
+    app.json = FastJSONProvider(app)
+    app.after_request(compress_response)
+
+    # Add CORS configuration - This should be fine now
+    CORS(app, resources={r"/*": {"origins": "http://localhost:8080"}})
+
+    app.register_blueprint(api)
+    metrics.instrument_flask(app)
+    return app
+
+app = create_app()
+
 # Make sure this is at the very end
 if __name__ == '__main__':
     # Make sure GOOGLE_APPLICATION_CREDENTIALS is set before running
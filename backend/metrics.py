@@ -0,0 +1,213 @@
+import time
+import threading
+from contextlib import contextmanager
+
+from prometheus_client import REGISTRY, CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+# --- Prometheus instrumentation, exposed on /metrics ---
+# Request, upstream and stage timings are histograms observed where the work
+# happens. Cache and Gemini limiter numbers are not tracked per request at all:
+# they are read from the components' own stats() when /metrics is scraped, so
+# the hot path pays nothing for them.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+REQUEST_LATENCY = Histogram(
+    'mitra_request_duration_seconds', 'Time to handle a request (streamed responses: until the last byte)',
+    ['method', 'route'], buckets=LATENCY_BUCKETS,
+)
+REQUESTS = Counter('mitra_requests_total', 'Requests handled', ['method', 'route', 'status'])
+REQUESTS_IN_FLIGHT = Gauge('mitra_requests_in_flight', 'Requests currently being handled', ['route'])
+
+UPSTREAM_LATENCY = Histogram(
+    'mitra_upstream_duration_seconds', 'Time spent in one call to an upstream API (streams: until the first chunk)',
+    ['service', 'operation', 'outcome'], buckets=LATENCY_BUCKETS,
+)
+UPSTREAM_IN_FLIGHT = Gauge('mitra_upstream_in_flight', 'Upstream API calls currently in progress', ['service'])
+
+STAGE_LATENCY = Histogram(
+    'mitra_stage_duration_seconds', 'Time spent in one processing stage (per image or per page)',
+    ['pipeline', 'stage'], buckets=STAGE_BUCKETS,
+)
+
+@contextmanager
+def upstream_timer(service, operation):
+    """Times one call to Gemini, Translate or AccuWeather, labelled ok/error."""
+    in_flight = UPSTREAM_IN_FLIGHT.labels(service)
+    in_flight.inc()
+    start = time.perf_counter()
+    outcome = 'error'
+    try:
+        yield
+        outcome = 'ok'
+    finally:
+        UPSTREAM_LATENCY.labels(service, operation, outcome).observe(time.perf_counter() - start)
+        in_flight.dec()
+
+@contextmanager
+def stage_timer(pipeline, stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_LATENCY.labels(pipeline, stage).observe(time.perf_counter() - start)
+
+def observe_stage(pipeline, stage, seconds):
+    # For work timed elsewhere, e.g. inside a worker process
+    STAGE_LATENCY.labels(pipeline, stage).observe(seconds)
+
+# --- Scrape-time collectors ---
+
+class _StatsCollector:
+    """Turns registered stats() callables into cache and Gemini limiter metrics at scrape time."""
+
+    def __init__(self):
+        self._caches = {}
+        self._gemini_clients = {}
+        self._lock = threading.Lock()
+
+    def add_cache(self, name, stats_fn):
+        with self._lock:
+            self._caches[name] = stats_fn
+
+    def add_gemini(self, name, client):
+        with self._lock:
+            self._gemini_clients[name] = client
+
+    def collect(self):
+        with self._lock:
+            caches = dict(self._caches)
+            gemini_clients = dict(self._gemini_clients)
+
+        hits = CounterMetricFamily('mitra_cache_hits', 'Cache hits', labels=['cache'])
+        misses = CounterMetricFamily('mitra_cache_misses', 'Cache misses', labels=['cache'])
+        entries = GaugeMetricFamily('mitra_cache_entries', 'Entries currently cached', labels=['cache'])
+        size_bytes = GaugeMetricFamily('mitra_cache_bytes', 'Bytes currently cached', labels=['cache'])
+        for name, stats_fn in caches.items():
+            try:
+                stats = stats_fn()
+            except Exception as e:
+                print(f"Warning: Could not read stats for cache {name}: {e}")
+                continue
+            for cache_name, cache_stats in _flatten_cache_stats(name, stats):
+                hits.add_metric([cache_name], cache_stats.get('hits', 0))
+                misses.add_metric([cache_name], cache_stats.get('misses', 0))
+                if 'size' in cache_stats:
+                    entries.add_metric([cache_name], cache_stats['size'])
+                if 'bytes' in cache_stats:
+                    size_bytes.add_metric([cache_name], cache_stats['bytes'])
+        yield from (hits, misses, entries, size_bytes)
+
+        in_flight = GaugeMetricFamily('mitra_gemini_in_flight', 'Gemini calls holding a concurrency slot', labels=['client', 'scope'])
+        waiting = GaugeMetricFamily('mitra_gemini_waiting', 'Gemini calls waiting for a concurrency slot', labels=['client', 'scope'])
+        rejected = CounterMetricFamily('mitra_gemini_rejected', 'Gemini calls rejected by a full queue or wait timeout', labels=['client', 'scope'])
+        retries = CounterMetricFamily('mitra_gemini_retries', 'Gemini call attempts that were retried', labels=['client'])
+        failures = CounterMetricFamily('mitra_gemini_failures', 'Gemini calls that failed after retries', labels=['client'])
+        for name, client in gemini_clients.items():
+            stats = client.stats()
+            retries.add_metric([name], stats['retries'])
+            failures.add_metric([name], stats['failures'])
+            limiters = dict(stats['endpoints'], **{'global': stats['global']})
+            for scope, limiter in limiters.items():
+                in_flight.add_metric([name, scope], limiter['inFlight'])
+                waiting.add_metric([name, scope], limiter['waiting'])
+                rejected.add_metric([name, scope], limiter['rejected'])
+        yield from (in_flight, waiting, rejected, retries, failures)
+
+def _flatten_cache_stats(name, stats):
+    # Components report either {'hits', 'misses', ...} or nested per-part stats
+    # (e.g. the response cache per endpoint, the weather client per lookup type)
+    if 'hits' in stats:
+        yield name, stats
+        return
+    nested = stats.get('endpoints', stats)
+    for part, part_stats in nested.items():
+        if isinstance(part_stats, dict) and 'hits' in part_stats:
+            yield f"{name}:{part}", part_stats
+
+_collector = _StatsCollector()
+REGISTRY.register(_collector)
+
+def register_cache(name, stats_fn):
+    """stats_fn returns {'hits', 'misses'[, 'size'][, 'bytes']} (or a dict of those); called on scrape."""
+    _collector.add_cache(name, stats_fn)
+
+def register_gemini_client(name, client):
+    _collector.add_gemini(name, client)
+
+def render():
+    """Returns (body, content_type) for a /metrics response."""
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+# --- Request instrumentation ---
+
+def instrument_flask(app):
+    """Records latency, status and in-flight count per route template (never the raw path)."""
+    from flask import g, request
+
+    @app.before_request
+    def _start_timer():
+        g.metrics_route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        g.metrics_start = time.perf_counter()
+        g.metrics_status = 500
+        REQUESTS_IN_FLIGHT.labels(g.metrics_route).inc()
+
+    @app.after_request
+    def _record_status(response):
+        g.metrics_status = response.status_code
+        return response
+
+    # Teardown runs once the response is fully sent, including streamed bodies
+    @app.teardown_request
+    def _observe(exc):
+        start = g.pop('metrics_start', None)
+        if start is None:
+            return
+        route = g.metrics_route
+        REQUEST_LATENCY.labels(request.method, route).observe(time.perf_counter() - start)
+        REQUESTS.labels(request.method, route, str(g.metrics_status)).inc()
+        REQUESTS_IN_FLIGHT.labels(route).dec()
+
+class _ASGIMetrics:
+    # Pure ASGI middleware, so streamed bodies are timed until the last chunk is sent
+    def __init__(self, app, routes):
+        self.app = app
+        self.routes = routes
+
+    def _route(self, scope):
+        from starlette.routing import Match, Route
+        for route in self.routes:
+            if route.matches(scope)[0] == Match.FULL:
+                # Mounted apps (the Flask fallback) record their own requests
+                return route.path if isinstance(route, Route) else None
+        return 'unmatched'
+
+    async def __call__(self, scope, receive, send):
+        route = self._route(scope) if scope['type'] == 'http' else None
+        if route is None:
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        async def send_with_status(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        method = scope['method']
+        in_flight = REQUESTS_IN_FLIGHT.labels(route)
+        in_flight.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            REQUEST_LATENCY.labels(method, route).observe(time.perf_counter() - start)
+            REQUESTS.labels(method, route, str(status)).inc()
+            in_flight.dec()
+
+def instrument_asgi(app):
+    """ASGI counterpart of instrument_flask for the FastAPI app in asgi.py."""
+    app.add_middleware(_ASGIMetrics, routes=app.router.routes)
@@ -0,0 +1,137 @@
+import os
+import time
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from metrics import observe_stage
+from pdf_extract import process_pool_context
+from response_cache import TTLCache
+
+# --- OCR fallback for pages without a text layer ---
+# Only pages whose extracted text is (nearly) empty are rendered with PyMuPDF and
+# run through Tesseract. OCR is CPU heavy, so it runs on its own process pool and
+# results are cached per page, keyed by the PDF's content hash. Uploaded images
+# (see doc_formats.py) go through the same pool and cache, one page per image.
+
+OCR_DPI = int(os.getenv('OCR_DPI', '200'))
+OCR_LANG = os.getenv('OCR_LANG', 'eng')
+OCR_WORKERS = int(os.getenv('OCR_WORKERS', str(os.cpu_count() or 2)))
+OCR_MIN_TEXT_CHARS = int(os.getenv('OCR_MIN_TEXT_CHARS', '1')) # Pages with fewer non-blank characters get OCR'd
+OCR_CACHE_MAX_ENTRIES = int(os.getenv('OCR_CACHE_MAX_ENTRIES', '5000'))
+OCR_MIN_DPI, OCR_MAX_DPI = 72, 600
+
+ocr_cache = TTLCache(OCR_CACHE_MAX_ENTRIES)
+
+_executor = None
+_executor_lock = threading.Lock()
+_tesseract_available = None
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=OCR_WORKERS, mp_context=process_pool_context())
+        return _executor
+
+def tesseract_available():
+    # Checked once; without the tesseract binary OCR is skipped rather than failing the upload
+    global _tesseract_available
+    if _tesseract_available is None:
+        import pytesseract
+        try:
+            pytesseract.get_tesseract_version()
+            _tesseract_available = True
+        except Exception as e:
+            print(f"Warning: Tesseract not available, OCR fallback disabled: {e}")
+            _tesseract_available = False
+    return _tesseract_available
+
+def needs_ocr(text):
+    return len(text.strip()) < OCR_MIN_TEXT_CHARS
+
+def clamp_dpi(dpi):
+    return max(OCR_MIN_DPI, min(int(dpi), OCR_MAX_DPI))
+
+def ocr_page(pdf_path, page_index, dpi=OCR_DPI, lang=OCR_LANG):
+    # Runs inside a worker process
+    import fitz # PyMuPDF
+    import pytesseract
+    from PIL import Image
+
+    with fitz.open(pdf_path) as doc:
+        # Grayscale is all Tesseract needs and a third of the pixels to push around
+        pixmap = doc.load_page(page_index).get_pixmap(dpi=dpi, colorspace=fitz.csGRAY)
+        image = Image.frombytes('L', (pixmap.width, pixmap.height), pixmap.samples)
+    return pytesseract.image_to_string(image, lang=lang)
+
+def ocr_image(image_path, frame_index=0, dpi=None, lang=OCR_LANG):
+    # Runs inside a worker process. Images are read at their own resolution, so dpi is unused.
+    import pytesseract
+    from PIL import Image, ImageOps
+
+    with Image.open(image_path) as image:
+        image.seek(frame_index) # Multi-page TIFFs
+        # Upright (phone photos) and grayscale, like rendered PDF pages
+        image = ImageOps.exif_transpose(image).convert('L')
+    return pytesseract.image_to_string(image, lang=lang)
+
+def _timed_ocr(ocr_fn, path, page_index, dpi, lang):
+    # Runs inside a worker process; the parent records the timing
+    start = time.perf_counter()
+    text = ocr_fn(path, page_index, dpi, lang)
+    return text, time.perf_counter() - start
+
+def iter_ocr_image(image_path, frame_indexes, content_hash, lang=OCR_LANG):
+    """OCRs the given frames of an uploaded image. Yields (frame_index, text, used_ocr) in order."""
+    return iter_with_ocr(image_path, ((index, '') for index in frame_indexes), content_hash, dpi=None, lang=lang, ocr_fn=ocr_image)
+
+def iter_with_ocr(pdf_path, pages, content_hash, dpi=OCR_DPI, lang=OCR_LANG, ocr_fn=ocr_page):
+    """Wraps an in-order (page_index, text) iterator, OCR-ing pages that have no text.
+
+    Yields (page_index, text, used_ocr) in the same order. OCR jobs are submitted as soon
+    as a blank page is seen, so they run in parallel with the rest of the extraction.
+    content_hash is a callable returning the PDF's hash; it is only called if a page needs OCR.
+    """
+    if not tesseract_available():
+        for index, text in pages:
+            yield index, text, False
+        return
+
+    pending = deque() # (index, text, future, cache_key, used_ocr)
+    try:
+        for index, text in pages:
+            if not needs_ocr(text):
+                pending.append((index, text, None, None, False))
+            else:
+                cache_key = (content_hash(), index, dpi, lang)
+                cached = ocr_cache.get(cache_key)
+                if cached is not None:
+                    pending.append((index, cached, None, None, True))
+                else:
+                    future = _get_executor().submit(_timed_ocr, ocr_fn, pdf_path, index, dpi, lang)
+                    pending.append((index, None, future, cache_key, True))
+
+            # Hand back everything at the head of the queue that is already finished
+            while pending and (pending[0][2] is None or pending[0][2].done()):
+                yield _resolve(pending.popleft())
+
+        while pending:
+            yield _resolve(pending.popleft())
+    finally:
+        for item in pending:
+            if item[2] is not None:
+                item[2].cancel()
+
+def _resolve(item):
+    index, text, future, cache_key, used_ocr = item
+    if future is None:
+        return index, text, used_ocr
+    try:
+        text, seconds = future.result()
+    except Exception as e:
+        print(f"Error running OCR on page {index + 1}: {e}")
+        return index, '', False
+    observe_stage('upload-doc', 'ocr', seconds)
+    ocr_cache.set(cache_key, text)
+    return index, text, True
@@ -0,0 +1,167 @@
+import os
+import time
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from metrics import observe_stage
+
+# --- Page-level PDF text extraction ---
+# Pages are extracted in batches on a process pool (text extraction is CPU bound,
+# so threads would serialize on the GIL). Workers open the PDF from a file path
+# rather than receiving the bytes, which keeps task pickling cheap.
+#
+# The extraction library is pluggable: PyMuPDF, pdfplumber or PyPDF2. Each engine
+# imports its library on first use, so a worker only loads the one it needs.
+# See benchmarks/bench_pdf_engines.py for a speed/memory/parity comparison: PyMuPDF
+# extracts the same text 1.3-5x faster than PyPDF2 (the gap grows with page count),
+# at roughly 25 MB more RSS per worker process, so it is the default.
+
+PDF_ENGINE = os.getenv('PDF_ENGINE', 'pymupdf')
+PDF_EXTRACT_WORKERS = int(os.getenv('PDF_EXTRACT_WORKERS', str(os.cpu_count() or 2)))
+PDF_PAGES_PER_TASK = int(os.getenv('PDF_PAGES_PER_TASK', '8'))
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def process_pool_context():
+    # Workers are started from a threaded server, and a forked child inherits locks other
+    # threads held at that moment (SQLite, stdout, HTTP clients) with nobody to release
+    # them. forkserver forks from a clean single-threaded process instead (spawn where
+    # it isn't available, e.g. Windows).
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=PDF_EXTRACT_WORKERS, mp_context=process_pool_context())
+        return _executor
+
+def parse_page_range(spec, page_count):
+    """Parses a 1-based page selection like "1-3,7,10-" into sorted 0-based indexes.
+
+    An empty spec selects every page. Raises ValueError for malformed or out-of-range input.
+    """
+    if not spec or not spec.strip():
+        return list(range(page_count))
+
+    selected = set()
+    for part in spec.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        try:
+            if '-' in part:
+                start_str, end_str = part.split('-', 1)
+                start = int(start_str) if start_str.strip() else 1
+                end = int(end_str) if end_str.strip() else page_count
+            else:
+                start = end = int(part)
+        except ValueError:
+            raise ValueError(f"Invalid page range '{part}'. Use page numbers such as 1-3,7,10-") from None
+        if start < 1 or end > page_count or start > end:
+            raise ValueError(f"Invalid page range '{part}' for a document with {page_count} pages")
+        selected.update(range(start - 1, end))
+    return sorted(selected)
+
+# --- Extraction engines ---
+class PyMuPDFEngine:
+    name = 'pymupdf'
+
+    def page_count(self, pdf_path):
+        import fitz # PyMuPDF
+        with fitz.open(pdf_path) as doc:
+            return doc.page_count
+
+    def extract_pages(self, pdf_path, page_indexes):
+        import fitz # PyMuPDF
+        with fitz.open(pdf_path) as doc:
+            return [(index, doc.load_page(index).get_text()) for index in page_indexes]
+
+class PdfPlumberEngine:
+    name = 'pdfplumber'
+
+    def page_count(self, pdf_path):
+        import pdfplumber
+        with pdfplumber.open(pdf_path) as pdf:
+            return len(pdf.pages)
+
+    def extract_pages(self, pdf_path, page_indexes):
+        import pdfplumber
+        results = []
+        with pdfplumber.open(pdf_path) as pdf:
+            for index in page_indexes:
+                page = pdf.pages[index]
+                results.append((index, page.extract_text() or ''))
+                page.flush_cache() # Drop parsed layout objects; they add up on long documents
+        return results
+
+class PyPDF2Engine:
+    name = 'pypdf2'
+
+    # PdfReader(path) copies the whole file into a BytesIO; given an open file it reads
+    # only what it needs, so memory doesn't grow with the size of the PDF
+    def page_count(self, pdf_path):
+        from PyPDF2 import PdfReader
+        with open(pdf_path, 'rb') as pdf_file:
+            return len(PdfReader(pdf_file).pages)
+
+    def extract_pages(self, pdf_path, page_indexes):
+        from PyPDF2 import PdfReader
+        with open(pdf_path, 'rb') as pdf_file:
+            reader = PdfReader(pdf_file)
+            return [(index, reader.pages[index].extract_text() or '') for index in page_indexes]
+
+ENGINES = {engine.name: engine for engine in (PyMuPDFEngine(), PdfPlumberEngine(), PyPDF2Engine())}
+
+def get_engine(name=None):
+    """Looks up an engine by name (default: PDF_ENGINE). Raises ValueError for unknown names."""
+    name = (name or PDF_ENGINE).lower()
+    if name not in ENGINES:
+        raise ValueError(f"Unknown PDF engine '{name}'. Available engines: {', '.join(sorted(ENGINES))}")
+    return ENGINES[name]
+
+def get_page_count(pdf_path, engine=None):
+    return get_engine(engine).page_count(pdf_path)
+
+def extract_page_batch(engine_name, pdf_path, page_indexes):
+    # Runs inside a worker process. Returns (pages, seconds) so the parent can record the timing.
+    start = time.perf_counter()
+    pages = get_engine(engine_name).extract_pages(pdf_path, page_indexes)
+    return pages, time.perf_counter() - start
+
+def _observed(batch_result, engine_name):
+    pages, seconds = batch_result
+    if pages:
+        # One observation per page (the batch average), so the histogram stays per-page
+        per_page = seconds / len(pages)
+        for _ in pages:
+            observe_stage('upload-doc', f'extract:{engine_name}', per_page)
+    return pages
+
+def iter_extract_pages(pdf_path, page_indexes, engine=None, pages_per_task=PDF_PAGES_PER_TASK):
+    """Yields (page_index, text) in page order, as soon as each batch is ready."""
+    engine_name = get_engine(engine).name
+    if len(page_indexes) <= pages_per_task:
+        # Not worth the round trip to the pool for a handful of pages
+        yield from _observed(extract_page_batch(engine_name, pdf_path, page_indexes), engine_name)
+        return
+
+    executor = _get_executor()
+    batches = [page_indexes[i:i + pages_per_task] for i in range(0, len(page_indexes), pages_per_task)]
+    futures = [executor.submit(extract_page_batch, engine_name, pdf_path, batch) for batch in batches]
+    try:
+        for future in futures:
+            yield from _observed(future.result(), engine_name)
+    finally:
+        # Stop queued batches if the consumer stopped early (e.g. client disconnected)
+        for future in futures:
+            future.cancel()
+
+def extract_text(pdf_path, page_indexes=None, engine=None):
+    if page_indexes is None:
+        page_indexes = list(range(get_page_count(pdf_path, engine)))
+    # Join once at the end instead of growing a string page by page
+    return "".join(text + "\n" for _, text in iter_extract_pages(pdf_path, page_indexes, engine))
@@ -0,0 +1,122 @@
+import os
+import re
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+# --- Response cache for Gemini-backed endpoints ---
+# Identical prompts (same model, generation config and image bytes) get the
+# stored answer back instead of another upstream call.
+
+RESPONSE_CACHE_TTL_SECONDS = int(os.getenv('RESPONSE_CACHE_TTL_SECONDS', '3600'))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', '2048'))
+# Comma-separated endpoint names to opt out of caching, e.g. "search,generate-email"
+RESPONSE_CACHE_DISABLED = {name.strip() for name in os.getenv('RESPONSE_CACHE_DISABLED', '').split(',') if name.strip()}
+
+_MISSING = object()
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries also expire after ttl_seconds (None = never)."""
+
+    def __init__(self, max_entries, ttl_seconds=None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict() # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+            if entry is not _MISSING:
+                expires_at, value = entry
+                if expires_at is None or expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value, ttl_seconds=_MISSING):
+        ttl = self.ttl_seconds if ttl_seconds is _MISSING else ttl_seconds
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._entries), 'maxSize': self.max_entries}
+
+def _normalize_prompt(prompt):
+    # Whitespace-only differences should not produce a different key
+    if isinstance(prompt, str):
+        return re.sub(r'\s+', ' ', prompt).strip()
+    if isinstance(prompt, (list, tuple)):
+        return [_normalize_prompt(item) for item in prompt]
+    if isinstance(prompt, dict):
+        return {k: _normalize_prompt(v) for k, v in prompt.items()}
+    return prompt
+
+def make_cache_key(model_name, prompt, generation_config=None, image_bytes=None, image_sha256=None):
+    """Content-addressed key: SHA-256 over the normalized prompt, model, config and image bytes.
+
+    Pass image_sha256 (hex digest of the image) instead of image_bytes for images hashed from a stream.
+    """
+    payload = json.dumps({
+        'model': model_name,
+        'prompt': _normalize_prompt(prompt),
+        'config': generation_config or {},
+    }, sort_keys=True, default=str)
+    digest = hashlib.sha256(payload.encode('utf-8'))
+    if image_bytes is not None:
+        image_sha256 = hashlib.sha256(image_bytes).hexdigest()
+    if image_sha256 is not None:
+        digest.update(b'\0image\0')
+        digest.update(bytes.fromhex(image_sha256))
+    return digest.hexdigest()
+
+class ResponseCache:
+    """One shared LRU/TTL store with per-endpoint opt-out and hit/miss counters."""
+
+    def __init__(self, max_entries=RESPONSE_CACHE_MAX_ENTRIES, ttl_seconds=RESPONSE_CACHE_TTL_SECONDS, disabled_endpoints=RESPONSE_CACHE_DISABLED):
+        self._cache = TTLCache(max_entries, ttl_seconds)
+        self.disabled_endpoints = set(disabled_endpoints)
+        self._counters = {} # endpoint -> {'hits': n, 'misses': n}
+        self._lock = threading.Lock()
+
+    def enabled(self, endpoint):
+        return endpoint not in self.disabled_endpoints
+
+    def get(self, endpoint, key):
+        value = self._cache.get((endpoint, key), _MISSING)
+        with self._lock:
+            counters = self._counters.setdefault(endpoint, {'hits': 0, 'misses': 0})
+            counters['hits' if value is not _MISSING else 'misses'] += 1
+        return None if value is _MISSING else value
+
+    def set(self, endpoint, key, value):
+        self._cache.set((endpoint, key), value)
+
+    def stats(self):
+        with self._lock:
+            endpoints = {name: dict(counters) for name, counters in self._counters.items()}
+        return {
+            'size': len(self._cache),
+            'maxSize': self._cache.max_entries,
+            'ttlSeconds': self._cache.ttl_seconds,
+            'disabled': sorted(self.disabled_endpoints),
+            'endpoints': endpoints,
+        }
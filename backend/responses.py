@@ -0,0 +1,220 @@
+import os
+import json
+import gzip
+import zlib
+from flask import request
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.http import parse_accept_header
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# --- Response encoding: fast JSON and compression ---
+# JSON is serialized with orjson when it is installed. It is several times faster than the
+# stdlib encoder on big payloads such as /upload-doc's extracted text. JSON, NDJSON and
+# text bodies of at least COMPRESS_MIN_BYTES are compressed with brotli or gzip, whichever
+# the client's Accept-Encoding prefers (brotli only if installed). Streamed responses are
+# compressed frame by frame with a flush after each, so frames still arrive as they are
+# produced. Images and PDFs go out as they are: JPEG/PNG/WebP are compressed already,
+# and generated PDFs keep their image data binary (see image_pdf.py), which leaves gzip
+# about 1% to gain.
+
+COMPRESS_MIN_BYTES = int(os.getenv('COMPRESS_MIN_BYTES', '1024')) # Smaller bodies aren't worth the framing overhead
+COMPRESS_GZIP_LEVEL = int(os.getenv('COMPRESS_GZIP_LEVEL', '6'))
+COMPRESS_BROTLI_QUALITY = int(os.getenv('COMPRESS_BROTLI_QUALITY', '5')) # 11 is far too slow for dynamic responses
+COMPRESS_DISABLED = os.getenv('COMPRESS_DISABLED', '').lower() in ('1', 'true', 'yes')
+
+COMPRESSIBLE_MIMETYPES = {'application/json', 'application/x-ndjson'}
+
+# Same output as Flask's default provider: sorted keys, non-string keys converted, and
+# datetimes as HTTP dates (passed through to the provider's default)
+_ORJSON_OPTIONS = (orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME) if orjson else 0
+
+def dumps(obj):
+    """Compact JSON text, via orjson when available (used for NDJSON frames)."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, default=DefaultJSONProvider.default).decode('utf-8')
+        except orjson.JSONEncodeError:
+            pass # e.g. integers over 64 bits; the stdlib encoder handles them
+    return json.dumps(obj)
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider (jsonify) that serializes with orjson when it is installed."""
+
+    def _orjson_bytes(self, obj):
+        # None when orjson isn't installed, can't encode obj, or the app wants pretty output
+        if orjson is None or (self.compact is None and self._app.debug) or self.compact is False:
+            return None
+        try:
+            return orjson.dumps(obj, default=self.default, option=_ORJSON_OPTIONS)
+        except orjson.JSONEncodeError:
+            return None
+
+    def dumps(self, obj, **kwargs):
+        data = None if kwargs else self._orjson_bytes(obj)
+        return data.decode('utf-8') if data is not None else super().dumps(obj, **kwargs)
+
+    def response(self, *args, **kwargs):
+        data = self._orjson_bytes(self._prepare_response_obj(args, kwargs))
+        if data is None:
+            return super().response(*args, **kwargs)
+        return self._app.response_class(data + b"\n", mimetype=self.mimetype)
+
+def is_compressible(mimetype):
+    return mimetype in COMPRESSIBLE_MIMETYPES or mimetype.startswith('text/')
+
+def negotiate_encoding(accept_encoding):
+    """'br', 'gzip' or None for an Accept-Encoding header value (q-values respected, brotli on ties)."""
+    if COMPRESS_DISABLED or not accept_encoding:
+        return None
+    accepted = parse_accept_header(accept_encoding)
+    br_quality = accepted['br'] if brotli is not None else 0
+    gzip_quality = accepted['gzip']
+    if br_quality and br_quality >= gzip_quality:
+        return 'br'
+    return 'gzip' if gzip_quality else None
+
+def compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=COMPRESS_BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=COMPRESS_GZIP_LEVEL, mtime=0)
+
+class StreamCompressor:
+    """Incremental brotli/gzip. Each compress() call returns everything needed to decode its input."""
+
+    def __init__(self, encoding):
+        self.encoding = encoding
+        if encoding == 'br':
+            self._compressor = brotli.Compressor(quality=COMPRESS_BROTLI_QUALITY)
+        else:
+            self._compressor = zlib.compressobj(COMPRESS_GZIP_LEVEL, zlib.DEFLATED, 31) # 31: gzip container
+
+    def compress(self, chunk):
+        if self.encoding == 'br':
+            return self._compressor.process(chunk) + self._compressor.flush()
+        return self._compressor.compress(chunk) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        if self.encoding == 'br':
+            return self._compressor.finish()
+        return self._compressor.flush()
+
+def _iter_compressed(chunks, encoding):
+    compressor = StreamCompressor(encoding)
+    for chunk in chunks:
+        if chunk:
+            yield compressor.compress(chunk)
+    yield compressor.finish()
+
+def compress_response(response):
+    """after_request hook: compresses the body when the client accepts it and it is worth it."""
+    if (request.method == 'HEAD' or response.status_code < 200 or response.status_code in (204, 206, 304)
+            or 'Content-Encoding' in response.headers or not is_compressible(response.mimetype)):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = negotiate_encoding(request.headers.get('Accept-Encoding'))
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        chunks = response.iter_encoded()
+        original = response.response
+        response.response = _iter_compressed(chunks, encoding)
+        if hasattr(original, 'close'):
+            response.call_on_close(original.close) # Response.close() now only sees the wrapper
+        response.direct_passthrough = False
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < COMPRESS_MIN_BYTES:
+            return response
+        compressed = compress(data, encoding)
+        if len(compressed) >= len(data):
+            return response
+        response.set_data(compressed)
+
+    response.headers['Content-Encoding'] = encoding
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True) # The bytes differ from the identity encoding
+    return response
+
+class ASGICompression:
+    """The same compression for routes served natively by asgi.py (mounted Flask responses arrive compressed)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['method'] == 'HEAD':
+            await self.app(scope, receive, send)
+            return
+        request_headers = dict(scope['headers'])
+        encoding = negotiate_encoding(request_headers.get(b'accept-encoding', b'').decode('latin-1'))
+
+        pending_start = None # http.response.start, held until the first body message shows whether the body is streamed
+        compressor = None
+
+        async def compressing_send(message):
+            nonlocal pending_start, compressor
+            if message['type'] == 'http.response.start':
+                headers = {name.lower(): value for name, value in message['headers']}
+                mimetype = headers.get(b'content-type', b'').split(b';')[0].strip().decode('latin-1')
+                status = message['status']
+                if (status < 200 or status in (204, 206, 304) or b'content-encoding' in headers
+                        or not is_compressible(mimetype)):
+                    await send(message)
+                    return
+                message = dict(message, headers=_vary_on_accept_encoding(message['headers']))
+                if encoding is None:
+                    await send(message)
+                else:
+                    pending_start = message
+                return
+
+            if message['type'] != 'http.response.body' or (pending_start is None and compressor is None):
+                await send(message)
+                return
+            body = message.get('body', b'')
+            more_body = message.get('more_body', False)
+            if pending_start is not None:
+                headers = [(name, value) for name, value in pending_start['headers'] if name.lower() != b'content-length']
+                if not more_body:
+                    # The whole body in one message
+                    if len(body) >= COMPRESS_MIN_BYTES:
+                        compressed = compress(body, encoding)
+                        if len(compressed) < len(body):
+                            body = compressed
+                            headers.append((b'content-encoding', encoding.encode()))
+                    headers.append((b'content-length', str(len(body)).encode()))
+                    await send(dict(pending_start, headers=headers))
+                    pending_start = None
+                    await send({'type': 'http.response.body', 'body': body})
+                    return
+                compressor = StreamCompressor(encoding)
+                await send(dict(pending_start, headers=headers + [(b'content-encoding', encoding.encode())]))
+                pending_start = None
+
+            data = compressor.compress(body) if body else b''
+            if not more_body:
+                data += compressor.finish()
+            await send({'type': 'http.response.body', 'body': data, 'more_body': more_body})
+
+        await self.app(scope, receive, compressing_send)
+
+def _vary_on_accept_encoding(headers):
+    for index, (name, value) in enumerate(headers):
+        if name.lower() == b'vary':
+            if b'accept-encoding' not in value.lower():
+                headers = list(headers)
+                headers[index] = (name, value + b', Accept-Encoding')
+            return headers
+    return list(headers) + [(b'vary', b'Accept-Encoding')]
@@ -0,0 +1,166 @@
+import os
+import json
+import time
+import secrets
+import sqlite3
+import threading
+from collections import OrderedDict
+
+# --- Conversation session store for /search ---
+# Keeps chat history server-side, keyed by conversation id, so the client only
+# has to send the new turn. Stored history is trimmed to a token budget on every
+# write, which keeps both the store and the upstream prompt size bounded.
+# Session ids are minted by the server (unguessable tokens), never chosen by the client,
+# so only the client a session was issued to can read or extend it.
+
+SESSION_BACKEND = os.getenv('SESSION_BACKEND', 'memory') # 'memory' or 'sqlite'
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__)) # Relative paths below are resolved from here, not the working directory
+
+SESSION_DB_PATH = os.path.join(BACKEND_DIR, os.getenv('SESSION_DB_PATH', 'sessions.db'))
+SESSION_TOKEN_BUDGET = int(os.getenv('SESSION_TOKEN_BUDGET', '8000'))
+SESSION_MAX_SESSIONS = int(os.getenv('SESSION_MAX_SESSIONS', '1000'))
+SESSION_TTL_SECONDS = int(os.getenv('SESSION_TTL_SECONDS', str(24 * 60 * 60)))
+
+class SessionError(Exception):
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+def new_session_id():
+    return secrets.token_urlsafe(24)
+
+def estimate_tokens(text):
+    # Rough estimate (~4 characters per token for English); good enough for budgeting
+    return max(1, len(text) // 4)
+
+def _turn_text(turn):
+    parts = turn.get('parts', '')
+    if isinstance(parts, list):
+        return " ".join(p if isinstance(p, str) else str(p.get('text', '')) for p in parts)
+    return str(parts)
+
+def trim_history(history, token_budget=SESSION_TOKEN_BUDGET):
+    """Drop the oldest turns until the history fits in token_budget."""
+    kept = []
+    used = 0
+    # Walk backwards so the most recent turns are always the ones kept
+    for turn in reversed(history):
+        cost = estimate_tokens(_turn_text(turn))
+        if kept and used + cost > token_budget:
+            break
+        kept.append(turn)
+        used += cost
+    kept.reverse()
+    # Gemini expects the conversation to open with a user turn
+    while kept and kept[0].get('role') != 'user':
+        kept.pop(0)
+    return kept
+
+class MemorySessionStore:
+    """In-process LRU store. Least recently used sessions are evicted past max_sessions."""
+
+    def __init__(self, max_sessions=SESSION_MAX_SESSIONS, ttl_seconds=SESSION_TTL_SECONDS, token_budget=SESSION_TOKEN_BUDGET):
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.token_budget = token_budget
+        self._sessions = OrderedDict() # session_id -> (updated_at, history)
+        self._lock = threading.Lock()
+
+    def get(self, session_id):
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return None
+            updated_at, history = entry
+            if time.time() - updated_at > self.ttl_seconds:
+                del self._sessions[session_id]
+                return None
+            self._sessions.move_to_end(session_id)
+            return list(history)
+
+    def append(self, session_id, turns):
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            history = entry[1] if entry else []
+            history = trim_history(history + list(turns), self.token_budget)
+            self._sessions[session_id] = (time.time(), history)
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+            return list(history)
+
+    def delete(self, session_id):
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+class SQLiteSessionStore:
+    """Local SQLite store, so sessions survive restarts and can be shared between worker processes."""
+
+    def __init__(self, db_path=SESSION_DB_PATH, max_sessions=SESSION_MAX_SESSIONS, ttl_seconds=SESSION_TTL_SECONDS, token_budget=SESSION_TOKEN_BUDGET):
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.token_budget = token_budget
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                " id TEXT PRIMARY KEY,"
+                " history TEXT NOT NULL,"
+                " updated_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_updated_at ON sessions(updated_at)")
+
+    def get(self, session_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT history, updated_at FROM sessions WHERE id = ?", (session_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            if time.time() - row[1] > self.ttl_seconds:
+                with self._conn:
+                    self._conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+                return None
+            # Touch the row so LRU eviction sees it as recently used
+            with self._conn:
+                self._conn.execute("UPDATE sessions SET updated_at = ? WHERE id = ?", (time.time(), session_id))
+            return json.loads(row[0])
+
+    def append(self, session_id, turns):
+        with self._lock:
+            row = self._conn.execute("SELECT history FROM sessions WHERE id = ?", (session_id,)).fetchone()
+            history = json.loads(row[0]) if row else []
+            history = trim_history(history + list(turns), self.token_budget)
+            now = time.time()
+            with self._conn:
+                self._conn.execute(
+                    "INSERT INTO sessions (id, history, updated_at) VALUES (?, ?, ?) "
+                    "ON CONFLICT(id) DO UPDATE SET history = excluded.history, updated_at = excluded.updated_at",
+                    (session_id, json.dumps(history), now)
+                )
+                self._evict(now)
+            return history
+
+    def delete(self, session_id):
+        with self._lock, self._conn:
+            cursor = self._conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+            return cursor.rowcount > 0
+
+    def _evict(self, now):
+        self._conn.execute("DELETE FROM sessions WHERE updated_at < ?", (now - self.ttl_seconds,))
+        self._conn.execute(
+            "DELETE FROM sessions WHERE id IN ("
+            " SELECT id FROM sessions ORDER BY updated_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_sessions,)
+        )
+
+def create_session_store(backend=SESSION_BACKEND):
+    if backend == 'sqlite':
+        print(f"Using SQLite session store at {SESSION_DB_PATH}")
+        return SQLiteSessionStore()
+    if backend != 'memory':
+        print(f"Warning: Unknown SESSION_BACKEND '{backend}', falling back to in-memory sessions.")
+    return MemorySessionStore()
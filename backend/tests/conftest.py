@@ -0,0 +1,20 @@
+import os
+import sys
+import tempfile
+
+# Tests import the backend's flat modules directly, like main.py does
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Configuration is read at import time: use the fake Gemini backend, and keep the
+# databases and caches of any app imported by a test out of the backend directory
+_state_dir = tempfile.mkdtemp(prefix='mitra-tests-')
+os.environ.setdefault('GEMINI_BACKEND', 'fake')
+for name, path in (
+    ('SESSION_DB_PATH', 'sessions.db'),
+    ('TRANSLATION_MEMORY_PATH', 'translation_memory.db'),
+    ('JOB_DB_PATH', 'jobs.db'),
+    ('JOB_DIR', 'jobs'),
+    ('DOC_CACHE_DIR', 'documents'),
+    ('IMAGE_CACHE_DIR', 'images'),
+):
+    os.environ.setdefault(name, os.path.join(_state_dir, path))
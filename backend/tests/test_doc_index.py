@@ -0,0 +1,75 @@
+import json
+
+import pytest
+
+import main
+from doc_cache import DiskCache
+from doc_index import DocumentIndex
+
+def make_pages(numbers):
+    return [{'page': n, 'text': f"Page {n} is about topic{n}."} for n in numbers]
+
+@pytest.fixture
+def store(tmp_path):
+    return DiskCache(str(tmp_path), 10 * 1024 * 1024)
+
+def test_a_later_full_upload_completes_a_partial_one():
+    index = DocumentIndex()
+    index.add('doc', make_pages([1]), page_count=5)
+    assert index.partial(['doc']) == [{'document_id': 'doc', 'indexedPages': 1, 'pageCount': 5}]
+    assert index.search(['doc'], 'topic5') == []
+
+    index.add('doc', make_pages(range(1, 6)), page_count=5)
+    assert index.partial(['doc']) == []
+    assert index.search(['doc'], 'topic5')[0]['page'] == 5
+
+def test_page_ranges_from_separate_uploads_are_merged():
+    index = DocumentIndex()
+    index.add('doc', make_pages([1, 2]), page_count=4)
+    index.add('doc', make_pages([3, 4]), page_count=4)
+    assert index.partial(['doc']) == []
+    assert {index.search(['doc'], f'topic{n}')[0]['page'] for n in (1, 4)} == {1, 4}
+
+def test_empty_pages_do_not_replace_extracted_text():
+    # e.g. a scanned page uploaded first with OCR, then again with OCR off
+    index = DocumentIndex()
+    index.add('doc', [{'page': 1, 'text': 'Scanned invoice total'}], page_count=1)
+    index.add('doc', [{'page': 1, 'text': '  '}], page_count=1)
+    assert index.search(['doc'], 'invoice')[0]['text'] == 'Scanned invoice total'
+
+    index.add('doc', [{'page': 1, 'text': 'Corrected invoice total'}], page_count=1)
+    assert index.search(['doc'], 'invoice')[0]['text'] == 'Corrected invoice total'
+
+def test_merged_pages_survive_eviction(store):
+    index = DocumentIndex(store=store, key_fn=lambda document_id: document_id, max_documents=1)
+    index.add('doc', make_pages([1]), page_count=3)
+    index.add('doc', make_pages([2, 3]), page_count=3)
+    index.add('other', make_pages([1]), page_count=1)
+
+    assert index.partial(['doc']) == []
+    assert index.search(['doc'], 'topic3')[0]['page'] == 3
+
+def test_indexes_stored_without_a_page_count_still_load(store):
+    store.set_json('doc', make_pages([1, 2]))
+    index = DocumentIndex(store=store, key_fn=lambda document_id: document_id)
+    assert index.missing(['doc']) == []
+    assert index.partial(['doc']) == []
+    assert index.search(['doc'], 'topic2')[0]['page'] == 2
+
+def test_search_flags_partially_indexed_documents(monkeypatch):
+    index = DocumentIndex()
+    index.add('doc', make_pages([1]), page_count=5)
+    monkeypatch.setattr(main, 'doc_index', index)
+    client = main.create_app().test_client()
+
+    response = client.post('/search', json={'query': 'topic1', 'document_ids': ['doc']})
+    assert response.status_code == 200
+    assert response.get_json()['partial_documents'] == [{'document_id': 'doc', 'indexedPages': 1, 'pageCount': 5}]
+
+    stream = client.post('/search/stream', json={'query': 'topic1', 'document_ids': ['doc']})
+    done = json.loads(stream.get_data(as_text=True).splitlines()[-1])
+    assert done['partial_documents'][0]['pageCount'] == 5
+
+    index.add('doc', make_pages(range(1, 6)), page_count=5)
+    response = client.post('/search', json={'query': 'topic1', 'document_ids': ['doc']})
+    assert 'partial_documents' not in response.get_json()
@@ -0,0 +1,229 @@
+import asyncio
+import types
+
+import pytest
+
+import gemini_client
+from gemini_client import AsyncGeminiClient, GeminiClient, GeminiError, TokenBucket, fake_backend
+
+# Every test runs against the fake backend (GEMINI_BACKEND=fake). Randomness and time are
+# replaced with deterministic stand-ins where a test depends on them.
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+@pytest.fixture(autouse=True)
+def no_fake_latency(monkeypatch):
+    monkeypatch.setattr(gemini_client, 'GEMINI_FAKE_LATENCY_MS', 0)
+    monkeypatch.setattr(gemini_client, 'GEMINI_FAKE_JITTER_MS', 0)
+    monkeypatch.setattr(gemini_client, 'GEMINI_FAKE_ERROR_RATE', 0)
+    monkeypatch.setattr(gemini_client, 'GEMINI_QUEUE_TIMEOUT_SECONDS', 0.05)
+
+def make_client(client_class=GeminiClient, **kwargs):
+    kwargs.setdefault('rate_per_minute', 0)
+    return client_class(lambda: fake_backend, **kwargs)
+
+def in_flight(client):
+    stats = client.stats()
+    return stats['global']['inFlight'], {name: endpoint['inFlight'] for name, endpoint in stats['endpoints'].items()}
+
+# --- Concurrency limits ---
+
+def test_saturated_limit_rejects_with_503():
+    client = make_client(max_concurrency=1, max_queue=0)
+    stream = client.stream_message('search', [], 'hello') # Holds its slot until closed
+    with pytest.raises(GeminiError) as error:
+        client.send_message('search', [], 'hello')
+    assert error.value.status_code == 503
+    assert client.stats()['endpoints']['search']['rejected'] == 1 # The endpoint limiter is taken first
+
+    stream.close()
+    assert client.send_message('search', [], 'hello').text.startswith('Fake answer')
+
+def test_endpoint_limit_is_separate_from_other_endpoints():
+    client = make_client(max_concurrency=4, endpoint_limits={'search': 1}, max_queue=0)
+    stream = client.stream_message('search', [], 'hello')
+    with pytest.raises(GeminiError) as error:
+        client.send_message('search', [], 'hello')
+    assert error.value.status_code == 503
+    assert client.generate_content('search-image', 'describe') is not None
+    stream.close()
+
+def test_queued_caller_times_out_with_503():
+    client = make_client(max_concurrency=1, max_queue=1)
+    stream = client.stream_message('search', [], 'hello')
+    with pytest.raises(GeminiError) as error:
+        client.send_message('search', [], 'hello') # Waits GEMINI_QUEUE_TIMEOUT_SECONDS, then gives up
+    assert error.value.status_code == 503
+    assert client.stats()['global']['waiting'] == 0
+    stream.close()
+
+# --- Retries ---
+
+def test_transient_errors_are_retried_with_full_jitter(monkeypatch):
+    clock = FakeClock()
+    draws = iter([0.0, 0.0, 0.99]) # Fail (ConnectionError), fail, succeed
+    jitter_bounds = []
+
+    def uniform(low, high):
+        if high: # The fake backend's own latency jitter draws uniform(0, 0)
+            jitter_bounds.append((low, high))
+        return high / 2
+
+    monkeypatch.setattr(gemini_client, 'time', types.SimpleNamespace(monotonic=clock.monotonic, sleep=clock.sleep))
+    monkeypatch.setattr(gemini_client, 'random', types.SimpleNamespace(random=lambda: next(draws), uniform=uniform))
+    monkeypatch.setattr(gemini_client, 'GEMINI_FAKE_ERROR_RATE', 0.5)
+    monkeypatch.setattr(gemini_client, 'GEMINI_BACKOFF_BASE_SECONDS', 0.5)
+    monkeypatch.setattr(gemini_client, 'GEMINI_BACKOFF_MAX_SECONDS', 8)
+
+    client = make_client()
+    response = client.send_message('search', [], 'hello')
+
+    assert response.text.startswith('Fake answer')
+    assert client.stats()['retries'] == 2
+    # Exponential caps (0.5s, then 1s), each drawn uniformly from [0, cap]
+    assert jitter_bounds == [(0, 0.5), (0, 1.0)]
+    assert clock.sleeps == [0.25, 0.5]
+    assert in_flight(client) == (0, {'search': 0})
+
+def test_retries_stop_after_max_retries(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(gemini_client, 'time', types.SimpleNamespace(monotonic=clock.monotonic, sleep=clock.sleep))
+    monkeypatch.setattr(gemini_client, 'GEMINI_FAKE_ERROR_RATE', 1.0)
+    monkeypatch.setattr(gemini_client, 'GEMINI_MAX_RETRIES', 2)
+
+    client = make_client()
+    with pytest.raises(GeminiError) as error:
+        client.send_message('search', [], 'hello')
+
+    assert error.value.status_code == 503
+    assert client.stats()['retries'] == 2
+    assert client.stats()['failures'] == 1
+    assert in_flight(client) == (0, {'search': 0})
+
+def test_non_transient_errors_are_not_retried():
+    class BrokenModel:
+        def __init__(self, *args, **kwargs):
+            pass
+
+        def generate_content(self, contents, **kwargs):
+            raise ValueError("bad request")
+
+    client = GeminiClient(lambda: types.SimpleNamespace(GenerativeModel=BrokenModel), rate_per_minute=0)
+    with pytest.raises(ValueError):
+        client.generate_content('search-image', 'describe')
+    assert client.stats()['retries'] == 0
+    assert in_flight(client) == (0, {'search-image': 0})
+
+# --- Rate limiting ---
+
+def test_token_bucket_allows_a_burst_then_refills(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(gemini_client, 'time', types.SimpleNamespace(monotonic=clock.monotonic, sleep=clock.sleep))
+
+    bucket = TokenBucket(rate_per_minute=60, burst=2) # One token per second
+    assert bucket.acquire(deadline=clock.now)
+    assert bucket.acquire(deadline=clock.now)
+    assert clock.sleeps == []
+
+    # Empty: the next token is a second away, which is past this deadline
+    assert not bucket.acquire(deadline=clock.now + 0.5)
+
+    clock.now += 0.5
+    assert bucket.acquire(deadline=clock.now + 5) # Sleeps out the remaining half second
+    assert clock.sleeps == [pytest.approx(0.5)]
+
+    clock.now += 10 # Refill stops at the burst size
+    assert bucket.acquire(deadline=clock.now)
+    assert bucket.acquire(deadline=clock.now)
+    assert not bucket.acquire(deadline=clock.now)
+
+def test_rate_limited_call_returns_429_and_frees_its_slot(monkeypatch):
+    monkeypatch.setattr(gemini_client, 'GEMINI_DEADLINE_SECONDS', 0.5)
+    client = make_client(rate_per_minute=1, rate_burst=1)
+    client.send_message('search', [], 'hello')
+
+    with pytest.raises(GeminiError) as error:
+        client.send_message('search', [], 'hello') # Next token is a minute away, past the deadline
+    assert error.value.status_code == 429
+    assert in_flight(client) == (0, {'search': 0})
+
+# --- Slot release ---
+
+def test_streamed_slot_is_released_when_iteration_ends():
+    client = make_client(max_concurrency=1, max_queue=0)
+    stream = client.stream_message('search', [], 'hello there')
+    assert in_flight(client)[0] == 1
+    assert "".join(chunk.text for chunk in stream).startswith('Fake answer')
+    assert in_flight(client) == (0, {'search': 0})
+    stream.close() # Closing again is harmless
+    assert in_flight(client) == (0, {'search': 0})
+
+def test_async_slot_is_released_on_error(monkeypatch):
+    monkeypatch.setattr(gemini_client, 'GEMINI_FAKE_ERROR_RATE', 1.0)
+    monkeypatch.setattr(gemini_client, 'GEMINI_MAX_RETRIES', 0)
+    client = make_client(AsyncGeminiClient, max_concurrency=1, max_queue=0)
+
+    async def run():
+        with pytest.raises(GeminiError):
+            await client.send_message('search', [], 'hello')
+        assert in_flight(client) == (0, {'search': 0})
+        return await client.send_message('search', [], 'hello again')
+
+    with pytest.raises(GeminiError):
+        asyncio.run(run()) # The second call fails too, but only after getting the slot back
+    assert client.stats()['endpoints']['search']['rejected'] == 0
+    assert in_flight(client) == (0, {'search': 0})
+
+def test_async_slot_is_released_on_cancellation(monkeypatch):
+    monkeypatch.setattr(gemini_client, 'GEMINI_FAKE_LATENCY_MS', 1000)
+    client = make_client(AsyncGeminiClient, max_concurrency=1, max_queue=0)
+
+    async def run():
+        task = asyncio.ensure_future(client.generate_content('search-image', 'describe'))
+        await asyncio.sleep(0.01)
+        assert in_flight(client)[0] == 1
+        task.cancel() # What a client disconnect does to the request's task
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(run())
+    assert in_flight(client) == (0, {'search-image': 0})
+
+def test_async_queued_caller_cancelled_while_waiting(monkeypatch):
+    client = make_client(AsyncGeminiClient, max_concurrency=1, max_queue=1)
+    monkeypatch.setattr(gemini_client, 'GEMINI_QUEUE_TIMEOUT_SECONDS', 5)
+
+    async def run():
+        stream = await client.stream_message('search', [], 'hello')
+        waiter = asyncio.ensure_future(client.send_message('search', [], 'hello'))
+        await asyncio.sleep(0.01)
+        assert client.stats()['global']['waiting'] == 0 # Queued on the endpoint limiter
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        stream.close()
+        assert in_flight(client) == (0, {'search': 0})
+        await client.send_message('search', [], 'hello') # The limit is usable again
+
+    asyncio.run(run())
+
+def test_async_stream_closed_without_iterating_releases_slot():
+    client = make_client(AsyncGeminiClient, max_concurrency=1, max_queue=0)
+
+    async def run():
+        stream = await client.stream_message('search', [], 'hello')
+        assert in_flight(client)[0] == 1
+        stream.close() # e.g. the client disconnected before the first chunk
+        assert in_flight(client) == (0, {'search': 0})
+
+    asyncio.run(run())
@@ -0,0 +1,68 @@
+import os
+import threading
+
+import pytest
+
+from jobs import QUEUED, RUNNING, SUCCEEDED, JobQueue
+
+@pytest.fixture
+def queue(tmp_path):
+    return JobQueue(db_path=str(tmp_path / 'jobs.db'), job_dir=str(tmp_path / 'jobs'), workers=1)
+
+def blocking_job(started, release):
+    def run(job):
+        started.set()
+        release.wait(5)
+        with open(os.path.join(job.dir, 'output.txt'), 'w') as f:
+            f.write('done')
+        return {'ok': True}
+    return run
+
+def wait_for_status(queue, job_id, status):
+    for _ in range(500):
+        if queue.get(job_id)['status'] == status:
+            return
+        threading.Event().wait(0.01)
+    raise AssertionError(f"job never reached {status}")
+
+def test_running_jobs_are_not_deleted(queue):
+    started, release = threading.Event(), threading.Event()
+    job_id = queue.submit('test', blocking_job(started, release))
+    assert started.wait(5)
+
+    assert queue.delete(job_id) is False
+    assert queue.get(job_id)['status'] == RUNNING
+
+    release.set()
+    wait_for_status(queue, job_id, SUCCEEDED)
+    assert os.path.exists(os.path.join(queue.job_dir, job_id, 'output.txt'))
+    assert queue.delete(job_id) is True
+    assert queue.get(job_id) is None
+    assert not os.path.exists(os.path.join(queue.job_dir, job_id))
+
+def test_jobs_running_in_another_process_are_not_deleted(queue):
+    started, release = threading.Event(), threading.Event()
+    job_id = queue.submit('test', blocking_job(started, release))
+    assert started.wait(5)
+    # Another worker process has no future for the job, only its row
+    future = queue._futures.pop(job_id)
+
+    assert queue.delete(job_id) is False
+    assert queue.get(job_id)['status'] == RUNNING
+
+    release.set()
+    future.result(5)
+    assert queue.get(job_id)['status'] == SUCCEEDED
+
+def test_queued_jobs_are_cancelled(queue):
+    started, release = threading.Event(), threading.Event()
+    first = queue.submit('test', blocking_job(started, release))
+    assert started.wait(5)
+    second = queue.submit('test', lambda job: {'ran': True})
+    assert queue.get(second)['status'] == QUEUED
+
+    assert queue.delete(second) is True
+    assert queue.get(second) is None
+    release.set()
+    wait_for_status(queue, first, SUCCEEDED)
+    assert queue._pending == 0
@@ -0,0 +1,20 @@
+import pytest
+
+from pdf_extract import parse_page_range
+
+def test_page_range_selects_pages():
+    assert parse_page_range('', 5) == [0, 1, 2, 3, 4]
+    assert parse_page_range('1-2, 4', 5) == [0, 1, 3]
+    assert parse_page_range('4-', 5) == [3, 4]
+    assert parse_page_range('-2', 5) == [0, 1]
+
+@pytest.mark.parametrize('spec', ['a-b', '1,x', '2.5', '1-3-5'])
+def test_malformed_page_range_names_the_bad_part(spec):
+    with pytest.raises(ValueError) as error:
+        parse_page_range(spec, 10)
+    assert str(error.value).startswith("Invalid page range")
+    assert 'invalid literal' not in str(error.value)
+
+def test_out_of_range_pages_are_rejected():
+    with pytest.raises(ValueError, match="for a document with 2 pages"):
+        parse_page_range('3', 2)
@@ -0,0 +1,47 @@
+import json
+
+import pytest
+
+import main
+
+@pytest.fixture
+def client():
+    return main.create_app().test_client()
+
+def stream_frames(response):
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+@pytest.mark.parametrize('url', ['/search', '/search/stream'])
+@pytest.mark.parametrize('body, message', [
+    ({'history': 'not a list'}, "'history' must be a list"),
+    ({'history': [1, 2]}, "'history' must be a list"),
+    ({'session_id': 123}, "'session_id' must be a string"),
+])
+def test_malformed_history_or_session_id_is_a_400(client, url, body, message):
+    response = client.post(url, json=dict(body, query='hello'))
+    assert response.status_code == 400
+    assert message in response.get_json()['error']
+
+@pytest.mark.parametrize('url', ['/search', '/search/stream'])
+def test_session_ids_not_issued_by_the_server_are_rejected(client, url):
+    response = client.post(url, json={'query': 'hello', 'session_id': 'my-own-id'})
+    assert response.status_code == 404
+    assert main.session_store.get('my-own-id') is None
+
+def test_new_session_gets_a_server_minted_id(client):
+    earlier = [{'role': 'user', 'parts': 'Hi'}, {'role': 'model', 'parts': 'Hello!'}]
+    first = client.post('/search', json={'query': 'First question', 'new_session': True, 'history': earlier})
+    assert first.status_code == 200
+    session_id = first.get_json()['session_id']
+    assert len(session_id) >= 32
+
+    second = client.post('/search/stream', json={'query': 'Second question', 'session_id': session_id})
+    assert second.status_code == 200
+    assert stream_frames(second)[-1]['session_id'] == session_id
+
+    history = main.session_store.get(session_id)
+    assert [turn['parts'] for turn in history if turn['role'] == 'user'] == ['Hi', 'First question', 'Second question']
+
+def test_each_new_session_gets_its_own_id(client):
+    ids = {client.post('/search', json={'query': 'hello', 'new_session': True}).get_json()['session_id'] for _ in range(3)}
+    assert len(ids) == 3
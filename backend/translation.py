@@ -0,0 +1,224 @@
+import os
+import re
+import time
+import hashlib
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from metrics import upstream_timer
+
+# --- Batched translation with a persistent translation memory ---
+# Strings we have translated before are answered from a local SQLite table keyed by
+# (source text, source language, target language); everything else is grouped into
+# as few Translate API calls as the per-request limits allow.
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__)) # Relative paths below are resolved from here, not the working directory
+
+TRANSLATION_MEMORY_PATH = os.path.join(BACKEND_DIR, os.getenv('TRANSLATION_MEMORY_PATH', 'translation_memory.db'))
+# Cloud Translation v2 accepts at most 128 segments per request; 30k characters is the recommended ceiling
+TRANSLATE_BATCH_MAX_SEGMENTS = int(os.getenv('TRANSLATE_BATCH_MAX_SEGMENTS', '128'))
+TRANSLATE_BATCH_MAX_CHARS = int(os.getenv('TRANSLATE_BATCH_MAX_CHARS', '30000'))
+# Long texts are split into chunks of at most this many characters and translated concurrently
+TRANSLATE_CHUNK_MAX_CHARS = int(os.getenv('TRANSLATE_CHUNK_MAX_CHARS', '5000'))
+TRANSLATE_LONG_WORKERS = int(os.getenv('TRANSLATE_LONG_WORKERS', '4'))
+
+AUTO_DETECT = 'auto' # Stored as the source language when the caller lets the API detect it
+
+def _text_hash(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+class TranslationMemory:
+    def __init__(self, db_path=TRANSLATION_MEMORY_PATH):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS translation_memory ("
+                " text_hash TEXT NOT NULL,"
+                " source_language TEXT NOT NULL,"
+                " target_language TEXT NOT NULL,"
+                " translated_text TEXT NOT NULL,"
+                " detected_source_language TEXT,"
+                " created_at REAL NOT NULL,"
+                " PRIMARY KEY (text_hash, source_language, target_language))"
+            )
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, texts, source_language, target_language):
+        """Returns {text: {'translatedText': ..., 'detectedSourceLanguage': ...}} for known texts."""
+        source_language = source_language or AUTO_DETECT
+        hashes = {_text_hash(text): text for text in texts}
+        found = {}
+        hash_list = list(hashes)
+        with self._lock:
+            # Stay well under SQLite's bound-parameter limit
+            for start in range(0, len(hash_list), 500):
+                chunk = hash_list[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    "SELECT text_hash, translated_text, detected_source_language FROM translation_memory"
+                    f" WHERE source_language = ? AND target_language = ? AND text_hash IN ({placeholders})",
+                    [source_language, target_language] + chunk
+                ).fetchall()
+                for text_hash, translated_text, detected in rows:
+                    found[hashes[text_hash]] = {'translatedText': translated_text, 'detectedSourceLanguage': detected}
+            self.hits += len(found)
+            self.misses += len(hashes) - len(found)
+        return found
+
+    def put_many(self, translations, source_language, target_language):
+        """translations: {text: {'translatedText': ..., 'detectedSourceLanguage': ...}}"""
+        source_language = source_language or AUTO_DETECT
+        now = time.time()
+        rows = [
+            (_text_hash(text), source_language, target_language, result['translatedText'], result.get('detectedSourceLanguage'), now)
+            for text, result in translations.items()
+        ]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO translation_memory"
+                " (text_hash, source_language, target_language, translated_text, detected_source_language, created_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                rows
+            )
+
+    def stats(self):
+        with self._lock:
+            size = self._conn.execute("SELECT COUNT(*) FROM translation_memory").fetchone()[0]
+        return {'hits': self.hits, 'misses': self.misses, 'size': size}
+
+def group_for_api(texts, max_segments=TRANSLATE_BATCH_MAX_SEGMENTS, max_chars=TRANSLATE_BATCH_MAX_CHARS):
+    """Packs texts into request-sized groups, respecting both the segment and character limits."""
+    groups = []
+    current = []
+    current_chars = 0
+    for text in texts:
+        if current and (len(current) >= max_segments or current_chars + len(text) > max_chars):
+            groups.append(current)
+            current = []
+            current_chars = 0
+        current.append(text)
+        current_chars += len(text)
+    if current:
+        groups.append(current)
+    return groups
+
+def translate_texts(client, texts, target_language, source_language=None, memory=None):
+    """Translates a list of strings, returning results in input order.
+
+    Each result is {'translatedText': ..., 'detectedSourceLanguage': ...}. Duplicates and
+    strings already in the translation memory never reach the API. Strings too long for
+    one API call are split and translated like /translate/long.
+    """
+    unique_texts = list(dict.fromkeys(texts))
+    results = memory.get_many(unique_texts, source_language, target_language) if memory else {}
+    pending = [text for text in unique_texts if text not in results]
+
+    max_chars = min(TRANSLATE_CHUNK_MAX_CHARS, TRANSLATE_BATCH_MAX_CHARS)
+    for text in [text for text in pending if len(text) > max_chars]:
+        # Its chunks go through the memory individually
+        result = translate_long(client, text, target_language, source_language=source_language, memory=memory, max_chars=max_chars)
+        results[text] = {'translatedText': result['translatedText'], 'detectedSourceLanguage': result['detectedSourceLanguage']}
+    pending = [text for text in pending if len(text) <= max_chars]
+
+    for group in group_for_api(pending):
+        with upstream_timer('translate', 'translate'):
+            api_results = client.translate(group, target_language=target_language, source_language=source_language)
+        translated = {}
+        for text, api_result in zip(group, api_results):
+            translated[text] = {
+                'translatedText': api_result['translatedText'],
+                'detectedSourceLanguage': api_result.get('detectedSourceLanguage', source_language),
+            }
+        results.update(translated)
+        if memory:
+            memory.put_many(translated, source_language, target_language)
+
+    return [results[text] for text in texts]
+
+# --- Long-text translation ---
+# Preferred split points, coarsest first: paragraphs, then sentences, then any whitespace.
+# The capture group keeps the separator so the original layout can be put back together.
+_SPLIT_PATTERNS = [
+    re.compile(r'(\n\s*\n)'),
+    re.compile(r'(?<=[.!?\u0964])(\s+)'), # \u0964 is the Devanagari danda
+    re.compile(r'(\s+)'),
+]
+
+def split_text(text, max_chars=TRANSLATE_CHUNK_MAX_CHARS, level=0):
+    """Splits text into [(chunk, separator), ...] with every chunk <= max_chars.
+
+    "".join(chunk + separator) gives back the original text.
+    """
+    if len(text) <= max_chars:
+        return [(text, '')]
+    if level >= len(_SPLIT_PATTERNS):
+        # No natural boundary left (e.g. one enormous word): hard split
+        return [(text[i:i + max_chars], '') for i in range(0, len(text), max_chars)]
+
+    parts = _SPLIT_PATTERNS[level].split(text)
+    units = [(parts[i], parts[i + 1] if i + 1 < len(parts) else '') for i in range(0, len(parts), 2)]
+
+    chunks = []
+    current, current_sep = None, ''
+    for piece, sep in units:
+        if len(piece) > max_chars:
+            if current is not None:
+                chunks.append((current, current_sep))
+                current = None
+            sub_chunks = split_text(piece, max_chars, level + 1)
+            last_chunk, last_sep = sub_chunks[-1]
+            sub_chunks[-1] = (last_chunk, last_sep + sep)
+            chunks.extend(sub_chunks)
+        elif current is None:
+            current, current_sep = piece, sep
+        elif len(current) + len(current_sep) + len(piece) <= max_chars:
+            current, current_sep = current + current_sep + piece, sep
+        else:
+            chunks.append((current, current_sep))
+            current, current_sep = piece, sep
+    if current is not None:
+        chunks.append((current, current_sep))
+    return chunks
+
+def iter_translate_long(client, text, target_language, source_language=None, memory=None,
+                        max_chars=TRANSLATE_CHUNK_MAX_CHARS, max_workers=TRANSLATE_LONG_WORKERS):
+    """Translates text chunk by chunk on a bounded thread pool.
+
+    Yields (index, total, chunk_result) as chunks finish (not necessarily in order), where
+    chunk_result is {'translatedText', 'detectedSourceLanguage', 'separator'}.
+    """
+    chunks = split_text(text, max_chars)
+    total = len(chunks)
+
+    def translate_chunk(chunk):
+        if not chunk.strip():
+            # Nothing to translate; keep the whitespace as-is
+            return {'translatedText': chunk, 'detectedSourceLanguage': source_language}
+        return translate_texts(client, [chunk], target_language, source_language=source_language, memory=memory)[0]
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, total))) as executor:
+        futures = {executor.submit(translate_chunk, chunk): (index, separator) for index, (chunk, separator) in enumerate(chunks)}
+        try:
+            for future in as_completed(futures):
+                index, separator = futures[future]
+                result = dict(future.result(), separator=separator)
+                yield index, total, result
+        finally:
+            # Client went away or a chunk failed: don't start the remaining chunks
+            for future in futures:
+                future.cancel()
+
+def translate_long(client, text, target_language, source_language=None, memory=None,
+                   max_chars=TRANSLATE_CHUNK_MAX_CHARS, max_workers=TRANSLATE_LONG_WORKERS):
+    """Translates arbitrarily long text and reassembles it in the original order."""
+    results = {}
+    total = 0
+    for index, total, result in iter_translate_long(client, text, target_language, source_language, memory, max_chars, max_workers):
+        results[index] = result
+    translated = "".join(results[i]['translatedText'] + results[i]['separator'] for i in range(total))
+    detected = next((results[i]['detectedSourceLanguage'] for i in range(total) if results[i]['detectedSourceLanguage']), source_language)
+    return {'translatedText': translated, 'detectedSourceLanguage': detected, 'chunks': total}
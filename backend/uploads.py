@@ -0,0 +1,115 @@
+import os
+import json
+import tempfile
+from flask import Request, request, jsonify
+from werkzeug.exceptions import RequestEntityTooLarge
+
+# --- Upload size limits and spooling ---
+# Every request body is capped: MAX_CONTENT_LENGTH for JSON endpoints, and a per-endpoint
+# limit for the file uploads below. A declared Content-Length over the limit is rejected
+# with a 413 before any of the body is read; chunked bodies are cut off once they pass it.
+# Uploaded files are kept in memory only up to UPLOAD_SPOOL_BYTES and go to a temp file
+# after that, so a worker's memory doesn't grow with the size of what clients send.
+
+MB = 1024 * 1024
+
+MAX_CONTENT_LENGTH = int(os.getenv('MAX_CONTENT_LENGTH', str(16 * MB)))
+UPLOAD_SPOOL_BYTES = int(os.getenv('UPLOAD_SPOOL_BYTES', str(1 * MB)))
+UPLOAD_TMP_DIR = os.getenv('UPLOAD_TMP_DIR') or None # Defaults to the system temp directory
+
+# Route -> maximum request body size in bytes
+UPLOAD_LIMITS = {
+    '/upload-doc': int(os.getenv('UPLOAD_DOC_MAX_BYTES', str(100 * MB))),
+    '/search-image': int(os.getenv('SEARCH_IMAGE_MAX_BYTES', str(20 * MB))),
+    '/process-image': int(os.getenv('PROCESS_IMAGE_MAX_BYTES', str(50 * MB))),
+    '/process-image/batch': int(os.getenv('PROCESS_IMAGE_BATCH_MAX_BYTES', str(200 * MB))),
+    '/images-to-pdf': int(os.getenv('IMAGES_TO_PDF_MAX_BYTES', str(200 * MB))),
+}
+
+def limit_for(path):
+    return UPLOAD_LIMITS.get(path, MAX_CONTENT_LENGTH)
+
+def too_large_message(limit):
+    return f"Request body too large (limit {limit / MB:g} MB)"
+
+class UploadRequest(Request):
+    """Flask request class that spools uploaded files to disk past UPLOAD_SPOOL_BYTES."""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_BYTES, dir=UPLOAD_TMP_DIR)
+
+def enforce_upload_limit():
+    # before_request hook: applies the route's limit and parses multipart bodies up front,
+    # so an oversized upload is a clean 413 instead of an error inside the view
+    limit = limit_for(request.url_rule.rule if request.url_rule else request.path)
+    request.max_content_length = limit
+    if request.content_length is not None and request.content_length > limit:
+        return too_large_response(limit)
+    if request.mimetype == 'multipart/form-data':
+        try:
+            request.files # Parses the form (spooling files as it goes)
+        except RequestEntityTooLarge:
+            return too_large_response(limit)
+    elif request.content_length is None and 'chunked' in request.headers.get('Transfer-Encoding', '').lower():
+        # Werkzeug stops reading a chunked body at the limit without an error, which would
+        # hand the view a truncated body; read it here (it is small) so overflow is a 413
+        if len(request.get_data(cache=True)) >= limit:
+            return too_large_response(limit)
+    return None
+
+def too_large_response(limit=None):
+    response = jsonify({'error': too_large_message(limit or request.max_content_length or MAX_CONTENT_LENGTH)})
+    # The rest of the body is never read, so don't try to reuse the connection
+    response.headers['Connection'] = 'close'
+    return response, 413
+
+class ASGIUploadLimit:
+    """The same limits for routes served natively by asgi.py (the mounted Flask app checks its own)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        limit = limit_for(scope['path'])
+        content_length = dict(scope['headers']).get(b'content-length')
+        if content_length is not None and content_length.isdigit() and int(content_length) > limit:
+            await self._reject(send, limit)
+            return
+
+        received = 0
+        response_started = False
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message['type'] == 'http.request':
+                received += len(message.get('body', b''))
+                if received > limit:
+                    raise RequestEntityTooLarge(too_large_message(limit))
+            return message
+
+        async def tracking_send(message):
+            nonlocal response_started
+            if message['type'] == 'http.response.start':
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, tracking_send)
+        except RequestEntityTooLarge:
+            if response_started:
+                raise
+            await self._reject(send, limit)
+
+    async def _reject(self, send, limit):
+        body = json.dumps({'error': too_large_message(limit)}).encode('utf-8')
+        await send({
+            'type': 'http.response.start',
+            'status': 413,
+            'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode()), (b'connection', b'close')],
+        })
+        await send({'type': 'http.response.body', 'body': body})
@@ -0,0 +1,244 @@
+import os
+import asyncio
+import threading
+
+from metrics import upstream_timer
+from response_cache import TTLCache
+
+# --- AccuWeather client for /get-weather ---
+# One pooled requests.Session, a long-lived city -> location key cache, a
+# short-lived current conditions cache, and request coalescing so concurrent
+# lookups for the same city share a single upstream call. AsyncWeatherClient does
+# the same over httpx for asgi.py.
+
+ACCUWEATHER_BASE_URL = os.getenv('ACCUWEATHER_BASE_URL', 'http://dataservice.accuweather.com')
+WEATHER_TIMEOUT_SECONDS = float(os.getenv('WEATHER_TIMEOUT_SECONDS', '5'))
+WEATHER_POOL_SIZE = int(os.getenv('WEATHER_POOL_SIZE', '20'))
+WEATHER_LOCATION_TTL_SECONDS = int(os.getenv('WEATHER_LOCATION_TTL_SECONDS', str(7 * 24 * 60 * 60)))
+WEATHER_CONDITIONS_TTL_SECONDS = int(os.getenv('WEATHER_CONDITIONS_TTL_SECONDS', '600'))
+WEATHER_CACHE_MAX_ENTRIES = int(os.getenv('WEATHER_CACHE_MAX_ENTRIES', '5000'))
+
+class WeatherError(Exception):
+    def __init__(self, message, status_code):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+class _InFlightCall:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    """Collapses concurrent calls with the same key into one execution of fn."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            is_leader = call is None
+            if is_leader:
+                call = _InFlightCall()
+                self._calls[key] = call
+
+        if not is_leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+def _normalize_location(query):
+    return " ".join(query.split()).casefold()
+
+def _request_error(status_code, api_name):
+    error_msg = 'Invalid AccuWeather API key or unauthorized access' if status_code == 401 else f'Failed to connect to AccuWeather {api_name} API'
+    return WeatherError(error_msg, status_code)
+
+def _parse_location(location_data, location_query):
+    if not location_data:
+        raise WeatherError(f'Location not found: {location_query}', 404)
+    try:
+        return (
+            location_data[0]['Key'],
+            f"{location_data[0]['LocalizedName']}, {location_data[0]['Country']['LocalizedName']}"
+        )
+    except (IndexError, KeyError, TypeError) as e:
+        print(f"Error parsing location data: {e}")
+        raise WeatherError('Unexpected response format from AccuWeather Locations API', 500)
+
+def _parse_conditions(conditions_data):
+    if not conditions_data:
+        raise WeatherError('No current conditions data available', 404)
+    conditions = conditions_data[0] if isinstance(conditions_data, list) else None
+    if not isinstance(conditions, dict):
+        print(f"Error parsing conditions data: {conditions_data!r:.200}")
+        raise WeatherError('Unexpected response format from AccuWeather Current Conditions API', 500)
+    return conditions
+
+def format_weather(location_name, conditions):
+    return {
+        'locationName': location_name,
+        'weatherText': conditions.get('WeatherText'),
+        'temperature': conditions.get('Temperature', {}).get('Metric', {}),
+        'realFeelTemperature': conditions.get('RealFeelTemperature', {}).get('Metric', {}),
+        'relativeHumidity': conditions.get('RelativeHumidity'),
+        'wind': conditions.get('Wind', {}).get('Speed', {}).get('Metric', {}),
+        'uvIndex': conditions.get('UVIndex'),
+        'uvIndexText': conditions.get('UVIndexText'),
+        # Add other fields as needed
+    }
+
+class WeatherClient:
+    def __init__(self, base_url=ACCUWEATHER_BASE_URL, timeout=WEATHER_TIMEOUT_SECONDS):
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self._request_error_type = requests.exceptions.RequestException
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=WEATHER_POOL_SIZE)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.locations = TTLCache(WEATHER_CACHE_MAX_ENTRIES, WEATHER_LOCATION_TTL_SECONDS)
+        self.conditions = TTLCache(WEATHER_CACHE_MAX_ENTRIES, WEATHER_CONDITIONS_TTL_SECONDS)
+        self._single_flight = SingleFlight()
+
+    def _get_json(self, path, params, api_name):
+        response = None
+        try:
+            with upstream_timer('accuweather', api_name):
+                response = self.session.get(f"{self.base_url}{path}", params=params, timeout=self.timeout)
+                response.raise_for_status()
+            return response.json()
+        except self._request_error_type as e:
+            print(f"Error calling AccuWeather {api_name} API: {e}")
+            raise _request_error(response.status_code if response is not None else 503, api_name)
+
+    def get_location(self, location_query, api_key):
+        """Returns (location_key, location_name) for a free-text city query."""
+        cache_key = _normalize_location(location_query)
+        cached = self.locations.get(cache_key)
+        if cached is not None:
+            return cached
+
+        def fetch():
+            location_data = self._get_json('/locations/v1/cities/search', {'apikey': api_key, 'q': location_query}, 'Locations')
+            location = _parse_location(location_data, location_query)
+            self.locations.set(cache_key, location)
+            return location
+
+        return self._single_flight.do(('location', cache_key), fetch)
+
+    def get_current_conditions(self, location_key, api_key):
+        cached = self.conditions.get(location_key)
+        if cached is not None:
+            return cached
+
+        def fetch():
+            conditions_data = self._get_json(f'/currentconditions/v1/{location_key}', {'apikey': api_key, 'details': 'true'}, 'Current Conditions')
+            conditions = _parse_conditions(conditions_data)
+            self.conditions.set(location_key, conditions)
+            return conditions
+
+        return self._single_flight.do(('conditions', location_key), fetch)
+
+    def get_weather(self, location_query, api_key):
+        location_key, location_name = self.get_location(location_query, api_key)
+        conditions = self.get_current_conditions(location_key, api_key)
+        return format_weather(location_name, conditions)
+
+    def stats(self):
+        return {'locations': self.locations.stats(), 'conditions': self.conditions.stats()}
+
+class AsyncSingleFlight:
+    """asyncio counterpart of SingleFlight: concurrent awaits of one key share a task."""
+
+    def __init__(self):
+        self._tasks = {}
+
+    async def do(self, key, coro_fn):
+        task = self._tasks.get(key)
+        if task is None:
+            task = asyncio.ensure_future(coro_fn())
+            self._tasks[key] = task
+            task.add_done_callback(lambda _: self._tasks.pop(key, None))
+        # shield: one cancelled caller must not cancel the lookup for everyone else
+        return await asyncio.shield(task)
+
+class AsyncWeatherClient:
+    """Non-blocking WeatherClient for asgi.py, with the same caching and coalescing."""
+
+    def __init__(self, base_url=ACCUWEATHER_BASE_URL, timeout=WEATHER_TIMEOUT_SECONDS):
+        import httpx # Only needed in ASGI mode
+
+        self.base_url = base_url.rstrip('/')
+        self._httpx = httpx
+        self.client = httpx.AsyncClient(timeout=timeout, limits=httpx.Limits(max_connections=WEATHER_POOL_SIZE))
+        self.locations = TTLCache(WEATHER_CACHE_MAX_ENTRIES, WEATHER_LOCATION_TTL_SECONDS)
+        self.conditions = TTLCache(WEATHER_CACHE_MAX_ENTRIES, WEATHER_CONDITIONS_TTL_SECONDS)
+        self._single_flight = AsyncSingleFlight()
+
+    async def _get_json(self, path, params, api_name):
+        response = None
+        try:
+            with upstream_timer('accuweather', api_name):
+                response = await self.client.get(f"{self.base_url}{path}", params=params)
+                response.raise_for_status()
+            return response.json()
+        except (self._httpx.HTTPError, ValueError) as e:
+            print(f"Error calling AccuWeather {api_name} API: {e}")
+            raise _request_error(response.status_code if response is not None else 503, api_name)
+
+    async def get_location(self, location_query, api_key):
+        cache_key = _normalize_location(location_query)
+        cached = self.locations.get(cache_key)
+        if cached is not None:
+            return cached
+
+        async def fetch():
+            location_data = await self._get_json('/locations/v1/cities/search', {'apikey': api_key, 'q': location_query}, 'Locations')
+            location = _parse_location(location_data, location_query)
+            self.locations.set(cache_key, location)
+            return location
+
+        return await self._single_flight.do(('location', cache_key), fetch)
+
+    async def get_current_conditions(self, location_key, api_key):
+        cached = self.conditions.get(location_key)
+        if cached is not None:
+            return cached
+
+        async def fetch():
+            conditions_data = await self._get_json(f'/currentconditions/v1/{location_key}', {'apikey': api_key, 'details': 'true'}, 'Current Conditions')
+            conditions = _parse_conditions(conditions_data)
+            self.conditions.set(location_key, conditions)
+            return conditions
+
+        return await self._single_flight.do(('conditions', location_key), fetch)
+
+    async def get_weather(self, location_query, api_key):
+        location_key, location_name = await self.get_location(location_query, api_key)
+        conditions = await self.get_current_conditions(location_key, api_key)
+        return format_weather(location_name, conditions)
+
+    async def aclose(self):
+        await self.client.aclose()
+
+    def stats(self):
+        return {'locations': self.locations.stats(), 'conditions': self.conditions.stats()}